@@ -22,10 +22,20 @@ class Settings(BaseSettings):
     reranker_model: str = Field(default="local", description="openai | local")
     reranker_api_key: str = Field(default="")
     reranker_local_model: str = Field(default="cross-encoder/ms-marco-MiniLM-L-6-v2")
+    reranker_max_length: int = Field(default=512, description="Cross-Encoder 最大序列长度 (token)")
+    reranker_batch_size: int = Field(default=32, description="重排序每批的 pair 数量")
+    reranker_openai_model: str = Field(default="gpt-3.5-turbo")
+    reranker_chunk_size: int = Field(default=8, description="OpenAI 重排序每次调用的文档数")
+    reranker_max_connections: int = Field(default=20, description="OpenAI 重排序连接池大小")
+    reranker_early_stop_margin: float = Field(
+        default=2.0,
+        description="级联重排序提前终止阈值 (Cross-Encoder 原始分数差)"
+    )
 
     # Chroma
     chroma_persist_dir: str = Field(default="./chroma_db")
     chroma_collection_prefix: str = Field(default="ziwei_")
+    chroma_missing_ttl_s: float = Field(default=30.0, description="不存在集合的负缓存有效期(秒)")
 
     # BM25
     bm25_k1: float = Field(default=1.5)
@@ -33,8 +43,55 @@ class Settings(BaseSettings):
 
     # Retrieval
     default_top_k: int = Field(default=10)
+    request_timeout_ms: int = Field(default=3000, description="检索延迟预算(ms)，0 表示不限时")
+    query_embedding_budget_ratio: float = Field(
+        default=0.5, description="查询向量化最多占用的剩余预算比例，超时只丢弃向量分支"
+    )
     hybrid_vector_weight: float = Field(default=0.6)
     hybrid_keyword_weight: float = Field(default=0.4)
+    fusion_mode: str = Field(default="rrf", description="rrf | minmax | zscore")
+    rrf_k: int = Field(default=60, description="RRF 平滑常数")
+    category_routing_enabled: bool = Field(default=True, description="未指定分类时预测相关分类")
+    category_route_max: int = Field(default=2, description="分类预路由最多选取的分类数")
+    category_route_confidence: float = Field(
+        default=0.7,
+        description="分类预路由累计置信度阈值，不足时检索全部分类"
+    )
+    category_route_budget_ratio: float = Field(
+        default=0.3,
+        description="分类预路由最多使用剩余预算的比例，超时则检索全部分类"
+    )
+
+    # Result cache
+    result_cache_size: int = Field(default=1024, description="检索结果 LRU 容量，0 表示关闭")
+    result_cache_db_path: str = Field(default="", description="检索结果 SQLite 共享层路径，空表示仅进程内")
+    result_cache_shared_size: int = Field(default=10000, description="SQLite 共享层最多保留的结果条数")
+    result_cache_ttl_s: float = Field(default=3600.0, description="SQLite 共享层结果的保留时间(秒)，0 表示不过期")
+    result_cache_version_ttl_s: float = Field(default=1.0, description="从 SQLite 共享层刷新索引版本号的间隔(秒)")
+    semantic_cache_enabled: bool = Field(default=True, description="启用语义回答缓存")
+    semantic_cache_threshold: float = Field(default=0.92, description="语义缓存命中的余弦相似度阈值")
+    semantic_cache_ttl_s: int = Field(default=3600, description="语义缓存条目有效期(秒)")
+    semantic_cache_max_entries: int = Field(default=2000, description="每个分区的最大缓存条目数")
+
+    # Indexing
+    index_batch_size: int = Field(default=64, description="索引时每批向量化/写入 Chroma 的文档数")
+    index_embedding_concurrency: int = Field(default=4, description="索引时并发的向量化请求数")
+    graph_drain_timeout_s: float = Field(default=30.0, description="关闭时等待后台图谱构建的最长时间(秒)")
+
+    # GraphRAG
+    graph_extraction_model: str = Field(default="gpt-3.5-turbo", description="图谱实体/关系抽取使用的模型")
+    graph_extraction_concurrency: int = Field(default=4, description="图谱构建时并发的 LLM 抽取调用数")
+    graph_extraction_rpm: int = Field(default=60, description="图谱抽取每分钟 LLM 调用上限，0 表示不限流")
+    graph_extraction_batch_chars: int = Field(default=1500, description="短文档合并抽取时每批的总字符上限")
+    graph_extraction_batch_size: int = Field(default=4, description="每次 LLM 抽取最多合并的文档数")
+    graph_local_hops: int = Field(default=2, description="局部检索的邻居扩展跳数")
+    graph_neighbor_limit: int = Field(default=20, description="局部检索每个实体最多扩展的邻居数")
+    graph_hop_decay: float = Field(default=0.5, description="局部检索每多一跳实体权重的衰减系数")
+    graph_entity_seed_k: int = Field(default=3, description="查询实体不在图谱中时按实体向量匹配的种子数")
+    graph_entity_seed_threshold: float = Field(default=0.75, description="实体向量匹配种子的最低余弦相似度")
+    graph_community_min_size: int = Field(default=3, description="社区发现保留的最小社区规模")
+    graph_global_communities: int = Field(default=3, description="全局检索每个命理类型匹配的社区数")
+    graph_hot_doc_limit: int = Field(default=50, description="热点实体物化表每个实体保留的关联文档数")
 
     # Router
     complex_query_length_threshold: int = Field(default=50)
@@ -45,6 +102,7 @@ class Settings(BaseSettings):
     shared_concepts: str = Field(default="五行,天干,地支,用神,喜忌,大运,流年")
 
     # Server
+    warmup_on_startup: bool = Field(default=True, description="启动时预热检索服务")
     host: str = Field(default="0.0.0.0")
     port: int = Field(default=8001)
     debug: bool = Field(default=False)
@@ -102,20 +160,95 @@ RETRIEVAL_STRATEGIES = {
         "description": "向量混合检索",
         "use_reranker": True,
         "top_k": 10,
+        # 级联重排序: 进入 Cross-Encoder 的候选数预算
+        "rerank_min_candidates": 20,
+        "rerank_max_candidates": 60,
+        "rerank_latency_ms": 150,
     },
     "graph_local": {
         "description": "GraphRAG 局部检索",
         "use_community": False,
         "top_k": 10,
+        "rerank_min_candidates": 20,
+        "rerank_max_candidates": 40,
+        "rerank_latency_ms": 100,
     },
     "graph_global": {
         "description": "GraphRAG 全局检索",
         "use_community": True,
         "top_k": 5,
+        "rerank_min_candidates": 10,
+        "rerank_max_candidates": 20,
+        "rerank_latency_ms": 80,
     },
     "cross_type": {
         "description": "跨类型检索",
         "use_shared": True,
         "top_k": 5,
+        "rerank_min_candidates": 10,
+        "rerank_max_candidates": 30,
+        "rerank_latency_ms": 100,
     },
 }
+
+# 实体类型定义 (GraphRAG 规则抽取)
+ENTITY_TYPES = {
+    # 紫微斗数
+    "星曜": ["紫微", "天机", "太阳", "武曲", "天同", "廉贞", "天府", "太阴", "贪狼", "巨门", "天相", "天梁", "七杀", "破军"],
+    "宫位": ["命宫", "兄弟宫", "夫妻宫", "子女宫", "财帛宫", "疾厄宫", "迁移宫", "仆役宫", "官禄宫", "田宅宫", "福德宫", "父母宫"],
+    "四化": ["化禄", "化权", "化科", "化忌"],
+    "格局": ["紫府同宫格", "杀破狼格", "火贪格", "铃贪格", "府相朝垣格", "日丽中天格"],
+
+    # 八字命理
+    "十神": ["正官", "七杀", "正财", "偏财", "正印", "偏印", "比肩", "劫财", "食神", "伤官"],
+    "用神": ["用神", "喜神", "忌神", "调候"],
+
+    # 通用
+    "五行": ["金", "木", "水", "火", "土"],
+    "天干": ["甲", "乙", "丙", "丁", "戊", "己", "庚", "辛", "壬", "癸"],
+    "地支": ["子", "丑", "寅", "卯", "辰", "巳", "午", "未", "申", "酉", "戌", "亥"],
+}
+
+# 热点实体类型 (14 主星、12 宫位、4 四化)，GraphRAG 预先物化其多跳邻域
+HOT_ENTITY_TYPES = ["星曜", "宫位", "四化"]
+
+# 命理实体关键词 (查询路由的实体分类)
+ENTITY_KEYWORDS = {
+    # 紫微斗数
+    "ziwei_stars": [
+        "紫微", "天机", "太阳", "武曲", "天同", "廉贞",
+        "天府", "太阴", "贪狼", "巨门", "天相", "天梁",
+        "七杀", "破军", "文昌", "文曲", "左辅", "右弼",
+        "天魁", "天钺", "禄存", "天马", "火星", "铃星"
+    ],
+    "ziwei_palaces": [
+        "命宫", "兄弟宫", "夫妻宫", "子女宫", "财帛宫",
+        "疾厄宫", "迁移宫", "仆役宫", "官禄宫", "田宅宫",
+        "福德宫", "父母宫"
+    ],
+    "ziwei_transformations": [
+        "化禄", "化权", "化科", "化忌"
+    ],
+    # 八字
+    "bazi_elements": [
+        "日主", "用神", "喜神", "忌神", "闲神",
+        "正官", "七杀", "正财", "偏财", "正印", "偏印",
+        "比肩", "劫财", "食神", "伤官"
+    ],
+    "bazi_concepts": [
+        "身强", "身弱", "从格", "化格", "调候", "通关"
+    ],
+    # 共通概念
+    "shared_concepts": [
+        "五行", "金", "木", "水", "火", "土",
+        "天干", "地支", "阴阳", "干支", "六合", "三合",
+        "大运", "流年", "太岁", "岁运"
+    ],
+    # 奇门
+    "qimen_elements": [
+        "九星", "八门", "八神", "值符", "值使",
+        "天蓬", "天任", "天冲", "天辅", "天英", "天芮",
+        "天柱", "天心", "开门", "休门", "生门", "伤门",
+        "杜门", "景门", "死门", "惊门"
+    ],
+}
@@ -3,6 +3,7 @@ FastAPI 主应用
 """
 import os
 import sys
+import asyncio
 from pathlib import Path
 from typing import List, Optional
 from contextlib import asynccontextmanager
@@ -20,7 +21,8 @@ from app import __version__
 from app.config import get_settings
 from app.models.schemas import (
     SearchRequest, RAGRequest, UploadRequest, AddTextRequest,
-    SearchResponse, RAGResponse, UploadResponse, StatsResponse, HealthResponse
+    SearchResponse, RAGResponse, UploadResponse, StatsResponse, HealthResponse,
+    ReadinessResponse
 )
 from app.models.enums import RetrievalStrategy
 from app.services.rag_engine import get_rag_engine
@@ -28,6 +30,11 @@ from app.services.unified_retriever import get_unified_retriever
 from app.services.chroma_service import get_chroma_service
 from app.services.hybrid_retriever import get_hybrid_retriever
 from app.services.knowledge_service import KnowledgeService
+from app.services.reranker_service import get_reranker_service
+from app.services.warmup import warm_up_services, get_warmup_state
+from app.services.deadline import Deadline
+from app.services.result_cache import get_result_cache
+from app.services.semantic_cache import get_semantic_cache
 
 # 初始化数据目录
 from app.data import init_data_directories
@@ -44,10 +51,21 @@ async def lifespan(app: FastAPI):
     print(f"Reranker model: {settings.reranker_model}")
     print(f"Chroma persist dir: {settings.chroma_persist_dir}")
 
+    # 后台预热: 存活检查立即可用，预热完成后才报告就绪
+    warmup_task = None
+    if settings.warmup_on_startup:
+        warmup_task = asyncio.create_task(warm_up_services())
+    else:
+        get_warmup_state().ready = True
+
     yield
 
     # 关闭时
     print("Shutting down...")
+    if warmup_task and not warmup_task.done():
+        warmup_task.cancel()
+    await get_hybrid_retriever().drain_graph_tasks(timeout=settings.graph_drain_timeout_s)
+    await get_reranker_service().close()
 
 
 # 创建 FastAPI 应用
@@ -72,7 +90,7 @@ app.add_middleware(
 
 @app.get("/health", response_model=HealthResponse)
 async def health_check():
-    """健康检查"""
+    """健康检查 (存活状态，不代表已完成预热)"""
     settings = get_settings()
 
     # 检查 Chroma 连接
@@ -91,6 +109,17 @@ async def health_check():
     )
 
 
+@app.get("/ready", response_model=ReadinessResponse)
+async def readiness_check():
+    """就绪检查 (预热完成前返回 503)"""
+    response = ReadinessResponse(**get_warmup_state().to_dict())
+
+    if not response.ready:
+        return JSONResponse(status_code=503, content=response.model_dump())
+
+    return response
+
+
 @app.post("/api/rag/search", response_model=SearchResponse)
 async def search_knowledge(request: SearchRequest):
     """知识库检索"""
@@ -98,13 +127,16 @@ async def search_knowledge(request: SearchRequest):
     start = time.time()
 
     retriever = get_unified_retriever()
+    deadline = Deadline.from_timeout(request.timeout_ms)
 
     results = await retriever.search(
         query=request.query,
         strategy=request.strategy,
         destiny_types=request.destiny_types,
         categories=request.categories,
-        top_k=request.top_k
+        top_k=request.top_k,
+        fusion=request.fusion,
+        deadline=deadline
     )
 
     query_time_ms = int((time.time() - start) * 1000)
@@ -113,7 +145,9 @@ async def search_knowledge(request: SearchRequest):
         results=results,
         total=len(results),
         strategy=request.strategy.value if isinstance(request.strategy, RetrievalStrategy) else request.strategy,
-        query_time_ms=query_time_ms
+        query_time_ms=query_time_ms,
+        partial=deadline.partial,
+        dropped_sources=deadline.dropped_sources
     )
 
 
@@ -124,6 +158,22 @@ async def rag_query(request: RAGRequest):
     return await rag_engine.query(request)
 
 
+@app.get("/api/rag/cache/stats")
+async def rag_cache_stats():
+    """检索结果缓存与语义回答缓存统计"""
+    return {
+        "result_cache": get_result_cache().get_stats(),
+        "semantic_cache": get_semantic_cache().get_stats(),
+    }
+
+
+@app.get("/api/rag/graph/stats")
+async def rag_graph_stats():
+    """GraphRAG 图谱统计"""
+    graphrag = get_hybrid_retriever().graphrag
+    return await asyncio.to_thread(graphrag.get_stats)
+
+
 @app.get("/api/rag/chat")
 async def rag_chat(
     q: str = Query(..., description="问题"),
@@ -228,7 +278,7 @@ async def list_documents(
 async def delete_document(document_id: str):
     """删除文档"""
     service = KnowledgeService()
-    result = service.delete_document(document_id)
+    result = await service.delete_document(document_id)
     return {"status": "success", "deleted": result}
 
 
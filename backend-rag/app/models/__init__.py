@@ -4,6 +4,7 @@ from .enums import (
     DestinyType,
     KnowledgeLevel,
     RetrievalStrategy,
+    FusionMode,
     QueryType,
     ZiweiCategory,
     BaziCategory,
@@ -26,13 +27,17 @@ from .schemas import (
     UploadResponse,
     StatsResponse,
     HealthResponse,
+    ReadinessResponse,
 )
 
+from .candidate import Candidate, CandidateKey, to_search_results
+
 __all__ = [
     # Enums
     "DestinyType",
     "KnowledgeLevel",
     "RetrievalStrategy",
+    "FusionMode",
     "QueryType",
     "ZiweiCategory",
     "BaziCategory",
@@ -53,4 +58,9 @@ __all__ = [
     "UploadResponse",
     "StatsResponse",
     "HealthResponse",
+    "ReadinessResponse",
+    # Internal
+    "Candidate",
+    "CandidateKey",
+    "to_search_results",
 ]
@@ -0,0 +1,92 @@
+"""
+检索候选 - 内部轻量结构
+融合、合并、重排序阶段使用，只在 API 边界转换为 SearchResult
+"""
+from typing import Iterable, List, Optional, Tuple
+
+from .schemas import SearchResult
+
+
+# 候选键: (destiny_type, category, doc_id)
+CandidateKey = Tuple[str, str, str]
+
+
+class Candidate:
+    """检索候选"""
+
+    __slots__ = (
+        "destiny_type",
+        "category",
+        "id",
+        "score",
+        "source",
+        "content",
+        "title",
+        "level",
+        "distance",
+        "rerank_score",
+    )
+
+    def __init__(
+        self,
+        destiny_type: str,
+        category: str,
+        id: str,
+        score: float,
+        source: str = "vector",
+        content: str = "",
+        title: str = "",
+        level: str = "method",
+        distance: Optional[float] = None,
+    ):
+        self.destiny_type = destiny_type
+        self.category = category
+        self.id = id
+        self.score = score
+        self.source = source
+        self.content = content
+        self.title = title
+        self.level = level
+        self.distance = distance
+        self.rerank_score: Optional[float] = None
+
+    @property
+    def key(self) -> CandidateKey:
+        return (self.destiny_type, self.category, self.id)
+
+    def to_search_result(self) -> SearchResult:
+        """转换为 API 模型"""
+        return SearchResult(
+            id=self.id,
+            content=self.content,
+            score=self.score,
+            title=self.title,
+            destiny_type=self.destiny_type,
+            category=self.category,
+            level=self.level,
+            source=self.source,
+            distance=self.distance,
+        )
+
+    @classmethod
+    def from_search_result(cls, result: SearchResult) -> "Candidate":
+        """从 API 模型构建"""
+        return cls(
+            destiny_type=result.destiny_type,
+            category=result.category,
+            id=result.id,
+            score=result.score,
+            source=result.source,
+            content=result.content,
+            title=result.title,
+            level=result.level,
+            distance=result.distance,
+        )
+
+    def __repr__(self) -> str:
+        return f"Candidate({self.destiny_type}:{self.category}:{self.id}, score={self.score:.4f})"
+
+
+def to_search_results(candidates: Iterable[Candidate]) -> List[SearchResult]:
+    """批量转换为 API 模型"""
+    return [c.to_search_result() for c in candidates]
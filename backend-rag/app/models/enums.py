@@ -33,6 +33,13 @@ class RetrievalStrategy(str, Enum):
     CROSS_TYPE = "cross_type"         # 跨类型检索
 
 
+class FusionMode(str, Enum):
+    """检索结果融合方式"""
+    RRF = "rrf"                       # 倒数排名融合
+    MINMAX = "minmax"                 # Min-Max 归一化加权
+    ZSCORE = "zscore"                 # Z-Score 归一化加权
+
+
 class QueryType(str, Enum):
     """查询类型"""
     PALACE_INQUIRY = "palace_inquiry"     # 宫位查询
@@ -6,7 +6,7 @@ from datetime import datetime
 
 from pydantic import BaseModel, Field
 
-from .enums import DestinyType, KnowledgeLevel, RetrievalStrategy, QueryType
+from .enums import DestinyType, KnowledgeLevel, RetrievalStrategy, QueryType, FusionMode
 
 
 class KnowledgeEntry(BaseModel):
@@ -126,6 +126,15 @@ class SearchRequest(BaseModel):
         description="检索策略"
     )
     top_k: int = Field(default=10, ge=1, le=50, description="返回数量")
+    fusion: Optional[FusionMode] = Field(
+        default=None,
+        description="融合方式 (rrf | minmax | zscore)，默认使用服务配置"
+    )
+    timeout_ms: Optional[int] = Field(
+        default=None,
+        ge=0,
+        description="检索延迟预算(ms)，超时分支被丢弃；默认使用服务配置，0 表示不限时"
+    )
 
 
 class RAGRequest(BaseModel):
@@ -138,6 +147,15 @@ class RAGRequest(BaseModel):
         description="对话历史"
     )
     top_k: int = Field(default=10, ge=1, le=50, description="检索数量")
+    fusion: Optional[FusionMode] = Field(
+        default=None,
+        description="融合方式 (rrf | minmax | zscore)，默认使用服务配置"
+    )
+    timeout_ms: Optional[int] = Field(
+        default=None,
+        ge=0,
+        description="检索延迟预算(ms)，超时分支被丢弃；默认使用服务配置，0 表示不限时"
+    )
 
 
 class UploadRequest(BaseModel):
@@ -168,6 +186,11 @@ class SearchResponse(BaseModel):
     total: int = Field(..., description="总数")
     strategy: str = Field(..., description="使用的检索策略")
     query_time_ms: int = Field(..., description="查询耗时(ms)")
+    partial: bool = Field(default=False, description="是否因超时返回部分结果")
+    dropped_sources: List[str] = Field(
+        default_factory=list,
+        description="因超时被丢弃的检索分支 (vector | bm25 | graph | rerank)"
+    )
 
 
 class RAGResponse(BaseModel):
@@ -183,6 +206,12 @@ class RAGResponse(BaseModel):
         description="涉及实体"
     )
     query_time_ms: int = Field(..., description="查询耗时(ms)")
+    partial: bool = Field(default=False, description="是否因超时返回部分结果")
+    dropped_sources: List[str] = Field(
+        default_factory=list,
+        description="因超时被丢弃的检索分支 (vector | bm25 | graph | rerank)"
+    )
+    cached: bool = Field(default=False, description="是否命中语义缓存")
 
 
 class UploadResponse(BaseModel):
@@ -210,3 +239,13 @@ class HealthResponse(BaseModel):
     version: str = Field(..., description="版本号")
     chroma_connected: bool = Field(..., description="Chroma连接状态")
     embedding_model: str = Field(..., description="Embedding模型")
+
+
+class ReadinessResponse(BaseModel):
+    """就绪检查响应"""
+    ready: bool = Field(..., description="是否已完成预热")
+    stages: Dict[str, Dict[str, Any]] = Field(
+        default_factory=dict,
+        description="各预热阶段结果"
+    )
+    duration_ms: Optional[int] = Field(default=None, description="预热耗时(ms)")
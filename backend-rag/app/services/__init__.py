@@ -11,6 +11,7 @@ from .graphrag_retriever import get_graphrag_retriever, GraphRAGRetriever
 from .cross_type_retriever import get_cross_type_retriever, CrossTypeRetriever
 from .unified_retriever import get_unified_retriever, UnifiedRetriever
 from .rag_engine import get_rag_engine, RAGEngine
+from .warmup import warm_up_services, get_warmup_state
 
 __all__ = [
     # Services
@@ -36,4 +37,6 @@ __all__ = [
     "UnifiedRetriever",
     "get_rag_engine",
     "RAGEngine",
+    "warm_up_services",
+    "get_warmup_state",
 ]
@@ -3,7 +3,8 @@ BM25 关键词检索服务
 """
 import os
 import json
-from typing import List, Dict, Optional, Tuple
+import threading
+from typing import List, Dict, NamedTuple, Optional, Set, Tuple
 from loguru import logger
 
 import jieba
@@ -11,6 +12,17 @@ from rank_bm25 import BM25Okapi
 
 from ..config import get_settings
 from ..models.schemas import SearchResult
+from .result_cache import bump_index_version
+
+
+class _Index(NamedTuple):
+    """集合的缓存索引 (整体替换发布，读取方拿到的各部分始终一致)"""
+    documents: List[Dict]
+    bm25: BM25Okapi
+    # {doc_id: position}
+    positions: Dict[str, int]
+    # (文档数, {term: df})，供分类路由使用
+    term_stats: Tuple[int, Dict[str, int]]
 
 
 class BM25Service:
@@ -24,8 +36,12 @@ class BM25Service:
         # 确保目录存在
         os.makedirs(self.bm25_dir, exist_ok=True)
 
-        # 索引缓存 {collection_key: (corpus, bm25)}
-        self._indices: Dict[str, Tuple[List[str], BM25Okapi]] = {}
+        # 索引缓存 {collection_key: _Index}，文档、BM25、ID 位置和词项文档频率一次赋值
+        self._indices: Dict[str, _Index] = {}
+
+        # 每个集合的写锁，串行化 读取-合并-重建，避免并发写入互相覆盖
+        self._write_locks: Dict[str, threading.RLock] = {}
+        self._write_locks_guard = threading.Lock()
 
     def _get_index_path(self, destiny_type: str, category: str) -> str:
         """获取索引文件路径"""
@@ -38,11 +54,22 @@ class BM25Service:
         """获取集合键"""
         return f"{destiny_type}_{category}"
 
+    def _write_lock(self, destiny_type: str, category: str) -> threading.RLock:
+        """集合的写锁 (可重入: add/remove 持锁时调用 build_index)"""
+        collection_key = self._get_collection_key(destiny_type, category)
+        with self._write_locks_guard:
+            lock = self._write_locks.get(collection_key)
+            if lock is None:
+                lock = self._write_locks[collection_key] = threading.RLock()
+            return lock
+
     def build_index(
         self,
         destiny_type: str,
         category: str,
-        documents: List[Dict]
+        documents: List[Dict],
+        tokenized_corpus: Optional[List[List[str]]] = None,
+        invalidate_cache: bool = True
     ):
         """
         构建 BM25 索引
@@ -51,15 +78,18 @@ class BM25Service:
             destiny_type: 命理类型
             category: 子分类
             documents: 文档列表 (每项包含 id, content, title 等)
+            tokenized_corpus: 已分词的文档 (可选，缺省时在此分词)
+            invalidate_cache: 是否递增索引版本 (批量写入的调用方在全部写完后统一递增)
         """
         collection_key = self._get_collection_key(destiny_type, category)
 
         # 提取内容
         contents = [doc.get("content", "") for doc in documents]
-        ids = [doc.get("id", str(i)) for i in range(len(documents))]
+        ids = [doc.get("id", str(i)) for i, doc in enumerate(documents)]
 
         # 中文分词
-        tokenized_corpus = [self._tokenize(content) for content in contents]
+        if tokenized_corpus is None:
+            tokenized_corpus = [self._tokenize(content) for content in contents]
 
         # 构建 BM25 索引
         bm25 = BM25Okapi(
@@ -76,17 +106,95 @@ class BM25Service:
         }
 
         index_path = self._get_index_path(destiny_type, category)
-        with open(index_path, 'w', encoding='utf-8') as f:
-            json.dump(index_data, f, ensure_ascii=False)
+        with self._write_lock(destiny_type, category):
+            with open(index_path, 'w', encoding='utf-8') as f:
+                json.dump(index_data, f, ensure_ascii=False)
 
-        # 缓存
-        self._indices[collection_key] = (contents, bm25)
+            # 缓存
+            self._cache_index(collection_key, documents, ids, bm25)
+        if invalidate_cache:
+            bump_index_version()
 
         logger.info(
             f"Built BM25 index for {destiny_type}/{category} "
             f"({len(documents)} documents)"
         )
 
+    def add_documents(
+        self,
+        destiny_type: str,
+        category: str,
+        documents: List[Dict],
+        tokenized_corpus: Optional[List[List[str]]] = None,
+        invalidate_cache: bool = True
+    ):
+        """
+        增量添加文档: 与已有索引合并 (同 ID 覆盖) 后重建
+
+        已有文档复用缓存中的词频，不重新分词。invalidate_cache 同 build_index。
+        """
+        if tokenized_corpus is None:
+            tokenized_corpus = [self._tokenize(doc.get("content", "")) for doc in documents]
+
+        with self._write_lock(destiny_type, category):
+            index = self._get_index(destiny_type, category)
+            if index is None:
+                self.build_index(
+                    destiny_type, category, documents, tokenized_corpus, invalidate_cache
+                )
+                return
+
+            merged_docs, merged_tokens = self._retained_corpus(
+                index, {doc.get("id") for doc in documents}
+            )
+            merged_docs.extend(documents)
+            merged_tokens.extend(tokenized_corpus)
+
+            self.build_index(
+                destiny_type, category, merged_docs, merged_tokens, invalidate_cache
+            )
+
+    def remove_documents(self, destiny_type: str, category: str, doc_ids: List[str]) -> int:
+        """
+        删除文档后重建索引 (复用剩余文档的词频，不重新分词)
+
+        Returns:
+            被删除的文档数
+        """
+        with self._write_lock(destiny_type, category):
+            index = self._get_index(destiny_type, category)
+            if index is None:
+                return 0
+
+            retained_docs, retained_tokens = self._retained_corpus(index, set(doc_ids))
+            removed = len(index.documents) - len(retained_docs)
+            if not removed:
+                return 0
+
+            if retained_docs:
+                self.build_index(destiny_type, category, retained_docs, retained_tokens)
+            else:
+                self.delete_index(destiny_type, category)
+            return removed
+
+    @staticmethod
+    def _retained_corpus(
+        index: _Index,
+        excluded_ids: Set[str]
+    ) -> Tuple[List[Dict], List[List[str]]]:
+        """已有索引中除 excluded_ids 外的文档及其分词 (由缓存词频展开)"""
+        docs = []
+        tokens = []
+        for doc, freqs in zip(index.documents, index.bm25.doc_freqs):
+            if doc.get("id") in excluded_ids:
+                continue
+            docs.append(doc)
+            # BM25 只依赖词频和文档长度，按词频展开即可
+            tokens.append([
+                term for term, count in freqs.items() for _ in range(count)
+            ])
+        return docs, tokens
+
     def search(
         self,
         destiny_type: str,
@@ -106,21 +214,52 @@ class BM25Service:
         Returns:
             检索结果列表
         """
-        collection_key = self._get_collection_key(destiny_type, category)
+        hits = self.search_ids(destiny_type, category, query, n_results)
+        documents = self.get_documents(destiny_type, category, [doc_id for doc_id, _ in hits])
 
-        # 尝试从缓存加载
-        if collection_key not in self._indices:
-            self._load_index(destiny_type, category)
+        # 格式化结果
+        results = []
+        for doc_id, score in hits:
+            doc = documents.get(doc_id, {})
+            results.append(SearchResult(
+                id=doc_id,
+                content=doc.get("content", ""),
+                score=score,
+                title=doc.get("title", ""),
+                destiny_type=destiny_type,
+                category=category,
+                level=doc.get("level", "method"),
+                source="bm25"
+            ))
 
-        # 再次检查
-        if collection_key not in self._indices:
+        return results
+
+    def search_ids(
+        self,
+        destiny_type: str,
+        category: str,
+        query: str = "",
+        n_results: int = 10,
+        query_tokens: Optional[List[str]] = None
+    ) -> List[Tuple[str, float]]:
+        """
+        BM25 检索，只返回 (id, 分数)
+
+        Args:
+            query_tokens: 已分词的查询 (提供时忽略 query，避免重复分词)
+
+        Returns:
+            [(id, score)]，按分数降序，只包含分数大于 0 的文档
+        """
+        index = self._get_index(destiny_type, category)
+        if index is None:
             logger.warning(f"Index not found for {destiny_type}/{category}")
             return []
 
-        contents, bm25 = self._indices[collection_key]
+        documents, bm25 = index.documents, index.bm25
 
         # 分词查询
-        tokenized_query = self._tokenize(query)
+        tokenized_query = query_tokens if query_tokens is not None else self._tokenize(query)
 
         # 执行搜索
         scores = bm25.get_scores(tokenized_query)
@@ -132,25 +271,85 @@ class BM25Service:
             reverse=True
         )[:n_results]
 
-        # 格式化结果
-        results = []
-        documents = self._get_documents(destiny_type, category)
-
-        for idx in top_indices:
-            if scores[idx] > 0:  # 只返回有分数的结果
-                doc = documents[idx] if documents else {}
-                results.append(SearchResult(
-                    id=doc.get("id", str(idx)),
-                    content=doc.get("content", ""),
-                    score=float(scores[idx]),
-                    title=doc.get("title", ""),
-                    destiny_type=destiny_type,
-                    category=category,
-                    level=doc.get("level", "method"),
-                    source="bm25"
-                ))
+        return [
+            (documents[idx].get("id", str(idx)), float(scores[idx]))
+            for idx in top_indices
+            if scores[idx] > 0  # 只返回有分数的结果
+        ]
 
-        return results
+    def get_documents(
+        self,
+        destiny_type: str,
+        category: str,
+        ids: List[str]
+    ) -> Dict[str, Dict]:
+        """
+        按 ID 批量获取文档 (内存读取)
+
+        Returns:
+            {id: document}，不存在的 ID 不出现在结果中
+        """
+        index = self._get_index(destiny_type, category)
+        if index is None or not ids:
+            return {}
+
+        documents, positions = index.documents, index.positions
+
+        return {
+            doc_id: documents[positions[doc_id]]
+            for doc_id in ids
+            if doc_id in positions
+        }
+
+    def _get_index(
+        self,
+        destiny_type: str,
+        category: str
+    ) -> Optional[_Index]:
+        """获取缓存索引 (未缓存时从磁盘加载)"""
+        collection_key = self._get_collection_key(destiny_type, category)
+
+        # 尝试从缓存加载
+        if collection_key not in self._indices:
+            self._load_index(destiny_type, category)
+
+        return self._indices.get(collection_key)
+
+    def _cache_index(
+        self,
+        collection_key: str,
+        documents: List[Dict],
+        ids: List[str],
+        bm25: BM25Okapi
+    ):
+        """缓存索引、文档位置和词项文档频率 (构建完成后一次赋值发布)"""
+        documents = [
+            {**doc, "id": ids[i]}
+            for i, doc in enumerate(documents)
+        ]
+        positions = {doc_id: i for i, doc_id in enumerate(ids)}
+
+        doc_freq: Dict[str, int] = {}
+        for freqs in bm25.doc_freqs:
+            for term in freqs:
+                doc_freq[term] = doc_freq.get(term, 0) + 1
+
+        self._indices[collection_key] = _Index(
+            documents, bm25, positions, (len(documents), doc_freq)
+        )
+
+    def get_term_stats(
+        self,
+        destiny_type: str,
+        category: str
+    ) -> Optional[Tuple[int, Dict[str, int]]]:
+        """获取集合的 (文档数, {term: 文档频率})，索引不存在返回 None"""
+        index = self._get_index(destiny_type, category)
+        return index.term_stats if index is not None else None
+
+    def tokenize(self, text: str) -> List[str]:
+        """中文分词 (与索引一致)"""
+        return self._tokenize(text)
 
     def _tokenize(self, text: str) -> List[str]:
         """中文分词"""
@@ -169,6 +368,10 @@ class BM25Service:
                 index_data = json.load(f)
 
             contents = index_data.get("contents", [])
+            ids = index_data.get("ids", [str(i) for i in range(len(contents))])
+            documents = index_data.get("documents") or [
+                {"content": c} for c in contents
+            ]
             tokenized_corpus = [self._tokenize(c) for c in contents]
 
             bm25 = BM25Okapi(
@@ -177,39 +380,43 @@ class BM25Service:
                 b=self.settings.bm25_b
             )
 
-            self._indices[collection_key] = (contents, bm25)
+            self._cache_index(collection_key, documents, ids, bm25)
             logger.debug(f"Loaded BM25 index: {collection_key}")
 
         except Exception as e:
             logger.error(f"Error loading index: {e}")
 
-    def _get_documents(self, destiny_type: str, category: str) -> List[Dict]:
-        """获取文档数据"""
-        collection_key = self._get_collection_key(destiny_type, category)
-        index_path = self._get_index_path(destiny_type, category)
+    def warmup(self, collections: Dict[str, List[str]]) -> int:
+        """
+        预先加载磁盘上的 BM25 索引
 
-        if not os.path.exists(index_path):
-            return []
+        Args:
+            collections: {destiny_type: [category, ...]}
 
-        try:
-            with open(index_path, 'r', encoding='utf-8') as f:
-                index_data = json.load(f)
-            return index_data.get("documents", [])
-        except Exception as e:
-            logger.error(f"Error getting documents: {e}")
-            return []
+        Returns:
+            已加载的索引数
+        """
+        for destiny_type, categories in collections.items():
+            for category in categories:
+                if self._get_collection_key(destiny_type, category) not in self._indices:
+                    self._load_index(destiny_type, category)
+
+        return len(self._indices)
 
     def delete_index(self, destiny_type: str, category: str):
         """删除索引"""
         collection_key = self._get_collection_key(destiny_type, category)
         index_path = self._get_index_path(destiny_type, category)
 
-        if collection_key in self._indices:
-            del self._indices[collection_key]
+        with self._write_lock(destiny_type, category):
+            self._indices.pop(collection_key, None)
 
-        if os.path.exists(index_path):
+            if not os.path.exists(index_path):
+                return
             os.remove(index_path)
-            logger.info(f"Deleted BM25 index: {collection_key}")
+
+        bump_index_version()
+        logger.info(f"Deleted BM25 index: {collection_key}")
 
     def get_doc_count(self, destiny_type: str, category: str) -> int:
         """获取索引文档数"""
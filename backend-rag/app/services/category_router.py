@@ -0,0 +1,282 @@
+"""
+分类预路由
+未指定子分类时，根据查询词项在各分类中的文档频率和集合质心向量，
+预测 1-2 个相关分类，只在这些分类中检索；置信度不足时回退到全部分类。
+"""
+import json
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from loguru import logger
+
+from ..config import get_settings, DESTINY_TYPES
+from .bm25_service import get_bm25_service
+from .chroma_service import get_chroma_service
+
+
+class CategoryRouter:
+    """分类预路由"""
+
+    # 质心相似度 softmax 温度 (余弦相似度差异通常很小，需要放大)
+    CENTROID_TEMPERATURE = 0.05
+
+    def __init__(self, data_dir: str = None):
+        self.settings = get_settings()
+        self.bm25 = get_bm25_service()
+        self.chroma = get_chroma_service()
+
+        self.routing_dir = Path(data_dir or "./data") / "routing"
+        self.routing_dir.mkdir(parents=True, exist_ok=True)
+        self.centroid_file = self.routing_dir / "centroids.json"
+
+        # 质心缓存 {destiny_type: {category: 归一化向量}}
+        self._centroids: Dict[str, Dict[str, np.ndarray]] = {}
+        # 质心增量统计 {destiny_type: {category: (向量和, 向量数)}}
+        self._sums: Dict[str, Dict[str, Tuple[np.ndarray, int]]] = {}
+        self._lock = threading.Lock()
+        self._load_centroids()
+
+    def get_categories(self, destiny_type: str) -> List[str]:
+        """命理类型的全部分类"""
+        config = DESTINY_TYPES.get(destiny_type)
+        return list(config["collections"]) if config else ["general"]
+
+    def route(
+        self,
+        destiny_type: str,
+        query_tokens: List[str],
+        query_embedding: Optional[List[float]] = None
+    ) -> Optional[List[str]]:
+        """
+        预测查询相关的分类
+
+        Args:
+            destiny_type: 命理类型
+            query_tokens: 查询分词结果 (与 BM25 分词一致)
+            query_embedding: 查询向量 (可选，用于质心打分)
+
+        Returns:
+            分类列表 (按相关度降序)；无法可靠判断时返回 None，表示检索全部分类
+        """
+        categories = self.get_categories(destiny_type)
+        if len(categories) <= 1:
+            return None
+
+        scores = self._term_scores(destiny_type, categories, query_tokens)
+        if query_embedding is not None:
+            centroid_scores = self._centroid_scores(destiny_type, categories, query_embedding)
+            if centroid_scores is not None:
+                scores = (
+                    (scores + centroid_scores) / 2
+                    if scores is not None else centroid_scores
+                )
+
+        if scores is None:
+            return None
+
+        # 按分数从高到低选取，直到累计置信度达到阈值或达到数量上限
+        order = np.argsort(-scores)
+        selected = []
+        coverage = 0.0
+        for idx in order[:self.settings.category_route_max]:
+            selected.append(categories[idx])
+            coverage += float(scores[idx])
+            if coverage >= self.settings.category_route_confidence:
+                break
+
+        if coverage < self.settings.category_route_confidence:
+            logger.debug(
+                f"Category routing uncertain for {destiny_type} "
+                f"(coverage {coverage:.2f}), searching all categories"
+            )
+            return None
+
+        logger.debug(f"Category routing: {destiny_type} -> {selected} ({coverage:.2f})")
+        return selected
+
+    def _term_scores(
+        self,
+        destiny_type: str,
+        categories: List[str],
+        query_tokens: List[str]
+    ) -> Optional[np.ndarray]:
+        """
+        词项打分: 每个查询词按其在各分类中的文档占比分配到分类上，再对所有词取平均
+
+        没有任何查询词出现在语料中时返回 None。
+        """
+        stats = [self.bm25.get_term_stats(destiny_type, cat) for cat in categories]
+
+        totals = np.zeros(len(categories))
+        matched = 0
+        for token in set(query_tokens):
+            # 单字和标点区分度低
+            if len(token.strip()) < 2:
+                continue
+
+            ratios = np.array([
+                stat[1].get(token, 0) / stat[0] if stat and stat[0] else 0.0
+                for stat in stats
+            ])
+            total = ratios.sum()
+            if total <= 0:
+                continue
+
+            totals += ratios / total
+            matched += 1
+
+        if matched == 0:
+            return None
+        return totals / matched
+
+    def _centroid_scores(
+        self,
+        destiny_type: str,
+        categories: List[str],
+        query_embedding: List[float]
+    ) -> Optional[np.ndarray]:
+        """质心打分: 查询向量与各分类质心的余弦相似度做 softmax"""
+        centroids = self._centroids.get(destiny_type, {})
+        if not centroids:
+            return None
+
+        query = np.asarray(query_embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm == 0:
+            return None
+        query = query / norm
+
+        # 缺少质心的分类 (尚未索引) 不参与分配
+        similarities = np.full(len(categories), -np.inf)
+        for i, cat in enumerate(categories):
+            centroid = centroids.get(cat)
+            if centroid is not None and centroid.shape == query.shape:
+                similarities[i] = float(centroid @ query)
+
+        if np.isneginf(similarities).all():
+            return None
+
+        logits = (similarities - similarities.max()) / self.CENTROID_TEMPERATURE
+        weights = np.exp(logits)
+        return weights / weights.sum()
+
+    def update_centroid(
+        self,
+        destiny_type: str,
+        category: str,
+        added: Optional[Sequence[Sequence[float]]] = None,
+        removed: Optional[Sequence[Sequence[float]]] = None
+    ):
+        """
+        按新增/删除的向量增量更新质心并持久化 (索引变更后调用)
+
+        质心以向量和与向量数维护，开销只与变更的向量数相关；
+        尚无增量统计的集合 (首次变更或旧版质心文件) 全量计算一次。
+
+        Args:
+            added: 新写入集合的向量
+            removed: 从集合删除的向量
+        """
+        with self._lock:
+            stats = self._sums.get(destiny_type, {}).get(category)
+            if stats is not None:
+                total, count = stats[0].copy(), stats[1]
+                for vectors, sign in ((added, 1), (removed, -1)):
+                    if vectors is None or not len(vectors):
+                        continue
+                    matrix = np.asarray(vectors, dtype=np.float32)
+                    if matrix.shape[1] != total.shape[0]:
+                        stats = None
+                        break
+                    total += sign * matrix.sum(axis=0)
+                    count += sign * len(matrix)
+
+                if stats is not None:
+                    self._set_stats(destiny_type, category, total, count)
+                    self._save_centroids()
+                    return
+
+        self.refresh_centroid(destiny_type, category)
+
+    def refresh_centroid(self, destiny_type: str, category: str):
+        """全量重新计算集合质心并持久化"""
+        try:
+            stats = self.chroma.get_embedding_sum(destiny_type, category)
+        except Exception as e:
+            logger.warning(f"Failed to compute centroid for {destiny_type}/{category}: {e}")
+            return
+
+        with self._lock:
+            if stats is None:
+                self._set_stats(destiny_type, category, None, 0)
+            else:
+                self._set_stats(
+                    destiny_type, category, np.asarray(stats[0], dtype=np.float32), stats[1]
+                )
+            self._save_centroids()
+
+    def _set_stats(
+        self,
+        destiny_type: str,
+        category: str,
+        total: Optional[np.ndarray],
+        count: int
+    ):
+        """写入向量和与向量数，并更新归一化质心 (调用方持有锁)"""
+        sums = self._sums.setdefault(destiny_type, {})
+        centroids = self._centroids.setdefault(destiny_type, {})
+        if total is None or count <= 0:
+            sums.pop(category, None)
+            centroids.pop(category, None)
+            return
+
+        sums[category] = (total, count)
+        norm = np.linalg.norm(total)
+        centroids[category] = total / norm if norm > 0 else total
+
+    def _load_centroids(self):
+        """从磁盘加载质心 (旧版文件只有质心向量，没有增量统计)"""
+        if not self.centroid_file.exists():
+            return
+
+        try:
+            with open(self.centroid_file, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            for dt, cats in data.items():
+                for cat, value in cats.items():
+                    if isinstance(value, dict):
+                        self._set_stats(
+                            dt, cat, np.asarray(value["sum"], dtype=np.float32), value["count"]
+                        )
+                    else:
+                        self._centroids.setdefault(dt, {})[cat] = np.asarray(
+                            value, dtype=np.float32
+                        )
+        except Exception as e:
+            logger.warning(f"Failed to load category centroids: {e}")
+
+    def _save_centroids(self):
+        """持久化质心增量统计 (调用方持有锁)"""
+        data = {
+            dt: {
+                cat: {"sum": total.tolist(), "count": count}
+                for cat, (total, count) in cats.items()
+            }
+            for dt, cats in self._sums.items()
+        }
+        with open(self.centroid_file, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+
+
+# 单例实例
+_category_router: CategoryRouter | None = None
+
+
+def get_category_router() -> CategoryRouter:
+    """获取分类路由器单例"""
+    global _category_router
+    if _category_router is None:
+        _category_router = CategoryRouter()
+    return _category_router
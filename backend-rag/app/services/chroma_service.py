@@ -2,15 +2,19 @@
 Chroma 向量存储服务
 """
 import os
+import time
 from pathlib import Path
-from typing import List, Dict, Optional, Any
+from typing import List, Dict, Optional, Any, Tuple
 from loguru import logger
 
+import numpy as np
 import chromadb
 from chromadb.config import Settings
 
 from ..config import get_settings
 from ..models.schemas import SearchResult
+from ..models.candidate import Candidate, to_search_results
+from .result_cache import bump_index_version
 
 
 class ChromaService:
@@ -36,12 +40,66 @@ class ChromaService:
         # 缓存集合
         self._collections: Dict[str, Any] = {}
 
+        # 已存在集合名的注册表 (首次只读查找时从 Chroma 加载)
+        self._registry: Optional[set] = None
+        # 负缓存: {集合名: 过期时间}，有效期内不存在的集合直接返回 None
+        self._missing: Dict[str, float] = {}
+        self.missing_ttl = self.settings.chroma_missing_ttl_s
+
     def _get_collection_name(self, destiny_type: str, category: str) -> str:
         """获取集合名称"""
         return f"{self.collection_prefix}{destiny_type}_{category}"
 
+    def _refresh_registry(self) -> set:
+        """重新加载已存在集合名"""
+        self._registry = {
+            getattr(coll, "name", coll)
+            for coll in self.client.list_collections()
+        }
+        return self._registry
+
+    def find_collection(self, destiny_type: str, category: str):
+        """
+        只读获取集合 (读路径使用，不存在时不创建)
+
+        集合名先查注册表；注册表中没有的名称进入负缓存，有效期内的重复查找只需一次字典查询，
+        过期后重新加载注册表，以发现其他进程创建的集合。
+
+        Returns:
+            集合，不存在返回 None
+        """
+        collection_name = self._get_collection_name(destiny_type, category)
+
+        collection = self._collections.get(collection_name)
+        if collection is not None:
+            return collection
+
+        now = time.monotonic()
+        if self._missing.get(collection_name, 0.0) > now:
+            return None
+
+        registry = self._registry
+        if registry is None or collection_name not in registry:
+            registry = self._refresh_registry()
+
+        if collection_name not in registry:
+            self._missing[collection_name] = now + self.missing_ttl
+            return None
+
+        try:
+            collection = self.client.get_collection(name=collection_name)
+        except Exception:
+            # 注册表加载后被删除
+            registry.discard(collection_name)
+            self._missing[collection_name] = now + self.missing_ttl
+            return None
+
+        self._missing.pop(collection_name, None)
+        self._collections[collection_name] = collection
+        return collection
+
     def get_collection(self, destiny_type: str, category: str):
-        """获取或创建集合"""
+        """获取或创建集合 (写路径使用)"""
         collection_name = self._get_collection_name(destiny_type, category)
 
         if collection_name not in self._collections:
@@ -62,6 +120,10 @@ class ChromaService:
                 )
                 logger.debug(f"Created new collection: {collection_name}")
 
+            self._missing.pop(collection_name, None)
+            if self._registry is not None:
+                self._registry.add(collection_name)
+
         return self._collections[collection_name]
 
     def add_documents(
@@ -71,7 +133,8 @@ class ChromaService:
         documents: List[str],
         embeddings: List[List[float]],
         ids: List[str],
-        metadatas: Optional[List[Dict]] = None
+        metadatas: Optional[List[Dict]] = None,
+        invalidate_cache: bool = True
     ):
         """
         添加文档到集合
@@ -83,6 +146,7 @@ class ChromaService:
             embeddings: 向量列表
             ids: ID 列表
             metadatas: 元数据列表
+            invalidate_cache: 是否递增索引版本 (分批写入的调用方在全部写完后统一递增)
         """
         collection = self.get_collection(destiny_type, category)
 
@@ -96,6 +160,8 @@ class ChromaService:
             ids=ids,
             metadatas=metadatas
         )
+        if invalidate_cache:
+            bump_index_version()
 
         logger.info(
             f"Added {len(documents)} documents to "
@@ -125,7 +191,28 @@ class ChromaService:
         Returns:
             检索结果列表
         """
-        collection = self.get_collection(destiny_type, category)
+        return to_search_results(self.search_candidates(
+            destiny_type=destiny_type,
+            category=category,
+            query=query,
+            query_embedding=query_embedding,
+            n_results=n_results,
+            where=where
+        ))
+
+    def search_candidates(
+        self,
+        destiny_type: str,
+        category: str,
+        query: str,
+        query_embedding: List[float] = None,
+        n_results: int = 10,
+        where: Optional[Dict] = None
+    ) -> List[Candidate]:
+        """向量检索 (内部候选结构，参数同 search)"""
+        collection = self.find_collection(destiny_type, category)
+        if collection is None:
+            return []
 
         # 执行查询
         if query_embedding:
@@ -142,7 +229,7 @@ class ChromaService:
             )
 
         # 格式化结果
-        search_results = []
+        candidates = []
         if results["ids"] and len(results["ids"][0]) > 0:
             for i in range(len(results["ids"][0])):
                 metadata = results["metadatas"][0][i] if results["metadatas"] else {}
@@ -151,19 +238,138 @@ class ChromaService:
                 # 计算相似度分数 (转换为 0-1)
                 score = 1.0 - distance if distance is not None else 0.0
 
-                search_results.append(SearchResult(
+                candidates.append(Candidate(
+                    destiny_type=metadata.get("destiny_type", destiny_type),
+                    category=metadata.get("category", category),
                     id=results["ids"][0][i],
-                    content=results["documents"][0][i],
                     score=score,
+                    source="vector",
+                    content=results["documents"][0][i],
                     title=metadata.get("title", ""),
-                    destiny_type=metadata.get("destiny_type", destiny_type),
-                    category=metadata.get("category", category),
                     level=metadata.get("level", "method"),
-                    source="vector",
                     distance=distance
                 ))
 
-        return search_results
+        return candidates
+
+    def search_ids(
+        self,
+        destiny_type: str,
+        category: str,
+        query_embedding: List[float],
+        n_results: int = 10,
+        where: Optional[Dict] = None
+    ) -> List[Tuple[str, float]]:
+        """
+        向量检索，只返回 (id, 相似度)
+
+        不读取文档内容和元数据，内容在需要时通过 get_documents 批量获取。
+
+        Args:
+            destiny_type: 命理类型
+            category: 子分类
+            query_embedding: 查询向量
+            n_results: 返回数量
+            where: 过滤条件
+
+        Returns:
+            [(id, score)]，按相似度降序
+        """
+        collection = self.find_collection(destiny_type, category)
+        if collection is None:
+            return []
+
+        results = collection.query(
+            query_embeddings=[query_embedding],
+            n_results=n_results,
+            where=where,
+            include=["distances"]
+        )
+
+        if not results["ids"] or not results["ids"][0]:
+            return []
+
+        distances = results["distances"][0]
+        return [
+            (doc_id, 1.0 - distances[i])
+            for i, doc_id in enumerate(results["ids"][0])
+        ]
+
+    def get_documents(
+        self,
+        destiny_type: str,
+        category: str,
+        ids: List[str]
+    ) -> Dict[str, Dict[str, Any]]:
+        """
+        按 ID 批量获取文档
+
+        Returns:
+            {id: {"content", "title", "level"}}
+        """
+        if not ids:
+            return {}
+
+        collection = self.find_collection(destiny_type, category)
+        if collection is None:
+            return {}
+
+        results = collection.get(ids=ids, include=["documents", "metadatas"])
+
+        documents = {}
+        for i, doc_id in enumerate(results["ids"]):
+            metadata = results["metadatas"][i] if results["metadatas"] else {}
+            metadata = metadata or {}
+            documents[doc_id] = {
+                "content": results["documents"][i],
+                "title": metadata.get("title", ""),
+                "level": metadata.get("level", "method"),
+            }
+
+        return documents
+
+    def get_embeddings(
+        self,
+        destiny_type: str,
+        category: str,
+        ids: List[str]
+    ) -> Dict[str, List[float]]:
+        """
+        按 ID 批量获取向量
+
+        Returns:
+            {id: embedding}，只包含集合中已存在的 ID
+        """
+        if not ids:
+            return {}
+
+        collection = self.find_collection(destiny_type, category)
+        if collection is None:
+            return {}
+
+        results = collection.get(ids=ids, include=["embeddings"])
+        embeddings = results.get("embeddings")
+        if embeddings is None:
+            return {}
+        return dict(zip(results["ids"], embeddings))
+
+    def get_embedding_sum(
+        self,
+        destiny_type: str,
+        category: str
+    ) -> Optional[Tuple[List[float], int]]:
+        """全量计算集合所有向量之和与向量数 (质心的全量重算)，集合为空返回 None"""
+        collection = self.find_collection(destiny_type, category)
+        if collection is None:
+            return None
+
+        data = collection.get(include=["embeddings"])
+
+        embeddings = data.get("embeddings")
+        if embeddings is None or len(embeddings) == 0:
+            return None
+
+        return np.asarray(embeddings, dtype=np.float32).sum(axis=0).tolist(), len(embeddings)
 
     def delete(
         self,
@@ -181,12 +387,15 @@ class ChromaService:
             ids: 要删除的ID列表
             where: 删除条件
         """
-        collection = self.get_collection(destiny_type, category)
+        collection = self.find_collection(destiny_type, category)
+        if collection is None:
+            return
 
         if ids:
             collection.delete(ids=ids)
         elif where:
             collection.delete(where=where)
+        bump_index_version()
 
         logger.info(f"Deleted documents from {destiny_type}/{category}")
 
@@ -198,14 +407,17 @@ class ChromaService:
             self.client.delete_collection(name=collection_name)
             if collection_name in self._collections:
                 del self._collections[collection_name]
+            if self._registry is not None:
+                self._registry.discard(collection_name)
+            bump_index_version()
             logger.info(f"Deleted collection: {collection_name}")
         except ValueError as e:
             logger.warning(f"Collection not found: {collection_name}")
 
     def count(self, destiny_type: str, category: str) -> int:
-        """获取集合中的文档数"""
-        collection = self.get_collection(destiny_type, category)
-        return collection.count()
+        """获取集合中的文档数 (集合不存在返回 0)"""
+        collection = self.find_collection(destiny_type, category)
+        return collection.count() if collection is not None else 0
 
     def list_collections(self) -> List[Dict]:
         """列出所有集合"""
@@ -218,10 +430,35 @@ class ChromaService:
             })
         return collections
 
+    def warmup(self, collections: Dict[str, List[str]]) -> int:
+        """
+        预先打开已存在的集合 (不创建新集合)
+
+        Args:
+            collections: {destiny_type: [category, ...]}
+
+        Returns:
+            打开的集合数
+        """
+        self._refresh_registry()
+
+        opened = 0
+        for destiny_type, categories in collections.items():
+            for category in categories:
+                collection = self.find_collection(destiny_type, category)
+                if collection is not None:
+                    collection.count()
+                    opened += 1
+
+        return opened
+
     def reset(self):
         """重置所有集合"""
         self.client.reset()
         self._collections.clear()
+        self._registry = set()
+        self._missing.clear()
+        bump_index_version()
         logger.warning("Chroma database reset")
 
     def get_stats(self) -> Dict[str, Dict[str, int]]:
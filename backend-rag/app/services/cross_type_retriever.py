@@ -2,14 +2,16 @@
 跨类型检索器
 处理涉及多个命理类型的查询
 """
-from typing import List, Optional
-from loguru import logger
+import asyncio
+from typing import List, Optional, Dict
 
 from ..config import get_settings
-from ..models.enums import RetrievalStrategy
+from ..models.enums import RetrievalStrategy, FusionMode
 from ..models.schemas import SearchResult
+from ..models.candidate import Candidate, CandidateKey, to_search_results
 from ..services.chroma_service import get_chroma_service
 from ..services.hybrid_retriever import get_hybrid_retriever
+from ..services.deadline import Deadline
 
 
 class CrossTypeRetriever:
@@ -20,13 +22,20 @@ class CrossTypeRetriever:
         self.chroma = get_chroma_service()
         self.hybrid = get_hybrid_retriever()
         self.shared_weight = 0.8  # 共通知识权重降低
+        self.other_weight = 0.6   # 其他类型中等权重
+        self.source_weights = {
+            "shared_vector": self.shared_weight,
+            "cross_vector": self.other_weight,
+        }
 
     async def search(
         self,
         query: str,
         current_type: str,
         target_types: Optional[List[str]] = None,
-        top_k: int = 5
+        top_k: int = 5,
+        fusion: Optional[FusionMode] = None,
+        deadline: Optional[Deadline] = None
     ) -> List[SearchResult]:
         """
         跨类型检索
@@ -36,99 +45,133 @@ class CrossTypeRetriever:
             current_type: 当前命理类型
             target_types: 目标类型列表 (None 表示所有类型)
             top_k: 返回数量
+            fusion: 融合方式 (None 使用配置默认值)
+            deadline: 请求截止时间
 
         Returns:
             检索结果列表
         """
-        if target_types is None:
-            target_types = self._get_all_types()
-
-        # 1. 检索当前类型
-        current_results = await self.hybrid.search(
+        candidates = await self.search_candidates(
             query=query,
-            destiny_types=[current_type],
-            top_k=top_k
+            current_type=current_type,
+            target_types=target_types,
+            top_k=top_k,
+            fusion=fusion,
+            deadline=deadline
         )
+        return to_search_results(candidates)
 
-        # 2. 检索共通知识
-        shared_results = await self.hybrid.search(
-            query=query,
-            destiny_types=["shared"],
-            top_k=3
+    async def search_candidates(
+        self,
+        query: str,
+        current_type: str,
+        target_types: Optional[List[str]] = None,
+        top_k: int = 5,
+        fusion: Optional[FusionMode] = None,
+        deadline: Optional[Deadline] = None,
+        query_embedding: Optional[List[float]] = None,
+        query_tokens: Optional[List[str]] = None
+    ) -> List[Candidate]:
+        """
+        跨类型检索 (内部候选结构，参数同 search)
+
+        各类型的一阶段检索并发执行并共享同一个查询向量和分词结果，
+        合并后只做一次重排序。query_embedding / query_tokens 可由调用方预先计算。
+        """
+        deadline = deadline or Deadline()
+        if target_types is None:
+            target_types = self._get_all_types()
+
+        # 查询只向量化/分词一次，供所有分支共享
+        query_embedding, query_tokens = await self.hybrid.prepare_query(
+            query, deadline, query_embedding, query_tokens
         )
 
-        # 3. 检索其他相关类型
-        other_types = [t for t in target_types if t not in [current_type, "shared"]]
-        other_results = []
-        for ot in other_types[:2]:  # 最多检索2个其他类型
-            ot_results = await self.hybrid.search(
-                query=query,
-                destiny_types=[ot],
-                top_k=3
+        # 当前类型、共通知识、最多 2 个其他相关类型
+        other_types = [t for t in target_types if t not in [current_type, "shared"]][:2]
+        legs = [(current_type, top_k), ("shared", 3)] + [(ot, 3) for ot in other_types]
+
+        budget = self.hybrid.candidate_budget(RetrievalStrategy.CROSS_TYPE, top_k)
+        leg_results = await asyncio.gather(*[
+            self.hybrid.retrieve(
+                destiny_types=[dt],
+                categories=None,
+                top_k=leg_top_k,
+                limit=budget if dt == current_type else leg_top_k,
+                fusion=fusion,
+                deadline=deadline,
+                query_embedding=query_embedding,
+                query_tokens=query_tokens
             )
-            other_results.extend(ot_results)
+            for dt, leg_top_k in legs
+        ])
+
+        current_results, shared_results = leg_results[0], leg_results[1]
+        other_results = [c for results in leg_results[2:] for c in results]
 
-        # 4. 合并结果，调整权重
+        # 合并结果，调整权重
         combined = self._merge_with_adjusted_weights(
             current=current_results,
             shared=shared_results,
             others=other_results
         )
 
-        return combined[:top_k]
+        # 与单类型检索相同的级联预算: 只有加权融合分数最高的 budget 个候选进入重排序
+        pool = combined[:budget]
+
+        # 重排序一次后再按来源权重调整分数 (权重只在此处施加一次)；
+        # 加权后的排序需要池内全部候选的重排序分数，候选多于 top_k 时要求完整评分
+        reranked = await self.hybrid.rerank_candidates(
+            query, pool, len(pool), deadline, early_stop=False, force=len(pool) > top_k
+        )
+        for c in reranked:
+            weight = self.source_weights.get(c.source, 1.0)
+            c.score *= weight
+            if c.rerank_score is not None:
+                c.rerank_score *= weight
+        reranked.sort(
+            key=lambda c: c.rerank_score if c.rerank_score is not None else c.score,
+            reverse=True
+        )
+
+        return reranked[:top_k]
 
     def _merge_with_adjusted_weights(
         self,
-        current: List[SearchResult],
-        shared: List[SearchResult],
-        others: List[SearchResult]
-    ) -> List[SearchResult]:
-        """合并结果并调整权重"""
-        result_map = {}
+        current: List[Candidate],
+        shared: List[Candidate],
+        others: List[Candidate]
+    ) -> List[Candidate]:
+        """
+        合并结果并标记来源 (候选由各路检索新建，直接原地调整)
+
+        来源权重不写入分数，只用于合并后的排序；重排序之后再统一施加。
+        """
+        result_map: Dict[CandidateKey, Candidate] = {}
 
         # 当前类型结果
-        for r in current:
-            key = f"{r.destiny_type}:{r.category}:{r.id}"
-            result_map[key] = r
+        for c in current:
+            result_map[c.key] = c
 
         # 共通知识结果 (降低权重)
-        for r in shared:
-            key = f"shared:{r.category}:{r.id}"
-            adjusted = SearchResult(
-                id=r.id,
-                content=r.content,
-                score=r.score * self.shared_weight,
-                title=r.title,
-                destiny_type="shared",
-                category=r.category,
-                level=r.level,
-                source="shared_vector",
-                distance=r.distance
-            )
-            if key not in result_map:
-                result_map[key] = adjusted
+        for c in shared:
+            c.destiny_type = "shared"
+            if c.key not in result_map:
+                c.source = "shared_vector"
+                result_map[c.key] = c
 
         # 其他类型结果 (中等权重)
-        other_weight = 0.6
-        for r in others:
-            key = f"{r.destiny_type}:{r.category}:{r.id}"
-            if key not in result_map:
-                adjusted = SearchResult(
-                    id=r.id,
-                    content=r.content,
-                    score=r.score * other_weight,
-                    title=r.title,
-                    destiny_type=r.destiny_type,
-                    category=r.category,
-                    level=r.level,
-                    source="cross_vector",
-                    distance=r.distance
-                )
-                result_map[key] = adjusted
+        for c in others:
+            if c.key not in result_map:
+                c.source = "cross_vector"
+                result_map[c.key] = c
 
         # 排序
         results = list(result_map.values())
-        results.sort(key=lambda x: x.score, reverse=True)
+        results.sort(
+            key=lambda x: x.score * self.source_weights.get(x.source, 1.0),
+            reverse=True
+        )
 
         return results
 
@@ -0,0 +1,81 @@
+"""
+请求级延迟预算
+每个检索分支 (vector / bm25 / graph / rerank) 在剩余预算内执行，
+超时的分支被取消并记录，调用方返回已完成分支的部分结果
+"""
+import time
+import asyncio
+from typing import Any, Awaitable, List, Optional
+from loguru import logger
+
+from ..config import get_settings
+
+
+class Deadline:
+    """请求截止时间"""
+
+    def __init__(self, budget_ms: Optional[float] = None):
+        """
+        Args:
+            budget_ms: 预算 (毫秒)，None 表示不限时
+        """
+        self.budget_ms = budget_ms
+        self.expires_at = (
+            time.monotonic() + budget_ms / 1000
+            if budget_ms is not None else None
+        )
+        # 因超时被丢弃的检索分支
+        self.dropped_sources: List[str] = []
+
+    @classmethod
+    def from_timeout(cls, timeout_ms: Optional[int] = None) -> "Deadline":
+        """按请求超时创建，未指定时使用配置默认值 (0 表示不限时)"""
+        if timeout_ms is None:
+            timeout_ms = get_settings().request_timeout_ms
+        return cls(timeout_ms if timeout_ms > 0 else None)
+
+    def remaining(self) -> Optional[float]:
+        """剩余时间 (秒)，不限时返回 None"""
+        if self.expires_at is None:
+            return None
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+    @property
+    def expired(self) -> bool:
+        return self.expires_at is not None and time.monotonic() >= self.expires_at
+
+    @property
+    def partial(self) -> bool:
+        """是否有分支被丢弃"""
+        return bool(self.dropped_sources)
+
+    def drop(self, source: str):
+        """记录被丢弃的分支"""
+        if source not in self.dropped_sources:
+            self.dropped_sources.append(source)
+
+    async def run(
+        self,
+        source: str,
+        awaitable: Awaitable,
+        default: Any = None,
+        ratio: float = 1.0
+    ) -> Any:
+        """
+        在剩余预算内执行一个分支
+
+        超时则取消该分支、记录来源并返回 default。
+
+        Args:
+            ratio: 最多使用剩余预算的比例 (串行前置步骤用它给后续分支留出时间)
+        """
+        timeout = self.remaining()
+        if timeout is not None:
+            timeout *= ratio
+
+        try:
+            return await asyncio.wait_for(awaitable, timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Retrieval leg '{source}' exceeded deadline ({self.budget_ms}ms), dropped")
+            self.drop(source)
+            return default
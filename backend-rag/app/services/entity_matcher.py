@@ -0,0 +1,150 @@
+"""
+命理实体匹配器
+由 ENTITY_TYPES 和 ENTITY_KEYWORDS 构建 Aho-Corasick 自动机，
+单次扫描文本找出所有实体，按最左最长原则选取不重叠的匹配 (如 "火星" 不再同时命中 "火")。
+查询路由、GraphRAG 和知识入库共用同一个自动机。
+"""
+from collections import deque
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from ..config import ENTITY_TYPES, ENTITY_KEYWORDS
+
+
+class EntityMatch(NamedTuple):
+    """实体匹配结果"""
+    name: str
+    start: int
+    end: int
+    types: Tuple[str, ...]
+
+
+class EntityMatcher:
+    """Aho-Corasick 多模式实体匹配"""
+
+    def __init__(self, vocabularies: Iterable[Dict[str, List[str]]]):
+        """
+        Args:
+            vocabularies: 一个或多个 {实体类型: [关键词]} 词表，同一关键词可属于多个类型
+        """
+        # 关键词 -> 所属类型 (按词表顺序)
+        self._types: Dict[str, Tuple[str, ...]] = {}
+        for vocabulary in vocabularies:
+            for entity_type, keywords in vocabulary.items():
+                for keyword in keywords:
+                    if keyword and entity_type not in self._types.get(keyword, ()):
+                        self._types[keyword] = self._types.get(keyword, ()) + (entity_type,)
+
+        # 自动机: 转移表、失败指针、每个状态结束的模式长度 (降序)
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[Tuple[int, ...]] = [()]
+        self._build()
+
+    def _build(self):
+        """构建字典树和失败指针"""
+        for keyword in self._types:
+            node = 0
+            for char in keyword:
+                next_node = self._goto[node].get(char)
+                if next_node is None:
+                    next_node = len(self._goto)
+                    self._goto[node][char] = next_node
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append(())
+                node = next_node
+            self._output[node] = (len(keyword),)
+
+        # 广度优先计算失败指针，并合并后缀状态的输出
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                fail = self._goto[fail].get(char, 0)
+                if fail == child:
+                    fail = 0
+
+                self._fail[child] = fail
+                self._output[child] = tuple(sorted(
+                    set(self._output[child] + self._output[fail]), reverse=True
+                ))
+
+    def find(self, text: str, types: Optional[Set[str]] = None) -> List[EntityMatch]:
+        """
+        查找文本中的实体
+
+        Args:
+            text: 文本
+            types: 只返回属于这些类型的实体 (在最长匹配选取之后过滤)
+
+        Returns:
+            按出现位置排序、互不重叠的匹配
+        """
+        goto, fail, output = self._goto, self._fail, self._output
+
+        spans = []
+        node = 0
+        for i, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            for length in output[node]:
+                spans.append((i + 1 - length, i + 1))
+
+        # 最左最长: 起点优先，同起点取最长，跳过与已选匹配重叠的
+        spans.sort(key=lambda span: (span[0], -span[1]))
+
+        matches = []
+        last_end = 0
+        for start, end in spans:
+            if start < last_end:
+                continue
+            last_end = end
+
+            name = text[start:end]
+            entity_types = self._types[name]
+            if types is not None:
+                entity_types = tuple(t for t in entity_types if t in types)
+                if not entity_types:
+                    continue
+            matches.append(EntityMatch(name, start, end, entity_types))
+
+        return matches
+
+    def extract(self, text: str, types: Optional[Set[str]] = None) -> List[str]:
+        """提取实体名 (去重，保持首次出现顺序)"""
+        names = []
+        seen = set()
+        for match in self.find(text, types):
+            if match.name not in seen:
+                seen.add(match.name)
+                names.append(match.name)
+        return names
+
+    def entity_types(self, name: str) -> Tuple[str, ...]:
+        """实体所属类型"""
+        return self._types.get(name, ())
+
+
+# 查询路由使用的实体类型
+ROUTER_ENTITY_TYPES: Set[str] = set(ENTITY_KEYWORDS)
+
+# GraphRAG 规则抽取使用的实体类型
+GRAPH_ENTITY_TYPES: Set[str] = set(ENTITY_TYPES)
+
+
+# 单例实例
+_entity_matcher: EntityMatcher | None = None
+
+
+def get_entity_matcher() -> EntityMatcher:
+    """获取实体匹配器单例 (路由词表 + GraphRAG 实体类型)"""
+    global _entity_matcher
+    if _entity_matcher is None:
+        _entity_matcher = EntityMatcher([ENTITY_KEYWORDS, ENTITY_TYPES])
+    return _entity_matcher
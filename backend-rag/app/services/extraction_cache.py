@@ -0,0 +1,109 @@
+"""
+图谱抽取结果缓存
+按 (模型, 提示词版本, 文本 sha256) 持久化 LLM 的实体/关系抽取结果，
+重建图谱时内容未变的文档直接复用，不再调用 LLM
+"""
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from pathlib import Path
+from typing import Any, Dict, Optional
+from loguru import logger
+
+
+class ExtractionCache:
+    """图谱抽取结果缓存 (SQLite)"""
+
+    def __init__(self, db_path: str = None):
+        self.db_path = Path(db_path or "./data/graph/extraction_cache.db")
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS extractions (
+                model TEXT NOT NULL,
+                prompt_version TEXT NOT NULL,
+                content_hash TEXT NOT NULL,
+                result TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (model, prompt_version, content_hash)
+            )
+            """
+        )
+        self._conn.commit()
+
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def content_hash(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def get(self, model: str, prompt_version: str, text: str) -> Optional[Dict[str, Any]]:
+        """读取抽取结果，未命中返回 None"""
+        key = (model, prompt_version, self.content_hash(text))
+
+        try:
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT result FROM extractions "
+                    "WHERE model = ? AND prompt_version = ? AND content_hash = ?",
+                    key
+                ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"Failed to read extraction cache: {e}")
+            row = None
+
+        if row is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, model: str, prompt_version: str, text: str, result: Dict[str, Any]):
+        """写入抽取结果"""
+        try:
+            with self._lock:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO extractions "
+                    "(model, prompt_version, content_hash, result, created_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (
+                        model,
+                        prompt_version,
+                        self.content_hash(text),
+                        json.dumps(result, ensure_ascii=False),
+                        time.time()
+                    )
+                )
+                self._conn.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"Failed to write extraction cache: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """缓存统计"""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM extractions").fetchone()[0]
+        return {
+            "entries": entries,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+# 单例实例
+_extraction_cache: ExtractionCache | None = None
+
+
+def get_extraction_cache() -> ExtractionCache:
+    """获取图谱抽取缓存单例"""
+    global _extraction_cache
+    if _extraction_cache is None:
+        _extraction_cache = ExtractionCache()
+    return _extraction_cache
@@ -0,0 +1,165 @@
+"""
+检索结果融合
+支持 RRF、Min-Max 归一化和 Z-Score 归一化三种融合方式
+
+各路结果必须已按分数降序排列。融合以 k 路堆归并的方式按贡献从大到小消费各路列表
+(阈值算法)，一旦前 limit 个结果不可能再被未读取的部分超越就停止。
+"""
+import heapq
+import math
+from typing import Callable, Dict, Hashable, List, Sequence, Tuple
+
+from ..models.enums import FusionMode
+
+
+# 检索命中: (key, score)
+Hit = Tuple[Hashable, float]
+
+
+def merge_sorted(lists: Sequence[Sequence[Hit]]) -> List[Hit]:
+    """将多个按分数降序的列表归并为一个降序列表"""
+    return list(heapq.merge(*lists, key=lambda hit: hit[1], reverse=True))
+
+
+def fuse(
+    sources: Sequence[Sequence[Hit]],
+    weights: Sequence[float],
+    mode: FusionMode = FusionMode.RRF,
+    limit: int = 10,
+    rrf_k: int = 60
+) -> List[Hit]:
+    """
+    融合多路检索结果
+
+    Args:
+        sources: 各路命中列表 (每路按分数降序)
+        weights: 各路权重
+        mode: 融合方式
+        limit: 需要的结果数
+        rrf_k: RRF 平滑常数
+
+    Returns:
+        [(key, fused_score)]，按融合分数降序，最多 limit 个
+    """
+    if limit <= 0:
+        return []
+
+    contributions = [
+        _contribution_fn(hits, weight, mode, rrf_k)
+        for hits, weight in zip(sources, weights)
+    ]
+
+    # 各路下一个未读取位置的贡献 (未读取文档可获得的上界)
+    heads = [
+        contributions[i](0) if sources[i] else 0.0
+        for i in range(len(sources))
+    ]
+    next_pos = [0] * len(sources)
+
+    heap = [(-heads[i], i) for i in range(len(sources)) if sources[i]]
+    heapq.heapify(heap)
+
+    scores: Dict[Hashable, float] = {}
+    seen: Dict[Hashable, int] = {}  # key -> 已出现的来源位掩码
+
+    while heap:
+        neg_contribution, i = heapq.heappop(heap)
+        key = sources[i][next_pos[i]][0]
+
+        mask = seen.get(key, 0)
+        if not mask & (1 << i):
+            scores[key] = scores.get(key, 0.0) - neg_contribution
+            seen[key] = mask | (1 << i)
+
+        next_pos[i] += 1
+        if next_pos[i] < len(sources[i]):
+            heads[i] = contributions[i](next_pos[i])
+            heapq.heappush(heap, (-heads[i], i))
+        else:
+            heads[i] = 0.0
+
+        if len(scores) >= limit and _is_settled(scores, seen, heads, limit):
+            break
+
+    top = heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+
+    # 补齐提前终止时前 limit 个结果在未读取部分中的贡献
+    if heap:
+        top_scores = dict(top)
+        for i, hits in enumerate(sources):
+            for pos in range(next_pos[i], len(hits)):
+                key = hits[pos][0]
+                if key in top_scores and not seen[key] & (1 << i):
+                    top_scores[key] += contributions[i](pos)
+                    seen[key] |= 1 << i
+        top = sorted(top_scores.items(), key=lambda item: item[1], reverse=True)
+
+    return top
+
+
+def _is_settled(
+    scores: Dict[Hashable, float],
+    seen: Dict[Hashable, int],
+    heads: List[float],
+    limit: int
+) -> bool:
+    """前 limit 个结果是否已不可能被超越"""
+    threshold = sum(heads)
+    top = heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+    kth_score = top[-1][1]
+
+    # 完全未出现的文档最多获得 threshold
+    if kth_score < threshold:
+        return False
+
+    # 已出现但未进入前 limit 的文档，上界为当前分数加上未出现路的头部贡献
+    top_keys = {key for key, _ in top}
+    for key, score in scores.items():
+        if key in top_keys:
+            continue
+        upper = score + sum(
+            head for i, head in enumerate(heads)
+            if not seen[key] & (1 << i)
+        )
+        if upper > kth_score:
+            return False
+
+    return True
+
+
+def _contribution_fn(
+    hits: Sequence[Hit],
+    weight: float,
+    mode: FusionMode,
+    rrf_k: int
+) -> Callable[[int], float]:
+    """
+    返回 位置 -> 贡献分数 的函数
+
+    贡献均非负且沿列表单调不增，保证堆归并和阈值判断成立。
+    """
+    if mode == FusionMode.RRF:
+        return lambda pos: weight / (rrf_k + pos + 1)
+
+    if not hits:
+        return lambda pos: 0.0
+
+    # 列表已降序，最大/最小值分别在首尾
+    max_score = hits[0][1]
+    min_score = hits[-1][1]
+
+    if mode == FusionMode.MINMAX:
+        spread = max_score - min_score
+        if spread <= 0:
+            return lambda pos: weight
+        return lambda pos: weight * (hits[pos][1] - min_score) / spread
+
+    if mode == FusionMode.ZSCORE:
+        mean = sum(score for _, score in hits) / len(hits)
+        std = math.sqrt(sum((score - mean) ** 2 for _, score in hits) / len(hits))
+        if std <= 0:
+            return lambda pos: weight
+        # z - z_min，缺席该路的文档等价于取该路最低分
+        return lambda pos: weight * (hits[pos][1] - min_score) / std
+
+    raise ValueError(f"Unknown fusion mode: {mode}")
@@ -0,0 +1,823 @@
+"""
+图谱内存索引
+启动时从图谱存储加载各分类图谱，构建邻接结构 (实体 -> 关系 -> 文档 ID)，
+局部检索通过字典查找完成多跳扩展。写入同时落盘到图谱存储。
+写入采用写时复制: 副本只复制顶层映射，内层集合在首次修改时复制，其余与旧快照共享；
+合并后整体替换引用，检索读取不加锁、始终看到完整快照。
+热点实体 (主星、宫位、四化) 的多跳邻域和排序后的关联文档预先物化，
+图谱变更时只刷新邻域受影响的实体。
+"""
+import re
+import heapq
+import random
+import threading
+import unicodedata
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+from loguru import logger
+
+from ..config import get_settings, ENTITY_TYPES, HOT_ENTITY_TYPES
+from .graph_store import GraphStore, get_graph_store
+from .result_cache import bump_index_version
+
+
+# 图谱键: (destiny_type, category)
+GraphKey = Tuple[str, str]
+
+
+def normalize_entity_name(name: str) -> str:
+    """规范化实体名 (全角转半角、去除空白)，合并时按规范化名称去重"""
+    return re.sub(r"\s+", "", unicodedata.normalize("NFKC", name or ""))
+
+
+class _Graph:
+    """单个分类的图谱: 实体、关系 (含来源文档)、邻接表、实体 <-> 文档"""
+
+    __slots__ = (
+        "entities", "relations", "relation_docs", "doc_relations", "neighbors",
+        "entity_docs", "doc_entities", "embedding_names", "embeddings", "hot", "_owned",
+    )
+
+    def __init__(self):
+        # {name: entity}
+        self.entities: Dict[str, Dict] = {}
+        # {(source, target, type): relation}
+        self.relations: Dict[Tuple[str, str, str], Dict] = {}
+        # {(source, target, type): {doc_id}} 关系来源，来源数即关系权重
+        self.relation_docs: Dict[Tuple[str, str, str], Set[str]] = {}
+        # {doc_id: {(source, target, type)}}
+        self.doc_relations: Dict[str, Set[Tuple[str, str, str]]] = {}
+        # {name: {neighbor: 边权}}，无向，边权为两实体间所有关系的权重之和
+        self.neighbors: Dict[str, Dict[str, int]] = {}
+        # {name: {doc_id}}
+        self.entity_docs: Dict[str, Set[str]] = {}
+        # {doc_id: {name}} (文档重新索引或删除时用于撤销旧链接)
+        self.doc_entities: Dict[str, Set[str]] = {}
+        # 实体向量表: 实体名 -> 行号，归一化向量矩阵
+        self.embedding_names: Dict[str, int] = {}
+        self.embeddings: Optional[np.ndarray] = None
+        # 热点实体物化表: {name: ({实体名: 跳数}, [(doc_id, score)] 按分数降序)}
+        self.hot: Dict[str, Tuple[Dict[str, int], List[Tuple[str, float]]]] = {}
+        # 本副本已私有的内层容器 {映射名: {键}}，其余内层容器可能与已发布的快照共享
+        self._owned: Dict[str, Set] = {}
+
+    def copy(self, structure: bool = True) -> "_Graph":
+        """
+        写时复制的副本 (已发布的图谱不再修改)
+
+        只复制顶层映射，内层集合和邻接表与原图共享，由 _writable 在首次修改时复制。
+
+        Args:
+            structure: 是否复制图结构映射；为 False 时只复制向量表，其余映射与原图共享
+        """
+        graph = _Graph()
+        if structure:
+            graph.entities = dict(self.entities)
+            graph.relations = dict(self.relations)
+            graph.relation_docs = dict(self.relation_docs)
+            graph.doc_relations = dict(self.doc_relations)
+            graph.neighbors = dict(self.neighbors)
+            graph.entity_docs = dict(self.entity_docs)
+            graph.doc_entities = dict(self.doc_entities)
+        else:
+            graph.entities = self.entities
+            graph.relations = self.relations
+            graph.relation_docs = self.relation_docs
+            graph.doc_relations = self.doc_relations
+            graph.neighbors = self.neighbors
+            graph.entity_docs = self.entity_docs
+            graph.doc_entities = self.doc_entities
+        graph.embedding_names = dict(self.embedding_names)
+        graph.embeddings = self.embeddings
+        graph.hot = self.hot
+        return graph
+
+    def seal(self):
+        """发布前调用: 清空私有容器记录，之后的修改必须在新副本上进行"""
+        self._owned = {}
+
+    def _writable(self, field: str, key, factory=set):
+        """
+        映射 field 中 key 对应的可写内层容器
+
+        可能与其它快照共享的容器在本副本首次写入前复制，不存在时新建。
+        """
+        mapping = getattr(self, field)
+        owned = self._owned.setdefault(field, set())
+        value = mapping.get(key)
+        if value is not None and key in owned:
+            return value
+        value = value.copy() if value is not None else factory()
+        mapping[key] = value
+        owned.add(key)
+        return value
+
+    def add_embeddings(self, names: List[str], vectors: np.ndarray):
+        """写入实体向量 (已存在的实体覆盖原行)"""
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms > 0, norms, 1.0)
+
+        if self.embeddings is None or self.embeddings.shape[1] != vectors.shape[1]:
+            self.embedding_names = {}
+            self.embeddings = np.empty((0, vectors.shape[1]), dtype=np.float32)
+
+        # 矩阵可能与已发布的快照共享，覆盖已有行前先复制
+        embeddings = self.embeddings.copy()
+        new_rows = []
+        for name, vector in zip(names, vectors):
+            row = self.embedding_names.get(name)
+            if row is None:
+                self.embedding_names[name] = len(self.embedding_names)
+                new_rows.append(vector)
+            else:
+                embeddings[row] = vector
+        self.embeddings = embeddings
+
+        if new_rows:
+            self.embeddings = np.vstack([self.embeddings, np.asarray(new_rows, dtype=np.float32)])
+
+    def drop_embeddings(self, names: Iterable[str]):
+        """删除实体向量 (按剩余行重建矩阵和行号，不修改可能被快照共享的原矩阵)"""
+        dropped = {self.embedding_names[name] for name in names if name in self.embedding_names}
+        if not dropped:
+            return
+
+        kept = [name for name, row in self.embedding_names.items() if row not in dropped]
+        self.embeddings = self.embeddings[[self.embedding_names[name] for name in kept]]
+        self.embedding_names = {name: row for row, name in enumerate(kept)}
+
+    def _adjust_edge(self, source: str, target: str, delta: int):
+        for a, b in ((source, target), (target, source)):
+            edges = self._writable("neighbors", a, dict)
+            weight = edges.get(b, 0) + delta
+            if weight > 0:
+                edges[b] = weight
+            else:
+                edges.pop(b, None)
+                if not edges:
+                    del self.neighbors[a]
+
+    def merge_documents(
+        self,
+        entities: Iterable[Dict],
+        doc_relations: Dict[str, Iterable[Dict]],
+        doc_mapping: Dict[str, Iterable[str]]
+    ) -> Set[str]:
+        """
+        合并一批文档 (与 GraphStore.merge 语义一致)
+
+        涉及的文档先撤销旧的实体链接和关系来源，再写入新的 (一次遍历倒排 doc_mapping)；
+        失去全部来源的关系和不再被引用的实体被删除。
+
+        Returns:
+            邻接边变化或被删除的实体名 (文档链接的变化只涉及本批文档)
+        """
+        doc_ids = set(doc_mapping) | set(doc_relations)
+        candidates = set()
+        rewired = set()
+
+        # 1. 撤销旧链接和关系来源
+        for doc_id in doc_ids:
+            for name in self.doc_entities.pop(doc_id, ()):
+                candidates.add(name)
+                if name in self.entity_docs:
+                    docs = self._writable("entity_docs", name)
+                    docs.discard(doc_id)
+                    if not docs:
+                        del self.entity_docs[name]
+
+            for key in self.doc_relations.pop(doc_id, ()):
+                candidates.update(key[:2])
+                rewired.update(key[:2])
+                self._adjust_edge(key[0], key[1], -1)
+                if key in self.relation_docs:
+                    docs = self._writable("relation_docs", key)
+                    docs.discard(doc_id)
+                    if not docs:
+                        del self.relation_docs[key]
+                        self.relations.pop(key, None)
+
+        # 2. 写入新实体、关系来源和链接
+        for entity in entities:
+            name = entity.get("name", "")
+            if name:
+                self.entities[name] = entity
+
+        for doc_id, relations in doc_relations.items():
+            for relation in relations:
+                source = relation.get("source", "")
+                target = relation.get("target", "")
+                if not source or not target or source == target:
+                    continue
+
+                key = (source, target, relation.get("type", ""))
+                docs = self.relation_docs.get(key, ())
+                if doc_id in docs:
+                    continue
+                self._writable("relation_docs", key).add(doc_id)
+                self.relations[key] = relation
+                self._writable("doc_relations", doc_id).add(key)
+                rewired.update((source, target))
+                self._adjust_edge(source, target, 1)
+
+        for doc_id, names in doc_mapping.items():
+            names = set(names)
+            if not names:
+                continue
+            self.doc_entities[doc_id] = names
+            for name in names:
+                self._writable("entity_docs", name).add(doc_id)
+
+        # 3. 删除孤立实体及其向量 (与图谱存储一致)
+        orphans = [
+            name for name in candidates
+            if name not in self.entity_docs and name not in self.neighbors
+        ]
+        for name in orphans:
+            self.entities.pop(name, None)
+        self.drop_embeddings(orphans)
+
+        return rewired | set(orphans)
+
+
+def _expand_graph(
+    graph: _Graph,
+    seeds: Iterable[str],
+    hops: int,
+    neighbor_limit: int,
+    top: Optional[Dict[str, List[str]]] = None
+) -> Dict[str, int]:
+    """
+    广度优先多跳扩展，每个实体只沿边权最大的 neighbor_limit 个邻居扩展
+
+    Args:
+        top: 各实体前 neighbor_limit 个邻居的缓存 (同一图谱上多次扩展时共享)
+    """
+    if top is None:
+        top = {}
+    distances = {
+        seed: 0 for seed in seeds
+        if seed in graph.entities or seed in graph.neighbors or seed in graph.entity_docs
+    }
+    frontier = list(distances)
+
+    for hop in range(1, hops + 1):
+        next_frontier = []
+        for name in frontier:
+            if name not in top:
+                edges = graph.neighbors.get(name, {})
+                top[name] = [
+                    neighbor for neighbor, _ in
+                    heapq.nlargest(neighbor_limit, edges.items(), key=lambda e: e[1])
+                ]
+            for neighbor in top[name]:
+                if neighbor not in distances:
+                    distances[neighbor] = hop
+                    next_frontier.append(neighbor)
+        frontier = next_frontier
+
+    return distances
+
+
+def _score_graph(graph: _Graph, distances: Dict[str, int], hop_decay: float) -> Dict[str, float]:
+    """按实体跳数给关联文档打分 (noisy-or)"""
+    misses: Dict[str, float] = {}
+    for name, hop in distances.items():
+        weight = hop_decay ** (hop + 1)
+        for doc_id in graph.entity_docs.get(name, ()):
+            misses[doc_id] = misses.get(doc_id, 1.0) * (1.0 - weight)
+
+    return {doc_id: 1.0 - miss for doc_id, miss in misses.items()}
+
+
+def _rank(scores: Iterable[Tuple[str, float]], limit: int) -> List[Tuple[str, float]]:
+    """分数最高的 limit 个文档 (分数降序，同分按 doc_id，增量刷新与全量计算结果一致)"""
+    return heapq.nsmallest(limit, scores, key=lambda x: (-x[1], x[0]))
+
+
+class GraphIndex:
+    """
+    图谱内存索引
+
+    写入 (加载、合并、移除文档、写入向量) 由锁串行化，在图谱副本上修改后替换引用；
+    读取直接取当前快照，不加锁，不会被后台构建阻塞。
+    """
+
+    def __init__(self, store: GraphStore = None):
+        self.settings = get_settings()
+        self.store = store or get_graph_store()
+        self._graphs: Dict[GraphKey, _Graph] = {}
+        self._lock = threading.Lock()
+        self._loaded = False
+
+        # 热点实体 (查询集中的封闭实体集合)
+        self._hot_entities: Set[str] = {
+            normalize_entity_name(name)
+            for entity_type in HOT_ENTITY_TYPES
+            for name in ENTITY_TYPES.get(entity_type, [])
+        }
+
+    def load(self) -> int:
+        """
+        从图谱存储加载全部图谱 (重复调用只加载一次)
+
+        存储为空时先导入旧版 JSON 图谱文件。
+
+        Returns:
+            已加载的图谱数
+        """
+        if self._loaded:
+            return len(self._graphs)
+
+        with self._lock:
+            if self._loaded:
+                return len(self._graphs)
+
+            if self.store.is_empty():
+                self.store.import_json(self.store.db_path.parent)
+
+            graphs: Dict[GraphKey, _Graph] = {}
+            for destiny_type, category in self.store.partitions():
+                graph = _Graph()
+                graph.merge_documents(
+                    self.store.get_entities(destiny_type, category),
+                    self.store.get_doc_relations(destiny_type, category),
+                    self.store.get_doc_mapping(destiny_type, category)
+                )
+                names, vectors = self.store.get_entity_embeddings(destiny_type, category)
+                if vectors is not None:
+                    graph.add_embeddings(names, vectors)
+                self._materialize(graph)
+                graph.seal()
+                graphs[(destiny_type, category)] = graph
+
+            self._graphs = graphs
+            self._loaded = True
+            logger.info(f"Graph index loaded: {len(self._graphs)} graphs")
+            return len(self._graphs)
+
+    def merge_graph(
+        self,
+        destiny_type: str,
+        category: str,
+        entities: List[Dict],
+        doc_relations: Dict[str, List[Dict]],
+        doc_mapping: Dict[str, List[str]]
+    ) -> List[Dict]:
+        """
+        将新构建的文档增量合并到分类图谱 (图谱构建完成后调用)，并写入图谱存储
+
+        实体和关系端点按规范化名称去重；关系权重为支持它的文档数；
+        重新索引的文档先撤销旧的链接和关系来源。
+
+        Args:
+            entities: 新抽取的实体 (同名实体覆盖)
+            doc_relations: {doc_id: [relation]}
+            doc_mapping: {doc_id: [entity_name]}
+
+        Returns:
+            合并后该分类的全部实体
+        """
+        entities = [
+            {**entity, "name": normalize_entity_name(entity.get("name", ""))}
+            for entity in entities
+        ]
+        doc_relations = {
+            doc_id: [
+                {
+                    **relation,
+                    "source": normalize_entity_name(relation.get("source", "")),
+                    "target": normalize_entity_name(relation.get("target", "")),
+                }
+                for relation in relations
+            ]
+            for doc_id, relations in doc_relations.items()
+        }
+        doc_mapping = {
+            doc_id: {normalize_entity_name(name) for name in names} - {""}
+            for doc_id, names in doc_mapping.items()
+        }
+
+        self.load()
+        key = (destiny_type, category)
+        with self._lock:
+            self.store.merge(destiny_type, category, entities, doc_relations, doc_mapping)
+
+            previous = self._graphs.get(key)
+            graph = self._copy(key)
+            changed = graph.merge_documents(entities, doc_relations, doc_mapping)
+            self._materialize(
+                graph, (changed, set(doc_mapping) | set(doc_relations)) if previous else None
+            )
+            self._publish(key, graph)
+
+        bump_index_version()
+        return list(graph.entities.values())
+
+    def remove_documents(self, destiny_type: str, category: str, doc_ids: List[str]) -> int:
+        """
+        从分类图谱中移除文档: 撤销实体链接和关系来源，清理失去来源的关系和孤立实体
+
+        Returns:
+            图谱中存在并被移除的文档数
+        """
+        self.load()
+        key = (destiny_type, category)
+        with self._lock:
+            current = self._graphs.get(key)
+            if current is None:
+                return 0
+            linked = [
+                doc_id for doc_id in doc_ids
+                if doc_id in current.doc_entities or doc_id in current.doc_relations
+            ]
+            if not linked:
+                return 0
+
+            self.store.remove_documents(destiny_type, category, linked)
+
+            graph = current.copy()
+            changed = graph.merge_documents([], {}, {doc_id: [] for doc_id in linked})
+            self._materialize(graph, (changed, set(linked)))
+            self._publish(key, graph)
+
+        bump_index_version()
+        return len(linked)
+
+    def _copy(self, key: GraphKey, structure: bool = True) -> _Graph:
+        """当前图谱的可写副本 (不存在时新建，调用方持有锁)"""
+        graph = self._graphs.get(key)
+        return graph.copy(structure) if graph is not None else _Graph()
+
+    def _publish(self, key: GraphKey, graph: _Graph):
+        """发布新图谱: 替换整个字典引用，读取方持有的旧快照不受影响 (调用方持有锁)"""
+        graph.seal()
+        self._graphs = {**self._graphs, key: graph}
+
+    def _materialize(
+        self,
+        graph: _Graph,
+        delta: Optional[Tuple[Set[str], Set[str]]] = None
+    ):
+        """
+        物化热点实体的多跳邻域和排序后的关联文档
+
+        在尚未发布的图谱副本上计算 (只持有写入锁，检索不会等待)，新表一次性赋值，
+        随图谱一起发布。扩展参数与局部检索一致，每个实体保留分数最高的
+        graph_hot_doc_limit 个文档。
+
+        Args:
+            delta: (邻接边变化的实体, 本次合并的文档)；缺省时全量计算，
+                否则只刷新邻域受影响的热点实体
+        """
+        hot = {}
+        top: Dict[str, List[str]] = {}
+        for name in self._hot_entities:
+            entry = graph.hot.get(name) if delta is not None else None
+            if entry is not None:
+                entry = self._refresh_hot(graph, entry, *delta, top)
+            if entry is None:
+                entry = self._compute_hot(graph, name, top)
+            if entry is not None:
+                hot[name] = entry
+
+        graph.hot = hot
+
+    def _compute_hot(
+        self,
+        graph: _Graph,
+        name: str,
+        top: Dict[str, List[str]]
+    ) -> Optional[Tuple[Dict[str, int], List[Tuple[str, float]]]]:
+        """全量计算单个热点实体的物化条目 (实体不在图谱中返回 None)"""
+        distances = _expand_graph(
+            graph, [name], self.settings.graph_local_hops,
+            self.settings.graph_neighbor_limit, top
+        )
+        if not distances:
+            return None
+        scores = _score_graph(graph, distances, self.settings.graph_hop_decay)
+        return distances, _rank(scores.items(), self.settings.graph_hot_doc_limit)
+
+    def _refresh_hot(
+        self,
+        graph: _Graph,
+        entry: Tuple[Dict[str, int], List[Tuple[str, float]]],
+        changed: Set[str],
+        doc_ids: Set[str],
+        top: Dict[str, List[str]]
+    ) -> Optional[Tuple[Dict[str, int], List[Tuple[str, float]]]]:
+        """
+        按本次变更增量刷新物化条目，无法增量得出时返回 None (由调用方全量计算)
+
+        邻域内被扩展的实体 (跳数小于最大跳数) 邻接边变化时重新扩展，邻域不变则沿用；
+        合并只改变本批文档的实体链接，其余文档分数不变，只需重新给本批文档打分。
+        本批文档原本在已截断的排序表中时，表外的文档可能递补，此时全量计算。
+        """
+        distances, ranked = entry
+        hops = self.settings.graph_local_hops
+        doc_limit = self.settings.graph_hot_doc_limit
+
+        if any(distances.get(name, hops) < hops for name in changed):
+            seeds = [name for name, hop in distances.items() if hop == 0]
+            expanded = _expand_graph(graph, seeds, hops, self.settings.graph_neighbor_limit, top)
+            if expanded != distances:
+                return None
+        if len(ranked) >= doc_limit and any(doc_id in doc_ids for doc_id, _ in ranked):
+            return None
+
+        hop_decay = self.settings.graph_hop_decay
+        rescored = []
+        for doc_id in doc_ids:
+            miss = 1.0
+            for name in graph.doc_entities.get(doc_id, ()):
+                hop = distances.get(name)
+                if hop is not None:
+                    miss *= 1.0 - hop_decay ** (hop + 1)
+            if miss < 1.0:
+                rescored.append((doc_id, 1.0 - miss))
+
+        if not rescored and not any(doc_id in doc_ids for doc_id, _ in ranked):
+            return entry
+        kept = [(doc_id, score) for doc_id, score in ranked if doc_id not in doc_ids]
+        return distances, _rank(kept + rescored, doc_limit)
+
+    def hot_documents(
+        self,
+        destiny_type: str,
+        category: str,
+        seeds: List[str],
+        top_k: int
+    ) -> Optional[List[Tuple[str, float]]]:
+        """
+        从热点实体物化表读取局部检索结果 (不做图遍历)
+
+        多个种子的扩展结果等于各自邻域按实体取最小跳数 (扩展只沿固定的前 N 条边进行)，
+        合并后直接打分；单个种子直接返回预先排好序的文档。
+
+        Returns:
+            [(doc_id, score)] 按分数降序；种子不全是热点实体、都不在该图谱中，
+            或 top_k 超出物化的文档数时返回 None (由调用方实时扩展)
+        """
+        seeds = {normalize_entity_name(seed) for seed in seeds}
+        if not seeds or not seeds <= self._hot_entities:
+            return None
+        if top_k > self.settings.graph_hot_doc_limit:
+            return None
+
+        self.load()
+        graph = self._graphs.get((destiny_type, category))
+        if graph is None:
+            return None
+
+        hot = graph.hot
+        entries = [hot[seed] for seed in seeds if seed in hot]
+        if not entries:
+            return None
+        if len(entries) == 1:
+            return entries[0][1][:top_k]
+
+        distances: Dict[str, int] = {}
+        for neighborhood, _ in entries:
+            for name, hop in neighborhood.items():
+                if hop < distances.get(name, hop + 1):
+                    distances[name] = hop
+        scores = _score_graph(graph, distances, self.settings.graph_hop_decay)
+
+        return _rank(scores.items(), top_k)
+
+    def entities_without_embeddings(self, destiny_type: str, category: str) -> List[Dict]:
+        """尚未计算向量的实体"""
+        self.load()
+        graph = self._graphs.get((destiny_type, category))
+        if graph is None:
+            return []
+        return [
+            entity for name, entity in graph.entities.items()
+            if name not in graph.embedding_names
+        ]
+
+    def set_entity_embeddings(
+        self,
+        destiny_type: str,
+        category: str,
+        names: List[str],
+        vectors: List[List[float]]
+    ):
+        """写入实体向量 (图谱存储 + 内存向量表)"""
+        if not names:
+            return
+
+        matrix = np.asarray(vectors, dtype=np.float32)
+        key = (destiny_type, category)
+        with self._lock:
+            self.store.put_entity_embeddings(destiny_type, category, names, matrix)
+
+            graph = self._copy(key, structure=False)
+            graph.add_embeddings(names, matrix)
+            self._publish(key, graph)
+
+        # 实体向量决定局部检索的种子匹配
+        bump_index_version()
+
+    def has_entity_embeddings(self, destiny_type: str, category: str) -> bool:
+        self.load()
+        graph = self._graphs.get((destiny_type, category))
+        return graph is not None and graph.embeddings is not None and len(graph.embeddings) > 0
+
+    def nearest_entities(
+        self,
+        destiny_type: str,
+        category: str,
+        query_embedding: List[float],
+        top_k: int = 3,
+        threshold: float = 0.0
+    ) -> List[Tuple[str, float]]:
+        """
+        按查询向量查找最相近的实体 (预计算向量表上的一次矩阵乘法)
+
+        Returns:
+            [(实体名, 余弦相似度)]，相似度降序且不低于 threshold
+        """
+        graph = self._graphs.get((destiny_type, category))
+        if graph is None or graph.embeddings is None or not len(graph.embeddings):
+            return []
+
+        query = np.asarray(query_embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm == 0 or query.shape[0] != graph.embeddings.shape[1]:
+            return []
+
+        similarities = graph.embeddings @ (query / norm)
+        order = np.argsort(-similarities)[:top_k]
+        names = list(graph.embedding_names)
+        return [
+            (names[i], float(similarities[i]))
+            for i in order if similarities[i] >= threshold
+        ]
+
+    def expand(
+        self,
+        destiny_type: str,
+        category: str,
+        seeds: List[str],
+        hops: int = 2,
+        neighbor_limit: int = 20
+    ) -> Dict[str, int]:
+        """
+        从种子实体做多跳邻居扩展
+
+        Args:
+            seeds: 种子实体名
+            hops: 最大跳数
+            neighbor_limit: 每个实体最多扩展的邻居数 (按关系数降序)，避免枢纽节点发散
+
+        Returns:
+            {实体名: 跳数}，只包含图谱中存在的实体
+        """
+        self.load()
+        graph = self._graphs.get((destiny_type, category))
+        if graph is None:
+            return {}
+
+        return _expand_graph(
+            graph, [normalize_entity_name(seed) for seed in seeds], hops, neighbor_limit
+        )
+
+    def score_documents(
+        self,
+        destiny_type: str,
+        category: str,
+        distances: Dict[str, int],
+        hop_decay: float = 0.5
+    ) -> Dict[str, float]:
+        """
+        按实体跳数给关联文档打分
+
+        每个实体的权重为 hop_decay ** (跳数 + 1)，文档分数取其关联实体权重的
+        noisy-or (1 - Π(1 - w))，关联实体越多、距离越近分数越高，取值在 [0, 1)。
+
+        Returns:
+            {doc_id: score}
+        """
+        graph = self._graphs.get((destiny_type, category))
+        if graph is None:
+            return {}
+        return _score_graph(graph, distances, hop_decay)
+
+    def detect_communities(
+        self,
+        destiny_type: str,
+        category: str,
+        min_size: int = 3,
+        max_iterations: int = 20
+    ) -> List[List[str]]:
+        """
+        标签传播社区发现
+
+        边权为关系数加共现文档数 (同一文档中出现的实体视为相连，
+        只有规则抽取、没有 LLM 关系的实体也能归入社区)。
+        节点按固定种子打乱顺序迭代，取邻居中权重最大的标签，平局时保留当前标签，
+        否则取最小标签，保证结果可复现。
+
+        Returns:
+            社区成员列表 (按规模降序，成员按度数降序)，小于 min_size 的社区被丢弃
+        """
+        self.load()
+        graph = self._graphs.get((destiny_type, category))
+        if graph is None:
+            return []
+
+        edges: Dict[str, Dict[str, int]] = {
+            name: dict(neighbors) for name, neighbors in graph.neighbors.items()
+        }
+        for names in graph.doc_entities.values():
+            names = sorted(names)
+            for i, a in enumerate(names):
+                for b in names[i + 1:]:
+                    for x, y in ((a, b), (b, a)):
+                        row = edges.setdefault(x, {})
+                        row[y] = row.get(y, 0) + 1
+
+        nodes = sorted(edges)
+        labels = {node: node for node in nodes}
+        rng = random.Random(0)
+
+        for _ in range(max_iterations):
+            rng.shuffle(nodes)
+            changed = False
+            for node in nodes:
+                weights: Dict[str, int] = {}
+                for neighbor, weight in edges[node].items():
+                    label = labels[neighbor]
+                    weights[label] = weights.get(label, 0) + weight
+
+                best = max(weights.values())
+                candidates = [label for label, weight in weights.items() if weight == best]
+                label = labels[node] if labels[node] in candidates else min(candidates)
+                if label != labels[node]:
+                    labels[node] = label
+                    changed = True
+
+            if not changed:
+                break
+
+        groups: Dict[str, List[str]] = {}
+        for node, label in labels.items():
+            groups.setdefault(label, []).append(node)
+
+        degree = {node: sum(neighbors.values()) for node, neighbors in edges.items()}
+        communities = [
+            sorted(members, key=lambda n: (-degree[n], n))
+            for members in groups.values() if len(members) >= min_size
+        ]
+        communities.sort(key=lambda members: (-len(members), members[0]))
+        return communities
+
+    def get_entity(self, destiny_type: str, category: str, name: str) -> Dict:
+        """实体详情 (不存在返回空字典)"""
+        graph = self._graphs.get((destiny_type, category))
+        return graph.entities.get(name, {}) if graph else {}
+
+    def get_relations_among(
+        self,
+        destiny_type: str,
+        category: str,
+        names: List[str]
+    ) -> List[Dict]:
+        """成员之间的关系"""
+        graph = self._graphs.get((destiny_type, category))
+        if graph is None:
+            return []
+
+        members = set(names)
+        return [
+            relation for (source, target, _), relation in graph.relations.items()
+            if source in members and target in members
+        ]
+
+    def get_stats(self) -> Dict[str, Dict[str, int]]:
+        """图谱统计"""
+        self.load()
+        return {
+            f"{dt}_{cat}": {
+                "entities": len(graph.entities),
+                "edges": sum(len(edges) for edges in graph.neighbors.values()) // 2,
+                "linked_entities": len(graph.entity_docs),
+                "hot_entities": len(graph.hot),
+            }
+            for (dt, cat), graph in self._graphs.items()
+        }
+
+
+# 单例实例
+_graph_index: GraphIndex | None = None
+
+
+def get_graph_index() -> GraphIndex:
+    """获取图谱内存索引单例"""
+    global _graph_index
+    if _graph_index is None:
+        _graph_index = GraphIndex()
+    return _graph_index
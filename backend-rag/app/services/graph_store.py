@@ -0,0 +1,451 @@
+"""
+图谱存储 (SQLite)
+实体、关系、实体-文档链接和社区摘要按 (destiny_type, category) 分区存放，
+按文档增量合并 (实体、关系来源、实体-文档链接)，替代整图重写的 JSON 文件。
+"""
+import json
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+from loguru import logger
+
+
+# 旧版图谱中没有来源文档的关系使用的来源 ID
+LEGACY_DOC_ID = ""
+
+# IN (...) 查询每批的文档数 (低于 SQLite 默认的参数上限)
+DOC_BATCH_SIZE = 500
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entities (
+    destiny_type TEXT NOT NULL,
+    category TEXT NOT NULL,
+    name TEXT NOT NULL,
+    type TEXT NOT NULL DEFAULT '',
+    description TEXT NOT NULL DEFAULT '',
+    data TEXT NOT NULL,
+    PRIMARY KEY (destiny_type, category, name)
+);
+DROP INDEX IF EXISTS idx_entities_name;
+DROP INDEX IF EXISTS idx_entities_type;
+
+CREATE TABLE IF NOT EXISTS relations (
+    destiny_type TEXT NOT NULL,
+    category TEXT NOT NULL,
+    source TEXT NOT NULL,
+    target TEXT NOT NULL,
+    type TEXT NOT NULL DEFAULT '',
+    description TEXT NOT NULL DEFAULT '',
+    weight INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (destiny_type, category, source, target, type)
+);
+CREATE INDEX IF NOT EXISTS idx_relations_target ON relations (destiny_type, category, target);
+
+CREATE TABLE IF NOT EXISTS relation_docs (
+    destiny_type TEXT NOT NULL,
+    category TEXT NOT NULL,
+    source TEXT NOT NULL,
+    target TEXT NOT NULL,
+    type TEXT NOT NULL DEFAULT '',
+    doc_id TEXT NOT NULL,
+    PRIMARY KEY (destiny_type, category, source, target, type, doc_id)
+);
+DROP INDEX IF EXISTS idx_relation_docs_doc;
+CREATE INDEX IF NOT EXISTS idx_relation_docs_by_doc
+    ON relation_docs (destiny_type, category, doc_id, source, target, type);
+
+CREATE TABLE IF NOT EXISTS entity_docs (
+    destiny_type TEXT NOT NULL,
+    category TEXT NOT NULL,
+    name TEXT NOT NULL,
+    doc_id TEXT NOT NULL,
+    PRIMARY KEY (destiny_type, category, name, doc_id)
+);
+DROP INDEX IF EXISTS idx_entity_docs_doc;
+CREATE INDEX IF NOT EXISTS idx_entity_docs_by_doc ON entity_docs (destiny_type, category, doc_id, name);
+
+CREATE TABLE IF NOT EXISTS communities (
+    destiny_type TEXT NOT NULL,
+    category TEXT NOT NULL,
+    id TEXT NOT NULL,
+    type TEXT NOT NULL DEFAULT '',
+    entities TEXT NOT NULL,
+    summary TEXT NOT NULL DEFAULT '',
+    PRIMARY KEY (destiny_type, category, id)
+);
+CREATE INDEX IF NOT EXISTS idx_communities_id ON communities (destiny_type, id);
+
+CREATE TABLE IF NOT EXISTS entity_embeddings (
+    destiny_type TEXT NOT NULL,
+    category TEXT NOT NULL,
+    name TEXT NOT NULL,
+    embedding BLOB NOT NULL,
+    PRIMARY KEY (destiny_type, category, name)
+);
+"""
+
+
+class GraphStore:
+    """图谱存储 (SQLite)"""
+
+    def __init__(self, db_path: str = None):
+        self.db_path = Path(db_path or "./data/graph/graph.db")
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+
+    # ==================== 写入 ====================
+
+    def merge(
+        self,
+        destiny_type: str,
+        category: str,
+        entities: List[Dict],
+        doc_relations: Dict[str, List[Dict]],
+        doc_mapping: Dict[str, Iterable[str]]
+    ):
+        """
+        增量合并一批文档的图谱 (单个事务)
+
+        涉及的文档先撤销旧的实体链接和关系来源，再写入新的；关系权重为支持它的文档数，
+        权重降为 0 的关系和不再被任何文档或关系引用的实体被删除。
+        doc_mapping 中实体列表为空的文档即被移除。
+
+        Args:
+            entities: 实体 (同名覆盖，名称已规范化)
+            doc_relations: {doc_id: [relation]}，关系来源文档
+            doc_mapping: {doc_id: [entity_name]}
+        """
+        partition = (destiny_type, category)
+        doc_ids = list(set(doc_mapping) | set(doc_relations))
+        doc_batches = [
+            doc_ids[i:i + DOC_BATCH_SIZE] for i in range(0, len(doc_ids), DOC_BATCH_SIZE)
+        ]
+
+        entity_rows = [
+            partition + (
+                e["name"], e.get("type", ""), e.get("description", ""),
+                json.dumps(e, ensure_ascii=False)
+            )
+            for e in entities if e.get("name")
+        ]
+        relation_rows = {}
+        provenance_rows = []
+        for doc_id, relations in doc_relations.items():
+            for r in relations:
+                if not r.get("source") or not r.get("target") or r["source"] == r["target"]:
+                    continue
+                key = (r["source"], r["target"], r.get("type", ""))
+                relation_rows[key] = partition + key + (r.get("description", ""),)
+                provenance_rows.append(partition + key + (doc_id,))
+        link_rows = [
+            partition + (name, doc_id)
+            for doc_id, names in doc_mapping.items()
+            for name in set(names)
+        ]
+
+        with self._lock, self._conn:
+            conn = self._conn
+
+            # 1. 撤销这些文档的旧链接和关系来源，记录受影响的关系和实体
+            # (按文档的覆盖索引批量查询，开销只与本批文档相关，不扫描整个分区)
+            affected = set(relation_rows)
+            candidates = set()
+            for batch in doc_batches:
+                params = partition + tuple(batch)
+                in_clause = ", ".join("?" * len(batch))
+                affected.update(conn.execute(
+                    "SELECT source, target, type FROM relation_docs "
+                    "INDEXED BY idx_relation_docs_by_doc "
+                    f"WHERE destiny_type = ? AND category = ? AND doc_id IN ({in_clause})",
+                    params
+                ).fetchall())
+                candidates.update(row[0] for row in conn.execute(
+                    "SELECT name FROM entity_docs "
+                    "INDEXED BY idx_entity_docs_by_doc "
+                    f"WHERE destiny_type = ? AND category = ? AND doc_id IN ({in_clause})",
+                    params
+                ).fetchall())
+                conn.execute(
+                    "DELETE FROM relation_docs INDEXED BY idx_relation_docs_by_doc "
+                    f"WHERE destiny_type = ? AND category = ? AND doc_id IN ({in_clause})",
+                    params
+                )
+                conn.execute(
+                    "DELETE FROM entity_docs INDEXED BY idx_entity_docs_by_doc "
+                    f"WHERE destiny_type = ? AND category = ? AND doc_id IN ({in_clause})",
+                    params
+                )
+
+            # 2. 写入新的实体、关系、来源和链接
+            conn.executemany(
+                "INSERT INTO entities (destiny_type, category, name, type, description, data) "
+                "VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (destiny_type, category, name) DO UPDATE SET "
+                "type = excluded.type, description = excluded.description, data = excluded.data",
+                entity_rows
+            )
+            conn.executemany(
+                "INSERT INTO relations (destiny_type, category, source, target, type, description) "
+                "VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (destiny_type, category, source, target, type) DO UPDATE SET "
+                "description = excluded.description",
+                list(relation_rows.values())
+            )
+            conn.executemany(
+                "INSERT OR IGNORE INTO relation_docs "
+                "(destiny_type, category, source, target, type, doc_id) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                provenance_rows
+            )
+            conn.executemany(
+                "INSERT OR IGNORE INTO entity_docs (destiny_type, category, name, doc_id) "
+                "VALUES (?, ?, ?, ?)",
+                link_rows
+            )
+
+            # 3. 重算受影响关系的权重，删除失去全部来源的关系
+            affected_rows = [partition + key for key in affected]
+            conn.executemany(
+                "UPDATE relations SET weight = ("
+                "SELECT COUNT(*) FROM relation_docs d "
+                "WHERE d.destiny_type = relations.destiny_type AND d.category = relations.category "
+                "AND d.source = relations.source AND d.target = relations.target "
+                "AND d.type = relations.type"
+                ") WHERE destiny_type = ? AND category = ? AND source = ? AND target = ? AND type = ?",
+                affected_rows
+            )
+            conn.executemany(
+                "DELETE FROM relations WHERE destiny_type = ? AND category = ? "
+                "AND source = ? AND target = ? AND type = ? AND weight = 0",
+                affected_rows
+            )
+
+            # 4. 删除不再被引用的实体 (及其向量)
+            candidates.update(name for key in affected for name in key[:2])
+            orphans = [
+                partition + (name,) for name in candidates
+                if not conn.execute(
+                    "SELECT 1 FROM entity_docs WHERE destiny_type = ? AND category = ? AND name = ? "
+                    "UNION ALL SELECT 1 FROM relations "
+                    "WHERE destiny_type = ? AND category = ? AND source = ? "
+                    "UNION ALL SELECT 1 FROM relations "
+                    "WHERE destiny_type = ? AND category = ? AND target = ? LIMIT 1",
+                    (partition + (name,)) * 3
+                ).fetchone()
+            ]
+            for table in ("entities", "entity_embeddings"):
+                conn.executemany(
+                    f"DELETE FROM {table} WHERE destiny_type = ? AND category = ? AND name = ?",
+                    orphans
+                )
+
+    def remove_documents(self, destiny_type: str, category: str, doc_ids: List[str]):
+        """移除文档的实体链接和关系来源 (随之清理失去来源的关系和孤立实体)"""
+        self.merge(destiny_type, category, [], {}, {doc_id: [] for doc_id in doc_ids})
+
+    def replace_communities(self, destiny_type: str, category: str, communities: List[Dict]):
+        """替换一个分类的社区摘要"""
+        rows = [
+            (
+                destiny_type, category, c["id"], c.get("type", ""),
+                json.dumps(c.get("entities", []), ensure_ascii=False), c.get("summary", "")
+            )
+            for c in communities
+        ]
+        with self._lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM communities WHERE destiny_type = ? AND category = ?",
+                (destiny_type, category)
+            )
+            self._conn.executemany(
+                "INSERT INTO communities (destiny_type, category, id, type, entities, summary) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                rows
+            )
+
+    def put_entity_embeddings(
+        self,
+        destiny_type: str,
+        category: str,
+        names: List[str],
+        vectors: np.ndarray
+    ):
+        """写入实体向量 (float32)"""
+        rows = [
+            (destiny_type, category, name, np.asarray(vector, dtype=np.float32).tobytes())
+            for name, vector in zip(names, vectors)
+        ]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO entity_embeddings (destiny_type, category, name, embedding) "
+                "VALUES (?, ?, ?, ?)",
+                rows
+            )
+
+    # ==================== 查询 ====================
+
+    def _query(self, sql: str, params: Tuple = ()) -> List[Tuple]:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def partitions(self) -> List[Tuple[str, str]]:
+        """已有图谱的 (destiny_type, category)"""
+        return self._query("SELECT DISTINCT destiny_type, category FROM entities")
+
+    def get_entities(self, destiny_type: str, category: str) -> List[Dict]:
+        rows = self._query(
+            "SELECT data FROM entities WHERE destiny_type = ? AND category = ?",
+            (destiny_type, category)
+        )
+        return [json.loads(row[0]) for row in rows]
+
+    def get_doc_relations(self, destiny_type: str, category: str) -> Dict[str, List[Dict]]:
+        """{doc_id: [relation]} (关系来源)"""
+        rows = self._query(
+            "SELECT r.source, r.target, r.type, r.description, d.doc_id "
+            "FROM relation_docs d JOIN relations r "
+            "ON r.destiny_type = d.destiny_type AND r.category = d.category "
+            "AND r.source = d.source AND r.target = d.target AND r.type = d.type "
+            "WHERE d.destiny_type = ? AND d.category = ?",
+            (destiny_type, category)
+        )
+        doc_relations: Dict[str, List[Dict]] = {}
+        for source, target, rel_type, desc, doc_id in rows:
+            doc_relations.setdefault(doc_id, []).append(
+                {"source": source, "target": target, "type": rel_type, "description": desc}
+            )
+        return doc_relations
+
+    def get_doc_mapping(self, destiny_type: str, category: str) -> Dict[str, Set[str]]:
+        """{doc_id: {entity_name}}"""
+        mapping: Dict[str, Set[str]] = {}
+        for name, doc_id in self._query(
+            "SELECT name, doc_id FROM entity_docs WHERE destiny_type = ? AND category = ?",
+            (destiny_type, category)
+        ):
+            mapping.setdefault(doc_id, set()).add(name)
+        return mapping
+
+    def get_entity_embeddings(
+        self,
+        destiny_type: str,
+        category: str
+    ) -> Tuple[List[str], Optional[np.ndarray]]:
+        """实体向量表: (实体名列表, 向量矩阵)，没有向量时矩阵为 None"""
+        rows = self._query(
+            "SELECT name, embedding FROM entity_embeddings WHERE destiny_type = ? AND category = ?",
+            (destiny_type, category)
+        )
+        if not rows:
+            return [], None
+
+        # 更换向量模型后可能残留其他维度的旧向量，只保留最常见的维度
+        sizes = [len(blob) for _, blob in rows]
+        size = max(set(sizes), key=sizes.count)
+        rows = [row for row in rows if len(row[1]) == size]
+
+        return (
+            [name for name, _ in rows],
+            np.stack([np.frombuffer(blob, dtype=np.float32) for _, blob in rows])
+        )
+
+    def get_communities(
+        self,
+        destiny_type: str,
+        category: Optional[str] = None,
+        ids: Optional[List[str]] = None
+    ) -> List[Dict]:
+        """社区摘要 (可按分类或社区 ID 过滤)"""
+        sql = "SELECT category, id, type, entities, summary FROM communities WHERE destiny_type = ?"
+        params: Tuple = (destiny_type,)
+        if category is not None:
+            sql += " AND category = ?"
+            params += (category,)
+        if ids is not None:
+            sql += f" AND id IN ({', '.join('?' * len(ids))})"
+            params += tuple(ids)
+
+        return [
+            {
+                "id": community_id,
+                "category": cat,
+                "type": community_type,
+                "entities": json.loads(entities),
+                "summary": summary,
+            }
+            for cat, community_id, community_type, entities, summary in self._query(sql, params)
+        ]
+
+    def is_empty(self) -> bool:
+        return not self._query("SELECT 1 FROM entities LIMIT 1")
+
+    def get_stats(self) -> Dict[str, int]:
+        """各表行数"""
+        return {
+            table: self._query(f"SELECT COUNT(*) FROM {table}")[0][0]
+            for table in (
+                "entities", "relations", "relation_docs", "entity_docs",
+                "communities", "entity_embeddings"
+            )
+        }
+
+    # ==================== 迁移 ====================
+
+    def import_json(self, graph_dir: Path) -> int:
+        """
+        导入旧版 {type}_{category}_graph.json / _communities.json 文件 (原文件保留)
+
+        Returns:
+            导入的图谱数
+        """
+        imported = 0
+        for graph_file in sorted(graph_dir.glob("*_graph.json")):
+            try:
+                with open(graph_file, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+
+                doc_mapping: Dict[str, Set[str]] = {}
+                for name, doc_ids in data.get("entity_docs", {}).items():
+                    for doc_id in doc_ids:
+                        doc_mapping.setdefault(doc_id, set()).add(name)
+
+                # 旧版关系没有来源文档，归到 LEGACY_DOC_ID 下
+                dt, cat = data["destiny_type"], data["category"]
+                self.merge(
+                    dt, cat, data.get("entities", []),
+                    {LEGACY_DOC_ID: data.get("relations", [])}, doc_mapping
+                )
+
+                community_file = graph_dir / f"{dt}_{cat}_communities.json"
+                if community_file.exists():
+                    with open(community_file, "r", encoding="utf-8") as f:
+                        self.replace_communities(dt, cat, json.load(f))
+
+                imported += 1
+            except Exception as e:
+                logger.warning(f"Failed to import graph {graph_file}: {e}")
+
+        if imported:
+            logger.info(f"Imported {imported} JSON graphs into {self.db_path}")
+        return imported
+
+
+# 单例实例
+_graph_store: GraphStore | None = None
+
+
+def get_graph_store() -> GraphStore:
+    """获取图谱存储单例"""
+    global _graph_store
+    if _graph_store is None:
+        _graph_store = GraphStore()
+    return _graph_store
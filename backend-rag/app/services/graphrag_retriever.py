@@ -8,38 +8,39 @@ GraphRAG 检索器
 3. 支持局部检索（实体邻居）和全局检索（社区摘要）
 """
 import json
-import hashlib
+import asyncio
+import contextlib
 from typing import List, Dict, Optional, Tuple, Any
-from pathlib import Path
 from loguru import logger
 
 from openai import AsyncOpenAI
 
-from ..config import get_settings
+from ..config import get_settings, DESTINY_TYPES
 from ..models.enums import RetrievalStrategy
 from ..models.schemas import SearchResult
+from ..models.candidate import Candidate, to_search_results
 from ..services.chroma_service import get_chroma_service
 from ..services.embedding_service import get_embedding_service
+from ..services.deadline import Deadline
+from ..services.rate_limiter import RateLimiter
+from ..services.extraction_cache import get_extraction_cache
+from ..services.entity_matcher import (
+    get_entity_matcher, GRAPH_ENTITY_TYPES, ROUTER_ENTITY_TYPES
+)
+from ..services.graph_index import get_graph_index
+from ..services.graph_store import get_graph_store
+from ..services.result_cache import bump_index_version
 
 
-# 实体类型定义
-ENTITY_TYPES = {
-    # 紫微斗数
-    "星曜": ["紫微", "天机", "太阳", "武曲", "天同", "廉贞", "天府", "太阴", "贪狼", "巨门", "天相", "天梁", "七杀", "破军"],
-    "宫位": ["命宫", "兄弟宫", "夫妻宫", "子女宫", "财帛宫", "疾厄宫", "迁移宫", "仆役宫", "官禄宫", "田宅宫", "福德宫", "父母宫"],
-    "四化": ["化禄", "化权", "化科", "化忌"],
-    "格局": ["紫府同宫格", "杀破狼格", "火贪格", "铃贪格", "府相朝垣格", "日丽中天格"],
+# 抽取提示词版本，修改提示词后递增以使抽取缓存失效
+EXTRACTION_PROMPT_VERSION = "1"
 
-    # 八字命理
-    "十神": ["正官", "七杀", "正财", "偏财", "正印", "偏印", "比肩", "劫财", "食神", "伤官"],
-    "用神": ["用神", "喜神", "忌神", "调候"],
-
-    # 通用
-    "五行": ["金", "木", "水", "火", "土"],
-    "天干": ["甲", "乙", "丙", "丁", "戊", "己", "庚", "辛", "壬", "癸"],
-    "地支": ["子", "丑", "寅", "卯", "辰", "巳", "午", "未", "申", "酉", "戌", "亥"],
-}
+# 社区摘要向量集合 (每个命理类型一个，按 category 元数据区分来源分类)
+COMMUNITY_CATEGORY = "community"
 
+# LLM 抽取提示词中的实体/关系类型说明
+EXTRACTION_TYPE_HINT = """实体类型可选：星曜, 宫位, 四化, 格局, 十神, 用神, 五行, 天干, 地支, 概念, 其他
+关系类型可选：属, 位于, 同宫, 相生, 相克, 组成, 包含, 影响, 增强, 削弱, 相关"""
 
 class GraphRAGRetriever:
     """GraphRAG 检索器 - 完整版"""
@@ -49,18 +50,24 @@ class GraphRAGRetriever:
         self.chroma = get_chroma_service()
         self.embedding = get_embedding_service()
 
-        # 图谱存储目录
-        self.graph_dir = Path("./data/graph")
-        self.graph_dir.mkdir(parents=True, exist_ok=True)
-
         # LLM 客户端 (用于实体提取)
         self.llm_client = AsyncOpenAI(
             api_key=self.settings.openai_api_key,
             base_url=self.settings.openai_base_url,
         )
 
-        # 实体索引缓存: {entity_name: [doc_ids]}
-        self._entity_index: Dict[str, List[str]] = {}
+        # 图谱存储 (SQLite) 和内存索引 (邻接表 + 实体 -> 文档，启动时从存储加载)
+        self.graph_store = get_graph_store()
+        self.graph_index = get_graph_index()
+
+        # 图谱构建时 LLM 抽取的限流器
+        self._rate_limiter = RateLimiter(self.settings.graph_extraction_rpm)
+
+        # LLM 抽取结果缓存 (内容未变的文档重建时直接复用)
+        self.extraction_cache = get_extraction_cache()
+
+        # 实体匹配自动机
+        self.entity_matcher = get_entity_matcher()
 
     # ==================== 图谱构建 ====================
 
@@ -73,6 +80,9 @@ class GraphRAGRetriever:
         """
         从文档中提取实体和关系，构建知识图谱
 
+        LLM 抽取以有限并发 + 限流执行，短文档合并到同一个提示词中；
+        每批结果返回后立即并入图谱。
+
         Args:
             destiny_type: 命理类型
             category: 子分类
@@ -81,56 +91,182 @@ class GraphRAGRetriever:
         Returns:
             构建统计信息
         """
+        documents = [doc for doc in documents if doc.get("content")]
         logger.info(f"Building graph for {destiny_type}/{category}, {len(documents)} documents")
 
         all_entities = []
-        all_relations = []
+        doc_relations = {}  # doc_id -> relations (关系来源，决定边权)
         doc_mapping = {}  # doc_id -> entity_names
 
-        for doc in documents:
-            doc_id = doc.get("id", "")
-            content = doc.get("content", "")
-            title = doc.get("title", "")
-
-            if not content:
-                continue
-
-            # 提取实体和关系
-            entities, relations = await self._extract_entities_relations(
-                content, title, doc_id
-            )
+        batches = self._batch_documents(documents)
+        semaphore = asyncio.Semaphore(self.settings.graph_extraction_concurrency)
 
-            all_entities.extend(entities)
-            all_relations.extend(relations)
+        completed = 0
+        for future in asyncio.as_completed([
+            self._extract_batch(batch, semaphore) for batch in batches
+        ]):
+            for doc_id, entities, relations in await future:
+                all_entities.extend(entities)
 
-            if entities:
+                # 没有实体/关系的文档也记录，重新索引时撤销其旧链接和关系来源
+                doc_relations[doc_id] = relations
                 doc_mapping[doc_id] = list(set(e["name"] for e in entities))
 
+            completed += 1
+            logger.debug(f"Graph extraction progress: {completed}/{len(batches)} batches")
+
         # 去重实体
         unique_entities = self._dedup_entities(all_entities)
 
-        # 保存图谱
-        await self._save_graph(destiny_type, category, unique_entities, all_relations)
+        # 增量合并到图谱存储和内存索引 (实体 -> 文档由 doc_mapping 一次倒排得到)
+        graph_entities = await asyncio.to_thread(
+            self.graph_index.merge_graph,
+            destiny_type, category, unique_entities, doc_relations, doc_mapping
+        )
+
+        # 新实体批量向量化 (实体词表封闭，向量只需计算一次)
+        await self._embed_entities(destiny_type, category)
 
-        # 更新实体索引
-        self._update_entity_index(unique_entities, doc_mapping)
+        linked_docs = sum(1 for names in doc_mapping.values() if names)
+        relation_count = sum(len(relations) for relations in doc_relations.values())
 
-        # 生成社区摘要（如果有足够的实体）
-        if len(unique_entities) >= 5:
-            await self._generate_community_summary(destiny_type, category, unique_entities)
+        # 社区发现和摘要（如果有足够的实体）
+        communities = 0
+        if len(graph_entities) >= 5:
+            communities = await self._build_communities(destiny_type, category)
 
         logger.info(
             f"Graph built: {len(unique_entities)} entities, "
-            f"{len(all_relations)} relations, "
-            f"{len(doc_mapping)} documents"
+            f"{relation_count} relations, "
+            f"{linked_docs} documents, "
+            f"{communities} communities"
         )
 
         return {
             "entities": len(unique_entities),
-            "relations": len(all_relations),
-            "documents": len(doc_mapping)
+            "relations": relation_count,
+            "documents": linked_docs,
+            "communities": communities
         }
 
+    def get_stats(self) -> Dict[str, Any]:
+        """图谱统计 (存储各表行数、各分类内存图谱、抽取缓存)"""
+        return {
+            "store": self.graph_store.get_stats(),
+            "graphs": self.graph_index.get_stats(),
+            "extraction_cache": self.extraction_cache.get_stats(),
+        }
+
+    async def remove_documents(self, destiny_type: str, category: str, doc_ids: List[str]) -> int:
+        """
+        从图谱中移除文档 (知识删除时调用)
+
+        撤销文档的实体链接和关系来源，失去全部来源的关系和孤立实体随之删除；
+        社区划分保留到下次构建，检索时已删除文档不会再被打分。
+
+        Returns:
+            被移除的文档数
+        """
+        removed = await asyncio.to_thread(
+            self.graph_index.remove_documents, destiny_type, category, doc_ids
+        )
+        if removed:
+            logger.info(f"Removed {removed} documents from graph {destiny_type}/{category}")
+        return removed
+
+    def _batch_documents(self, documents: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+        """
+        将短文档合并为批次 (每批总长度和文档数都有上限)，长文档单独成批
+        """
+        max_chars = self.settings.graph_extraction_batch_chars
+        max_docs = self.settings.graph_extraction_batch_size
+
+        batches = []
+        current = []
+        current_chars = 0
+
+        for doc in documents:
+            length = len(doc.get("content", ""))
+
+            if length >= max_chars or max_docs <= 1:
+                batches.append([doc])
+                continue
+
+            if current and (current_chars + length > max_chars or len(current) >= max_docs):
+                batches.append(current)
+                current = []
+                current_chars = 0
+
+            current.append(doc)
+            current_chars += length
+
+        if current:
+            batches.append(current)
+
+        return batches
+
+    async def _extract_batch(
+        self,
+        batch: List[Dict[str, Any]],
+        semaphore: Optional[asyncio.Semaphore] = None
+    ) -> List[Tuple[str, List[Dict], List[Dict]]]:
+        """
+        抽取一批文档的实体和关系
+
+        先查抽取缓存，只有未命中的文档才调用 LLM (受并发信号量和限流约束)。
+
+        Returns:
+            [(doc_id, entities, relations)]，与 batch 顺序一致
+        """
+        model = self.settings.graph_extraction_model
+        llm_results: List[Optional[Dict[str, Any]]] = [None] * len(batch)
+
+        pending = []
+        for i, doc in enumerate(batch):
+            cached = self.extraction_cache.get(
+                model, EXTRACTION_PROMPT_VERSION, self._extraction_text(doc)
+            )
+            if cached is not None:
+                llm_results[i] = cached
+            else:
+                pending.append(i)
+
+        if pending:
+            pending_docs = [batch[i] for i in pending]
+            try:
+                async with semaphore or contextlib.nullcontext():
+                    await self._rate_limiter.acquire()
+                    if len(pending_docs) == 1:
+                        doc = pending_docs[0]
+                        extracted = [await self._llm_extract_entities_relations(
+                            doc.get("content", ""), doc.get("title", ""), doc.get("id", "")
+                        )]
+                    else:
+                        extracted = await self._llm_extract_batch(pending_docs)
+            except Exception as e:
+                logger.warning(f"LLM extraction failed, using rule-based only: {e}")
+                extracted = [None] * len(pending_docs)
+
+            # 只缓存成功解析的结果
+            for i, result in zip(pending, extracted):
+                if result is not None:
+                    self.extraction_cache.put(
+                        model, EXTRACTION_PROMPT_VERSION, self._extraction_text(batch[i]), result
+                    )
+                    llm_results[i] = result
+
+        return [
+            (
+                doc.get("id", ""),
+                *self._combine_extraction(doc, llm_result or {"entities": [], "relations": []})
+            )
+            for doc, llm_result in zip(batch, llm_results)
+        ]
+
+    def _extraction_text(self, doc: Dict[str, Any]) -> str:
+        """抽取缓存的内容键: 实际发送给 LLM 的标题和正文"""
+        return f"{doc.get('title', '')}\n{doc.get('content', '')[:3000]}"
+
     async def _extract_entities_relations(
         self,
         content: str,
@@ -144,46 +280,49 @@ class GraphRAGRetriever:
         - 实体：命名实体 + 类型 + 属性
         - 关系：实体之间的关系 + 关系类型
         """
+        doc = {"id": doc_id, "content": content, "title": title}
+        _, entities, relations = (await self._extract_batch([doc]))[0]
+        return entities, relations
+
+    def _combine_extraction(
+        self,
+        doc: Dict[str, Any],
+        llm_result: Dict[str, Any]
+    ) -> Tuple[List[Dict], List[Dict]]:
+        """合并规则抽取和 LLM 抽取的结果"""
+        content = doc.get("content", "")
+
         # 1. 先用规则快速提取已知实体
         rule_entities = self._extract_known_entities(content)
 
-        # 2. 用 LLM 提取未知实体和所有关系
-        try:
-            llm_result = await self._llm_extract_entities_relations(content, title, doc_id)
-            llm_entities = llm_result["entities"]
-            llm_relations = llm_result["relations"]
-        except Exception as e:
-            logger.warning(f"LLM extraction failed, using rule-based only: {e}")
-            llm_entities = []
-            llm_relations = []
-
-        # 3. 合并结果
-        entities = rule_entities + llm_entities
+        # 2. 合并 LLM 提取的未知实体和所有关系
+        entities = rule_entities + [dict(e) for e in llm_result.get("entities", [])]
 
-        # 4. 为每个实体添加来源
+        # 3. 为每个实体添加来源
         for entity in entities:
-            entity["doc_id"] = doc_id
-            entity["source"] = title
+            entity["doc_id"] = doc.get("id", "")
+            entity["source"] = doc.get("title", "")
 
-        # 5. 过滤掉太短或重复的实体
+        # 4. 过滤掉太短或重复的实体
         entities = [e for e in entities if len(e.get("name", "")) >= 2]
         entities = self._dedup_entities(entities)
 
-        return entities, llm_relations
+        return entities, llm_result.get("relations", [])
 
     def _extract_known_entities(self, content: str) -> List[Dict]:
-        """用规则快速提取已知实体"""
+        """用规则快速提取已知实体 (自动机单次扫描，每个实体取第一个类型)"""
         entities = []
-        content_lower = content.lower()
+        seen = set()
 
-        for entity_type, keywords in ENTITY_TYPES.items():
-            for keyword in keywords:
-                if keyword in content:
-                    entities.append({
-                        "name": keyword,
-                        "type": entity_type,
-                        "method": "rule"
-                    })
+        for match in self.entity_matcher.find(content, types=GRAPH_ENTITY_TYPES):
+            if match.name in seen:
+                continue
+            seen.add(match.name)
+            entities.append({
+                "name": match.name,
+                "type": match.types[0],
+                "method": "rule"
+            })
 
         return entities
 
@@ -192,8 +331,8 @@ class GraphRAGRetriever:
         content: str,
         title: str,
         doc_id: str
-    ) -> Dict[str, Any]:
-        """调用 LLM 提取实体和关系"""
+    ) -> Optional[Dict[str, Any]]:
+        """调用 LLM 提取实体和关系 (响应无法解析时返回 None)"""
 
         prompt = f"""从以下命理知识文档中提取实体和关系。
 
@@ -212,19 +351,83 @@ class GraphRAGRetriever:
   ]
 }}
 
-实体类型可选：星曜, 宫位, 四化, 格局, 十神, 用神, 五行, 天干, 地支, 概念, 其他
-关系类型可选：属, 位于, 同宫, 相生, 相克, 组成, 包含, 影响, 增强, 削弱, 相关
+{EXTRACTION_TYPE_HINT}
 
 只返回 JSON，不要其他内容。"""
 
+        result = await self._call_extraction_llm(prompt)
+        if result is None:
+            return None
+
+        return {
+            "entities": result.get("entities", []),
+            "relations": result.get("relations", [])
+        }
+
+    async def _llm_extract_batch(
+        self,
+        batch: List[Dict[str, Any]]
+    ) -> List[Optional[Dict[str, Any]]]:
+        """
+        一次 LLM 调用提取多篇短文档的实体和关系
+
+        Returns:
+            按文档顺序的结果，响应中缺失或无法解析的文档为 None
+        """
+        sections = "\n\n".join(
+            f"【文档 {i}】\n标题: {doc.get('title', '')}\n内容:\n{doc.get('content', '')[:3000]}"
+            for i, doc in enumerate(batch)
+        )
+
+        prompt = f"""从以下 {len(batch)} 篇命理知识文档中分别提取实体和关系。
+
+{sections}
+
+请以 JSON 格式返回结果，documents 中的 index 对应文档编号：
+
+{{
+  "documents": [
+    {{
+      "index": 0,
+      "entities": [
+        {{"name": "实体名", "type": "实体类型", "description": "简要描述"}}
+      ],
+      "relations": [
+        {{"source": "源实体", "target": "目标实体", "type": "关系类型", "description": "关系描述"}}
+      ]
+    }}
+  ]
+}}
+
+{EXTRACTION_TYPE_HINT}
+
+只返回 JSON，不要其他内容。"""
+
+        results: List[Optional[Dict[str, Any]]] = [None] * len(batch)
+
+        result = await self._call_extraction_llm(prompt)
+        if result is None:
+            return results
+
+        for item in result.get("documents", []):
+            index = item.get("index")
+            if isinstance(index, int) and 0 <= index < len(batch):
+                results[index] = {
+                    "entities": item.get("entities", []),
+                    "relations": item.get("relations", [])
+                }
+
+        return results
+
+    async def _call_extraction_llm(self, prompt: str) -> Optional[Dict[str, Any]]:
+        """调用 LLM 并解析 JSON 结果，解析失败返回 None"""
         response = await self.llm_client.chat.completions.create(
-            model="gpt-3.5-turbo",
+            model=self.settings.graph_extraction_model,
             messages=[{"role": "user", "content": prompt}],
             temperature=0.1,
             max_tokens=2000
         )
 
-        import json as json_lib
         result_text = response.choices[0].message.content
 
         # 清理可能的 markdown 格式
@@ -235,14 +438,10 @@ class GraphRAGRetriever:
             result_text = result_text[:-3]
 
         try:
-            result = json_lib.loads(result_text)
-            return {
-                "entities": result.get("entities", []),
-                "relations": result.get("relations", [])
-            }
-        except json_lib.JSONDecodeError as e:
+            return json.loads(result_text)
+        except json.JSONDecodeError as e:
             logger.error(f"Failed to parse LLM response: {e}")
-            return {"entities": [], "relations": []}
+            return None
 
     def _dedup_entities(self, entities: List[Dict]) -> List[Dict]:
         """去重实体"""
@@ -257,76 +456,171 @@ class GraphRAGRetriever:
 
         return result
 
-    async def _save_graph(
+    async def _embed_entities(self, destiny_type: str, category: str):
+        """为尚无向量的实体批量计算向量，写入实体向量表 (失败不影响图谱)"""
+        entities = self.graph_index.entities_without_embeddings(destiny_type, category)
+        if not entities:
+            return
+
+        batch_size = self.settings.index_batch_size
+        try:
+            for start in range(0, len(entities), batch_size):
+                batch = entities[start:start + batch_size]
+                vectors = await self.embedding.encode_async([
+                    self._entity_text(entity) for entity in batch
+                ])
+                await asyncio.to_thread(
+                    self.graph_index.set_entity_embeddings,
+                    destiny_type, category, [entity["name"] for entity in batch], vectors
+                )
+        except Exception as e:
+            logger.warning(f"Entity embedding failed for {destiny_type}/{category}: {e}")
+            return
+
+        logger.debug(f"Embedded {len(entities)} entities for {destiny_type}/{category}")
+
+    @staticmethod
+    def _entity_text(entity: Dict) -> str:
+        """实体向量化文本: 名称 + 类型 + 描述"""
+        text = f"{entity['name']} ({entity.get('type', '其他')})"
+        description = entity.get("description", "")
+        return f"{text}: {description}" if description else text
+
+    async def _build_communities(self, destiny_type: str, category: str) -> int:
+        """
+        社区发现 + 社区摘要
+
+        1. 在分类图谱上做标签传播社区发现
+        2. 成员未变化的社区复用已有摘要，其余社区由 LLM 生成摘要 (与抽取共用并发和限流)
+        3. 摘要写入图谱存储，并向量化写入该命理类型的社区摘要集合
+
+        Returns:
+            社区数
+        """
+        members_list = await asyncio.to_thread(
+            self.graph_index.detect_communities,
+            destiny_type, category, self.settings.graph_community_min_size
+        )
+
+        previous = {
+            frozenset(c["entities"]): c["summary"]
+            for c in await asyncio.to_thread(
+                self.graph_store.get_communities, destiny_type, category
+            )
+        }
+
+        pending = [members for members in members_list if frozenset(members) not in previous]
+        semaphore = asyncio.Semaphore(self.settings.graph_extraction_concurrency)
+        generated = await asyncio.gather(*[
+            self._summarize_community(destiny_type, category, members, semaphore)
+            for members in pending
+        ])
+        summaries = {**previous, **dict(zip(map(frozenset, pending), generated))}
+
+        communities = []
+        for i, members in enumerate(members_list):
+            types = [
+                self.graph_index.get_entity(destiny_type, category, name).get("type", "其他")
+                for name in members
+            ]
+            communities.append({
+                "id": f"{destiny_type}_{category}_c{i}",
+                "type": max(set(types), key=types.count),
+                "entities": members,
+                "summary": summaries[frozenset(members)]
+            })
+
+        await asyncio.to_thread(
+            self.graph_store.replace_communities, destiny_type, category, communities
+        )
+        await self._index_community_summaries(destiny_type, category, communities)
+
+        # 社区重建完成后失效检索缓存 (后台构建晚于向量/BM25 写入时的版本递增)
+        bump_index_version()
+
+        logger.debug(f"Built {len(communities)} communities for {destiny_type}/{category}")
+        return len(communities)
+
+    async def _summarize_community(
         self,
         destiny_type: str,
         category: str,
-        entities: List[Dict],
-        relations: List[Dict]
-    ):
-        """保存图谱到文件"""
-        graph_file = self.graph_dir / f"{destiny_type}_{category}_graph.json"
-
-        graph_data = {
-            "destiny_type": destiny_type,
-            "category": category,
-            "entities": entities,
-            "relations": relations,
-            "updated_at": str(Path(__file__).stat().st_mtime) if False else ""
-        }
+        members: List[str],
+        semaphore: asyncio.Semaphore
+    ) -> str:
+        """LLM 生成社区摘要，失败时退化为成员列表"""
+        fallback = f"{', '.join(members[:10])} 等实体组成的社区"
+
+        lines = []
+        for name in members[:30]:
+            entity = self.graph_index.get_entity(destiny_type, category, name)
+            description = entity.get("description", "")
+            lines.append(
+                f"- {name} ({entity.get('type', '其他')})" + (f": {description}" if description else "")
+            )
+        relations = [
+            f"- {r['source']} -[{r.get('type', '相关')}]-> {r['target']}"
+            for r in self.graph_index.get_relations_among(destiny_type, category, members)[:40]
+        ]
 
-        with open(graph_file, 'w', encoding='utf-8') as f:
-            json.dump(graph_data, f, ensure_ascii=False, indent=2)
+        prompt = f"""以下实体在命理知识图谱中构成一个社区，请用 2-3 句话概括该社区讨论的主题和核心知识点。
 
-        logger.debug(f"Saved graph to {graph_file}")
+实体：
+{chr(10).join(lines)}
 
-    def _update_entity_index(
-        self,
-        entities: List[Dict],
-        doc_mapping: Dict[str, List[str]]
-    ):
-        """更新实体索引"""
-        for entity in entities:
-            entity_name = entity.get("name", "")
-            for doc_id, entity_names in doc_mapping.items():
-                if entity_name in entity_names:
-                    if entity_name not in self._entity_index:
-                        self._entity_index[entity_name] = []
-                    if doc_id not in self._entity_index[entity_name]:
-                        self._entity_index[entity_name].append(doc_id)
-
-    async def _generate_community_summary(
+关系：
+{chr(10).join(relations) or "（无显式关系，实体在同一文档中共同出现）"}
+
+只返回摘要文本。"""
+
+        try:
+            async with semaphore:
+                await self._rate_limiter.acquire()
+                response = await self.llm_client.chat.completions.create(
+                    model=self.settings.graph_extraction_model,
+                    messages=[{"role": "user", "content": prompt}],
+                    temperature=0.3,
+                    max_tokens=300
+                )
+            summary = (response.choices[0].message.content or "").strip()
+            return summary or fallback
+        except Exception as e:
+            logger.warning(f"Community summary failed, using member list: {e}")
+            return fallback
+
+    async def _index_community_summaries(
         self,
         destiny_type: str,
         category: str,
-        entities: List[Dict]
+        communities: List[Dict]
     ):
-        """生成社区摘要"""
-        # 简单聚类：根据实体类型分组
-        communities = {}
-        for entity in entities:
-            entity_type = entity.get("type", "其他")
-            if entity_type not in communities:
-                communities[entity_type] = []
-            communities[entity_type].append(entity.get("name", ""))
-
-        # 生成摘要
-        summaries = []
-        for entity_type, names in communities.items():
-            summary = f"{entity_type}相关实体: {', '.join(names[:10])}"
-            summaries.append({
-                "id": f"{destiny_type}_{category}_{entity_type}",
-                "type": entity_type,
-                "entities": names,
-                "summary": summary
-            })
+        """向量化社区摘要，替换社区摘要集合中该分类的条目"""
+        await asyncio.to_thread(
+            self.chroma.delete, destiny_type, COMMUNITY_CATEGORY, where={"category": category}
+        )
+        if not communities:
+            return
 
-        # 保存
-        summary_file = self.graph_dir / f"{destiny_type}_{category}_communities.json"
-        with open(summary_file, 'w', encoding='utf-8') as f:
-            json.dump(summaries, f, ensure_ascii=False, indent=2)
+        summaries = [c["summary"] for c in communities]
+        embeddings = await self.embedding.encode_async(summaries)
 
-        logger.debug(f"Generated {len(summaries)} community summaries")
+        await asyncio.to_thread(
+            self.chroma.add_documents,
+            destiny_type=destiny_type,
+            category=COMMUNITY_CATEGORY,
+            documents=summaries,
+            embeddings=embeddings,
+            ids=[c["id"] for c in communities],
+            metadatas=[
+                {
+                    "destiny_type": destiny_type,
+                    "category": category,
+                    "title": f"{c['type']}社区: {', '.join(c['entities'][:5])}",
+                }
+                for c in communities
+            ],
+            invalidate_cache=False
+        )
 
     # ==================== 检索 ====================
 
@@ -337,7 +631,8 @@ class GraphRAGRetriever:
         destiny_types: List[str],
         categories: Optional[List[str]] = None,
         top_k: int = 10,
-        entities: Optional[List[str]] = None
+        entities: Optional[List[str]] = None,
+        deadline: Optional[Deadline] = None
     ) -> List[SearchResult]:
         """
         GraphRAG 检索
@@ -349,14 +644,41 @@ class GraphRAGRetriever:
             categories: 子分类列表
             top_k: 返回数量
             entities: 涉及实体
+            deadline: 请求截止时间 (图谱分支超时返回空结果)
 
         Returns:
             检索结果列表
         """
+        candidates = await self.search_candidates(
+            query=query,
+            strategy=strategy,
+            destiny_types=destiny_types,
+            categories=categories,
+            top_k=top_k,
+            entities=entities,
+            deadline=deadline
+        )
+        return to_search_results(candidates)
+
+    async def search_candidates(
+        self,
+        query: str,
+        strategy: RetrievalStrategy,
+        destiny_types: List[str],
+        categories: Optional[List[str]] = None,
+        top_k: int = 10,
+        entities: Optional[List[str]] = None,
+        deadline: Optional[Deadline] = None
+    ) -> List[Candidate]:
+        """GraphRAG 检索 (内部候选结构，参数同 search)"""
+        deadline = deadline or Deadline()
+
         if strategy == RetrievalStrategy.GRAPH_GLOBAL:
-            return await self._global_search(query, destiny_types, categories, top_k, entities)
+            search = self._global_search(query, destiny_types, categories, top_k, deadline)
         else:
-            return await self._local_search(query, destiny_types, categories, top_k, entities)
+            search = self._local_search(query, destiny_types, categories, top_k, entities, deadline)
+
+        return await deadline.run("graph", search, default=[])
 
     async def _local_search(
         self,
@@ -364,38 +686,113 @@ class GraphRAGRetriever:
         destiny_types: List[str],
         categories: Optional[List[str]] = None,
         top_k: int = 10,
-        entities: Optional[List[str]] = None
-    ) -> List[SearchResult]:
+        entities: Optional[List[str]] = None,
+        deadline: Optional[Deadline] = None
+    ) -> List[Candidate]:
         """
         局部检索 - 基于实体的邻居检索
 
         流程:
-        1. 提取查询中的实体
-        2. 查找实体的邻居节点
-        3. 检索相关内容
+        1. 提取查询中的实体 (不在图谱中时，用预计算的实体向量表匹配最相近的实体)
+        2. 在图谱内存索引中做多跳邻居扩展，按跳数给关联文档打分
+           (种子全是热点实体时直接读取物化表，不做扩展)
+        3. 按 ID 批量获取文档内容
         """
         # 如果没有提供实体，尝试从查询中提取
         if not entities:
             entities = self._extract_entities_from_query(query)
 
-        # 如果还是没有实体，降级到向量检索
-        if not entities:
-            logger.debug("No entities found, falling back to vector search")
-            return await self._fallback_to_vector(query, destiny_types, categories, top_k)
+        # 查询向量只在需要按实体向量表匹配种子时计算一次
+        query_embedding = None
 
-        all_results = []
+        # [(score, destiny_type, category, doc_id)]
+        scored = []
+        for dt in destiny_types:
+            for cat in categories or self._get_all_categories(dt):
+                hot = self.graph_index.hot_documents(dt, cat, entities or [], top_k)
+                if hot is not None:
+                    scored.extend((score, dt, cat, doc_id) for doc_id, score in hot)
+                    continue
+
+                distances = self._expand(dt, cat, entities)
+
+                # 查询实体不在该分类图谱中: 用预计算的实体向量表找最相近的实体作为种子
+                if not distances and self.graph_index.has_entity_embeddings(dt, cat):
+                    if query_embedding is None:
+                        query_embedding = (await self.embedding.encode_async([query]))[0]
+                    seeds = self.graph_index.nearest_entities(
+                        dt, cat, query_embedding,
+                        top_k=self.settings.graph_entity_seed_k,
+                        threshold=self.settings.graph_entity_seed_threshold
+                    )
+                    distances = self._expand(dt, cat, [name for name, _ in seeds])
+
+                doc_scores = self.graph_index.score_documents(
+                    dt, cat, distances, hop_decay=self.settings.graph_hop_decay
+                )
+                scored.extend((score, dt, cat, doc_id) for doc_id, score in doc_scores.items())
 
-        for entity in entities:
-            # 查找实体的关联内容
-            entity_results = await self._search_entity_neighbors(
-                entity, destiny_types, categories, top_k
+        # 图谱中没有这些实体 (或尚未构建图谱)，降级到向量检索
+        if not scored:
+            logger.debug("No graph neighbors found, falling back to vector search")
+            return await self._fallback_to_vector(
+                query, RetrievalStrategy.GRAPH_LOCAL, destiny_types, categories, top_k, deadline
             )
-            all_results.extend(entity_results)
 
-        # 去重并排序
-        merged = self._merge_results(all_results)
+        scored.sort(key=lambda x: x[0], reverse=True)
+        return await self._fetch_candidates(scored[:top_k])
+
+    def _expand(self, destiny_type: str, category: str, seeds: List[str]) -> Dict[str, int]:
+        """在分类图谱中从种子实体做多跳扩展"""
+        if not seeds:
+            return {}
+        return self.graph_index.expand(
+            destiny_type, category, seeds,
+            hops=self.settings.graph_local_hops,
+            neighbor_limit=self.settings.graph_neighbor_limit
+        )
 
-        return merged[:top_k]
+    async def _fetch_candidates(
+        self,
+        scored: List[Tuple[float, str, str, str]]
+    ) -> List[Candidate]:
+        """
+        按 ID 批量获取文档并构造候选 (每个集合一次 get)
+
+        Args:
+            scored: [(score, destiny_type, category, doc_id)]，按分数降序
+
+        Returns:
+            候选列表，保持输入顺序；集合中已不存在的文档被跳过
+        """
+        collections: Dict[Tuple[str, str], List[str]] = {}
+        for _, dt, cat, doc_id in scored:
+            collections.setdefault((dt, cat), []).append(doc_id)
+
+        keys = list(collections)
+        fetched = await asyncio.gather(*[
+            asyncio.to_thread(self.chroma.get_documents, dt, cat, collections[(dt, cat)])
+            for dt, cat in keys
+        ])
+        documents = dict(zip(keys, fetched))
+
+        candidates = []
+        for score, dt, cat, doc_id in scored:
+            doc = documents[(dt, cat)].get(doc_id)
+            if doc is None:
+                continue
+            candidates.append(Candidate(
+                destiny_type=dt,
+                category=cat,
+                id=doc_id,
+                score=score,
+                source="graph",
+                content=doc["content"],
+                title=doc["title"],
+                level=doc["level"]
+            ))
+
+        return candidates
 
     async def _global_search(
         self,
@@ -403,208 +800,119 @@ class GraphRAGRetriever:
         destiny_types: List[str],
         categories: Optional[List[str]] = None,
         top_k: int = 5,
-        entities: Optional[List[str]] = None
-    ) -> List[SearchResult]:
+        deadline: Optional[Deadline] = None
+    ) -> List[Candidate]:
         """
         全局检索 - 基于社区摘要的检索
 
         流程:
-        1. 将查询与社区摘要进行匹配
-        2. 找到最相关的社区
-        3. 返回社区内的所有相关内容
+        1. 在社区摘要集合中对查询做 ANN 检索，找到最相关的社区
+        2. 社区成员实体 -> 关联文档 (图谱内存索引)，文档分数乘以社区相似度
+        3. 按 ID 批量获取文档内容
         """
-        # 查询向量化
-        query_embedding = self.embedding.encode_single(query)
-
-        all_results = []
-
-        for dt in destiny_types:
-            # 获取该类型的社区摘要
-            community_summaries = self._get_community_summaries(dt)
-
-            # 匹配最相关的社区
-            relevant_communities = self._match_communities(
-                query, query_embedding, community_summaries, top_k=3
-            )
-
-            # 检索相关社区的内容
-            for community_id in relevant_communities:
-                community_results = self._search_community(
-                    dt, community_id, query, query_embedding, top_k
+        query_embedding = (await self.embedding.encode_async([query]))[0]
+        where = {"category": {"$in": categories}} if categories else None
+
+        hits = await asyncio.gather(*[
+            asyncio.to_thread(self._match_communities, dt, query_embedding, where)
+            for dt in destiny_types
+        ])
+
+        # {(destiny_type, category, doc_id): score}，同一文档取最高分
+        doc_scores: Dict[Tuple[str, str, str], float] = {}
+        for dt, communities in zip(destiny_types, hits):
+            for community, similarity in communities:
+                cat = community["category"]
+                scores = self.graph_index.score_documents(
+                    dt, cat, {name: 0 for name in community["entities"]},
+                    hop_decay=self.settings.graph_hop_decay
                 )
-                all_results.extend(community_results)
-
-        # 排序
-        all_results.sort(key=lambda x: x.score, reverse=True)
+                for doc_id, score in scores.items():
+                    key = (dt, cat, doc_id)
+                    doc_scores[key] = max(doc_scores.get(key, 0.0), similarity * score)
+
+        if not doc_scores:
+            logger.debug("No matching communities, falling back to vector search")
+            return await self._fallback_to_vector(
+                query, RetrievalStrategy.GRAPH_GLOBAL, destiny_types, categories, top_k, deadline
+            )
 
-        return all_results[:top_k]
+        scored = sorted(
+            ((score, dt, cat, doc_id) for (dt, cat, doc_id), score in doc_scores.items()),
+            key=lambda x: x[0],
+            reverse=True
+        )
+        return await self._fetch_candidates(scored[:top_k])
 
     def _extract_entities_from_query(self, query: str) -> List[str]:
-        """从查询中提取实体"""
-        entities = []
-
-        # 紫微斗数实体
-        ziwei_entities = [
-            "紫微", "天机", "太阳", "武曲", "天同", "廉贞",
-            "天府", "太阴", "贪狼", "巨门", "天相", "天梁",
-            "七杀", "破军", "命宫", "官禄宫", "财帛宫",
-            "夫妻宫", "化禄", "化权", "化科", "化忌"
-        ]
-
-        # 八字实体
-        bazi_entities = [
-            "日主", "用神", "喜神", "忌神", "正官", "七杀",
-            "正财", "偏财", "正印", "偏印", "身强", "身弱"
-        ]
-
-        all_entities = ziwei_entities + bazi_entities
-
-        for entity in all_entities:
-            if entity in query:
-                entities.append(entity)
-
-        return list(set(entities))
-
-    async def _search_entity_neighbors(
-        self,
-        entity: str,
-        destiny_types: List[str],
-        categories: Optional[List[str]],
-        top_k: int
-    ) -> List[SearchResult]:
-        """搜索实体的邻居节点"""
-        results = []
-
-        # 1. 检索包含该实体的文档
-        query_embedding = self.embedding.encode_single(entity)
-
-        for dt in destiny_types:
-            cats = categories if categories else self._get_all_categories(dt)
-
-            for cat in cats:
-                # 在元数据中搜索 (Chroma 不直接支持这种搜索)
-                # 降级：使用实体作为查询词
-                cat_results = self.chroma.search(
-                    destiny_type=dt,
-                    category=cat,
-                    query=entity,
-                    query_embedding=query_embedding,
-                    n_results=top_k
-                )
-                results.extend(cat_results)
-
-        return results
+        """从查询中提取实体 (与查询路由使用同一词表)"""
+        return self.entity_matcher.extract(query, types=ROUTER_ENTITY_TYPES)
 
     def _match_communities(
-        self,
-        query: str,
-        query_embedding: List[float],
-        community_summaries: List[Dict],
-        top_k: int = 3
-    ) -> List[str]:
-        """匹配最相关的社区"""
-        # 简化：基于社区摘要的标题和描述匹配
-        relevant = []
-
-        for community in community_summaries:
-            summary = community.get("summary", "")
-            title = community.get("title", "")
-
-            # 简单的关键词匹配
-            score = 0
-            query_words = set(query)
-            content_words = set(summary + title)
-
-            overlap = query_words & content_words
-            score = len(overlap) / max(len(query_words), 1)
-
-            if score > 0:
-                relevant.append((community.get("id"), score))
-
-        # 排序并返回 top_k
-        relevant.sort(key=lambda x: x[1], reverse=True)
-
-        return [c[0] for c in relevant[:top_k]]
-
-    def _search_community(
         self,
         destiny_type: str,
-        community_id: str,
-        query: str,
         query_embedding: List[float],
-        top_k: int
-    ) -> List[SearchResult]:
-        """搜索社区内的内容"""
-        # 获取社区内的文档
-        results = self.chroma.search(
-            destiny_type=destiny_type,
-            category="general",  # 简化：使用 general 分类
-            query=query,
-            query_embedding=query_embedding,
-            n_results=top_k
-        )
-
-        return results
-
-    def _get_community_summaries(self, destiny_type: str) -> List[Dict]:
-        """获取社区摘要"""
-        summary_file = self.graph_dir / f"{destiny_type}_communities.json"
-
-        if not summary_file.exists():
-            return []
+        where: Optional[Dict] = None
+    ) -> List[Tuple[Dict, float]]:
+        """
+        ANN 检索最相关的社区摘要
 
+        Returns:
+            [(社区, 相似度)]，按相似度降序
+        """
         try:
-            with open(summary_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            hits = self.chroma.search_ids(
+                destiny_type,
+                COMMUNITY_CATEGORY,
+                query_embedding,
+                n_results=self.settings.graph_global_communities,
+                where=where
+            )
         except Exception as e:
-            logger.error(f"Error loading community summaries: {e}")
+            logger.debug(f"No community summaries for {destiny_type}: {e}")
             return []
 
-    def _merge_results(self, results: List[SearchResult]) -> List[SearchResult]:
-        """合并去重结果"""
-        seen = {}
-        merged = []
-
-        for r in results:
-            key = f"{r.destiny_type}:{r.category}:{r.id}"
-            if key not in seen:
-                seen[key] = True
-                merged.append(r)
-
-        # 按分数排序
-        merged.sort(key=lambda x: x.score, reverse=True)
+        if not hits:
+            return []
 
-        return merged
+        communities = {
+            c["id"]: c
+            for c in self.graph_store.get_communities(
+                destiny_type, ids=[community_id for community_id, _ in hits]
+            )
+        }
+        return [
+            (communities[community_id], similarity)
+            for community_id, similarity in hits
+            if community_id in communities
+        ]
 
     async def _fallback_to_vector(
         self,
         query: str,
+        strategy: RetrievalStrategy,
         destiny_types: List[str],
         categories: Optional[List[str]],
-        top_k: int
-    ) -> List[SearchResult]:
-        """降级到向量检索"""
+        top_k: int,
+        deadline: Optional[Deadline] = None
+    ) -> List[Candidate]:
+        """降级到向量检索 (沿用原检索策略的重排序候选预算)"""
         from ..services.hybrid_retriever import get_hybrid_retriever
 
         hybrid = get_hybrid_retriever()
-        return await hybrid.search(
+        return await hybrid.search_candidates(
             query=query,
             destiny_types=destiny_types,
             categories=categories,
-            top_k=top_k
+            top_k=top_k,
+            strategy=strategy,
+            deadline=deadline
         )
 
     def _get_all_categories(self, destiny_type: str) -> List[str]:
-        """获取所有分类"""
-        categories = {
-            "shared": ["basic"],
-            "ziwei": ["palace", "star", "transformation", "fortune", "pattern"],
-            "bazi": ["structure", "yongshen", "ten_gods", "dayun"],
-            "qimen": ["nine_star", "eight_door", "eight_god", "formation"],
-            "liuyao": ["gua", "liuyao_yongshen", "shiyin"],
-            "shouxiang": ["palm", "finger", "mount", "line"],
-        }
-        return categories.get(destiny_type, ["general"])
+        """获取所有分类 (未知命理类型没有图谱分类)"""
+        config = DESTINY_TYPES.get(destiny_type)
+        return list(config["collections"]) if config else []
 
 
 # 单例实例
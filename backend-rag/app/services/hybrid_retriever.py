@@ -2,17 +2,23 @@
 混合检索器
 结合向量检索、BM25 关键词检索和 GraphRAG 图谱构建
 """
-from typing import List, Optional, Tuple
+import asyncio
+from typing import List, Optional, Tuple, Dict, Set
 from loguru import logger
 
-from ..config import get_settings
-from ..models.enums import RetrievalStrategy
-from ..models.schemas import SearchResult, RerankedResult
+from ..config import get_settings, RETRIEVAL_STRATEGIES
+from ..models.enums import RetrievalStrategy, FusionMode
+from ..models.schemas import SearchResult
+from ..models.candidate import Candidate, CandidateKey, to_search_results
 from ..services.chroma_service import get_chroma_service
 from ..services.bm25_service import get_bm25_service
 from ..services.embedding_service import get_embedding_service
 from ..services.reranker_service import get_reranker_service
 from ..services.graphrag_retriever import get_graphrag_retriever
+from ..services.fusion import fuse, merge_sorted
+from ..services.deadline import Deadline
+from ..services.category_router import get_category_router
+from ..services.result_cache import bump_index_version
 
 
 class HybridRetriever:
@@ -25,17 +31,25 @@ class HybridRetriever:
         self.embedding = get_embedding_service()
         self.reranker = get_reranker_service()
         self.graphrag = get_graphrag_retriever()
+        self.category_router = get_category_router()
+
+        # 后台图谱构建任务
+        self._graph_tasks: Set[asyncio.Task] = set()
 
         # 权重配置
         self.vector_weight = self.settings.hybrid_vector_weight
         self.keyword_weight = self.settings.hybrid_keyword_weight
+        self.fusion_mode = FusionMode(self.settings.fusion_mode)
 
     async def search(
         self,
         query: str,
         destiny_types: List[str],
         categories: Optional[List[str]] = None,
-        top_k: int = 10
+        top_k: int = 10,
+        strategy: RetrievalStrategy = RetrievalStrategy.HYBRID_VECTOR,
+        fusion: Optional[FusionMode] = None,
+        deadline: Optional[Deadline] = None
     ) -> List[SearchResult]:
         """
         混合检索
@@ -45,85 +59,305 @@ class HybridRetriever:
             destiny_types: 命理类型列表
             categories: 子分类列表 (None 表示全部)
             top_k: 返回数量
+            strategy: 调用方的检索策略 (决定重排序候选预算)
+            fusion: 融合方式 (None 使用配置默认值)
+            deadline: 请求截止时间 (超时分支被丢弃并记录在 deadline 上)
 
         Returns:
             检索结果列表
         """
-        # 并行执行向量检索和 BM25 检索
-        vector_results, bm25_results = await self._parallel_search(
-            query, destiny_types, categories, top_k
+        candidates = await self.search_candidates(
+            query=query,
+            destiny_types=destiny_types,
+            categories=categories,
+            top_k=top_k,
+            strategy=strategy,
+            fusion=fusion,
+            deadline=deadline
         )
+        return to_search_results(candidates)
 
-        # 融合结果
-        fused = self._fuse_results(vector_results, bm25_results)
+    async def search_candidates(
+        self,
+        query: str,
+        destiny_types: List[str],
+        categories: Optional[List[str]] = None,
+        top_k: int = 10,
+        strategy: RetrievalStrategy = RetrievalStrategy.HYBRID_VECTOR,
+        fusion: Optional[FusionMode] = None,
+        deadline: Optional[Deadline] = None,
+        query_embedding: Optional[List[float]] = None,
+        query_tokens: Optional[List[str]] = None
+    ) -> List[Candidate]:
+        """
+        混合检索 (内部候选结构，参数同 search)
 
-        # 重排序
-        reranked = await self.reranker.rerank(query, fused, top_k)
+        query_embedding / query_tokens 可由调用方预先计算并在多次检索间共享。
+        """
+        deadline = deadline or Deadline()
 
-        # 返回结果
-        return [r.result for r in reranked]
+        query_embedding, query_tokens = await self.prepare_query(
+            query, deadline, query_embedding, query_tokens
+        )
 
-    async def _parallel_search(
+        # 级联重排序: 一阶段融合分数截取候选预算，再交给 Cross-Encoder
+        budget = self.candidate_budget(strategy, top_k)
+
+        candidates = await self.retrieve(
+            destiny_types=destiny_types,
+            categories=categories,
+            top_k=top_k,
+            limit=budget,
+            fusion=fusion,
+            deadline=deadline,
+            query_embedding=query_embedding,
+            query_tokens=query_tokens
+        )
+
+        logger.debug(f"Rerank budget for {strategy}: {len(candidates)} candidates")
+
+        return await self.rerank_candidates(query, candidates, top_k, deadline)
+
+    async def prepare_query(
         self,
         query: str,
+        deadline: Deadline,
+        query_embedding: Optional[List[float]] = None,
+        query_tokens: Optional[List[str]] = None
+    ) -> Tuple[Optional[List[float]], List[str]]:
+        """
+        查询预处理: 向量化 + 分词 (已提供的部分直接复用)
+
+        向量化只能使用一部分剩余预算，超时只丢弃向量分支，BM25 分支仍有时间返回结果；
+        向量分支已被上游丢弃时不再重试。
+
+        Returns:
+            (查询向量，向量化失败或超时为 None, 查询分词)
+        """
+        if query_embedding is None and "vector" not in deadline.dropped_sources:
+            query_embedding = await deadline.run(
+                "vector", self._embed_query(query, deadline), default=None,
+                ratio=self.settings.query_embedding_budget_ratio
+            )
+        if query_tokens is None:
+            query_tokens = self.bm25.tokenize(query)
+        return query_embedding, query_tokens
+
+    async def retrieve(
+        self,
         destiny_types: List[str],
         categories: Optional[List[str]],
-        top_k: int
-    ) -> Tuple[List[SearchResult], List[SearchResult]]:
-        """并行执行两种检索"""
-        import asyncio
+        top_k: int,
+        limit: int,
+        fusion: Optional[FusionMode],
+        deadline: Deadline,
+        query_embedding: Optional[List[float]],
+        query_tokens: List[str]
+    ) -> List[Candidate]:
+        """
+        一阶段检索: 分类预路由 → 向量/BM25 并行检索 → 融合 → 获取内容 (不重排序)
+
+        获取内容在线程中执行并受截止时间约束，超时则返回不含内容的候选 (保持融合顺序)。
+
+        Args:
+            top_k: 每个集合的检索数量
+            limit: 融合后保留的候选数
+        """
+        # 分类预路由: 未指定分类时只检索预测的相关分类
+        routed, remaining = await self._route_collections(
+            destiny_types, categories, query_tokens, query_embedding, deadline
+        )
+
+        # 并行执行向量检索和 BM25 检索 (只取 ID 和分数)
+        vector_hits, bm25_hits = await self._parallel_search(
+            query_tokens, query_embedding, routed, top_k, deadline
+        )
+
+        # 召回兜底: 预测分类的命中不足 top_k 时补查其余分类
+        if remaining and self._count_hits(vector_hits, bm25_hits) < top_k:
+            logger.debug(f"Category routing recall fallback: {len(remaining)} collections")
+            extra_vector, extra_bm25 = await self._parallel_search(
+                query_tokens, query_embedding, remaining, top_k, deadline
+            )
+            vector_hits = merge_sorted([vector_hits, extra_vector])
+            bm25_hits = merge_sorted([bm25_hits, extra_bm25])
+
+        # 融合结果 (只取 limit 个候选)
+        fused = self._fuse_results(vector_hits, bm25_hits, fusion or self.fusion_mode, limit)
+
+        # 只为进入重排序的候选批量获取内容
+        documents = await deadline.run(
+            "hydrate", asyncio.to_thread(self._fetch_documents, fused), default=None
+        )
+        return self._hydrate(fused, documents)
+
+    async def rerank_candidates(
+        self,
+        query: str,
+        candidates: List[Candidate],
+        top_k: int,
+        deadline: Deadline,
+        early_stop: bool = True,
+        force: bool = False
+    ) -> List[Candidate]:
+        """在剩余预算内重排序，超时退回一阶段融合顺序"""
+        reranked = await deadline.run(
+            "rerank",
+            self.reranker.rerank(query, candidates, top_k, early_stop=early_stop, force=force)
+        )
+
+        if reranked is None:
+            return candidates[:top_k]
+
+        return reranked
 
-        # 向量化查询
-        query_embedding = self.embedding.encode_single(query)
+    def candidate_budget(self, strategy: RetrievalStrategy, top_k: int) -> int:
+        """按策略配置和重排序实测吞吐计算候选预算"""
+        config = RETRIEVAL_STRATEGIES.get(strategy.value, {})
+        min_candidates = config.get("rerank_min_candidates", top_k * 2)
+        max_candidates = config.get("rerank_max_candidates", top_k * 5)
+        latency_ms = config.get("rerank_latency_ms", 150)
 
-        # 创建检索任务
-        vector_tasks = []
-        bm25_tasks = []
+        budget = self.reranker.candidate_budget(latency_ms, min_candidates, max_candidates)
+        return max(budget, top_k)
 
+    async def _route_collections(
+        self,
+        destiny_types: List[str],
+        categories: Optional[List[str]],
+        query_tokens: List[str],
+        query_embedding: Optional[List[float]],
+        deadline: Deadline
+    ) -> Tuple[List[Tuple[str, str]], List[Tuple[str, str]]]:
+        """
+        确定要检索的集合
+
+        分类预路由可能触发 BM25 索引的冷加载 (分词 + 建索引)，在线程中执行，
+        且只使用一部分剩余预算，超时则检索全部分类。
+
+        Returns:
+            (预测相关的集合, 召回兜底时补查的其余集合)
+        """
+        if categories:
+            return [(dt, cat) for dt in destiny_types for cat in categories], []
+
+        if not self.settings.category_routing_enabled:
+            return [(dt, cat) for dt in destiny_types for cat in self._get_all_categories(dt)], []
+
+        return await deadline.run(
+            "route",
+            asyncio.to_thread(self._route_categories, destiny_types, query_tokens, query_embedding),
+            default=(
+                [(dt, cat) for dt in destiny_types for cat in self._get_all_categories(dt)], []
+            ),
+            ratio=self.settings.category_route_budget_ratio
+        )
+
+    def _route_categories(
+        self,
+        destiny_types: List[str],
+        query_tokens: List[str],
+        query_embedding: Optional[List[float]]
+    ) -> Tuple[List[Tuple[str, str]], List[Tuple[str, str]]]:
+        """按分类预路由拆分集合 (阻塞，在线程中调用)"""
+        routed = []
+        remaining = []
         for dt in destiny_types:
             # 如果没有指定分类，获取该类型的所有分类
-            cats = categories if categories else self._get_all_categories(dt)
+            all_categories = self._get_all_categories(dt)
+
+            selected = None
+            if len(all_categories) > 1:
+                selected = self.category_router.route(dt, query_tokens, query_embedding)
+
+            if not selected:
+                routed.extend((dt, cat) for cat in all_categories)
+                continue
+
+            routed.extend((dt, cat) for cat in selected)
+            remaining.extend((dt, cat) for cat in all_categories if cat not in selected)
 
-            for cat in cats:
-                vector_tasks.append(self._vector_search(dt, cat, query, query_embedding, top_k))
-                bm25_tasks.append(self._bm25_search(dt, cat, query, top_k))
+        return routed, remaining
 
-        # 并行执行
-        vector_results_list, bm25_results_list = await asyncio.gather(
-            asyncio.gather(*vector_tasks),
-            asyncio.gather(*bm25_tasks)
+    @staticmethod
+    def _count_hits(*hit_lists: List[Tuple[CandidateKey, float]]) -> int:
+        """多路命中去重后的文档数"""
+        return len({key for hits in hit_lists for key, _ in hits})
+
+    async def _embed_query(self, query: str, deadline: Deadline) -> Optional[List[float]]:
+        """查询向量化，失败时丢弃向量分支"""
+        try:
+            embeddings = await self.embedding.encode_async([query])
+            return embeddings[0]
+        except Exception as e:
+            logger.error(f"Query embedding error, continuing without vector search: {e}")
+            deadline.drop("vector")
+            return None
+
+    async def _parallel_search(
+        self,
+        query_tokens: List[str],
+        query_embedding: Optional[List[float]],
+        collections: List[Tuple[str, str]],
+        top_k: int,
+        deadline: Deadline
+    ) -> Tuple[List[Tuple[CandidateKey, float]], List[Tuple[CandidateKey, float]]]:
+        """并行执行两种检索，超时的一路返回空列表"""
+        vector_hits, bm25_hits = await asyncio.gather(
+            deadline.run("vector", self._vector_leg(query_embedding, collections, top_k), default=[]),
+            deadline.run("bm25", self._bm25_leg(query_tokens, collections, top_k), default=[]),
         )
 
-        # 合并结果
-        vector_results = []
-        bm25_results = []
+        return vector_hits, bm25_hits
+
+    async def _vector_leg(
+        self,
+        query_embedding: Optional[List[float]],
+        collections: List[Tuple[str, str]],
+        top_k: int
+    ) -> List[Tuple[CandidateKey, float]]:
+        """向量分支: 各集合检索 (向量化失败时为空)"""
+        if query_embedding is None:
+            return []
 
-        for results in vector_results_list:
-            vector_results.extend(results)
+        hits_list = await asyncio.gather(*[
+            self._vector_search(dt, cat, query_embedding, top_k)
+            for dt, cat in collections
+        ])
 
-        for results in bm25_results_list:
-            bm25_results.extend(results)
+        # 各集合结果已按分数降序，归并为一个降序列表
+        return merge_sorted(hits_list)
 
-        return vector_results, bm25_results
+    async def _bm25_leg(
+        self,
+        query_tokens: List[str],
+        collections: List[Tuple[str, str]],
+        top_k: int
+    ) -> List[Tuple[CandidateKey, float]]:
+        """BM25 分支: 各集合检索 (使用已分词的查询)"""
+        hits_list = await asyncio.gather(*[
+            self._bm25_search(dt, cat, query_tokens, top_k)
+            for dt, cat in collections
+        ])
+        return merge_sorted(hits_list)
 
     async def _vector_search(
         self,
         destiny_type: str,
         category: str,
-        query: str,
         query_embedding: List[float],
         top_k: int
-    ) -> List[SearchResult]:
-        """向量检索"""
+    ) -> List[Tuple[CandidateKey, float]]:
+        """向量检索 (在线程中执行，可被截止时间取消等待)"""
         try:
-            results = self.chroma.search(
+            hits = await asyncio.to_thread(
+                self.chroma.search_ids,
                 destiny_type=destiny_type,
                 category=category,
-                query=query,
                 query_embedding=query_embedding,
                 n_results=top_k
             )
-            return results
+            return [((destiny_type, category, doc_id), score) for doc_id, score in hits]
         except Exception as e:
             logger.error(f"Vector search error: {e}")
             return []
@@ -132,86 +366,103 @@ class HybridRetriever:
         self,
         destiny_type: str,
         category: str,
-        query: str,
+        query_tokens: List[str],
         top_k: int
-    ) -> List[SearchResult]:
-        """BM25 检索"""
+    ) -> List[Tuple[CandidateKey, float]]:
+        """BM25 检索 (在线程中执行，可被截止时间取消等待)"""
         try:
-            results = self.bm25.search(
+            hits = await asyncio.to_thread(
+                self.bm25.search_ids,
                 destiny_type=destiny_type,
                 category=category,
-                query=query,
-                n_results=top_k
+                n_results=top_k,
+                query_tokens=query_tokens
             )
-            return results
+            return [((destiny_type, category, doc_id), score) for doc_id, score in hits]
         except Exception as e:
             logger.error(f"BM25 search error: {e}")
             return []
 
     def _fuse_results(
         self,
-        vector_results: List[SearchResult],
-        bm25_results: List[SearchResult]
-    ) -> List[SearchResult]:
+        vector_hits: List[Tuple[CandidateKey, float]],
+        bm25_hits: List[Tuple[CandidateKey, float]],
+        mode: FusionMode,
+        limit: int
+    ) -> List[Tuple[CandidateKey, float]]:
         """
         融合向量和 BM25 结果
 
-        使用加权融合策略:
-        1. 合并所有结果
-        2. 对相同 ID 的结果取最高分数
-        3. 按融合分数排序
+        向量分数 (1 - distance) 与 BM25 原始分数量纲不同，
+        按 mode 做排名融合或归一化后再按权重相加，见 services.fusion。
         """
-        # 构建 ID 到结果的映射
-        result_map = {}
-
-        # 处理向量结果
-        for r in vector_results:
-            key = f"{r.destiny_type}:{r.category}:{r.id}"
-            fusion_score = r.score * self.vector_weight
-            result_map[key] = {
-                "result": r,
-                "score": fusion_score,
-                "source": "vector"
-            }
+        return fuse(
+            sources=[vector_hits, bm25_hits],
+            weights=[self.vector_weight, self.keyword_weight],
+            mode=mode,
+            limit=limit,
+            rrf_k=self.settings.rrf_k
+        )
 
-        # 处理 BM25 结果
-        for r in bm25_results:
-            key = f"{r.destiny_type}:{r.category}:{r.id}"
-            bm25_score = r.score * self.keyword_weight
-
-            if key in result_map:
-                # 取最高分数
-                existing = result_map[key]
-                existing["score"] = max(existing["score"], bm25_score)
-            else:
-                result_map[key] = {
-                    "result": r,
-                    "score": bm25_score,
-                    "source": "bm25"
-                }
-
-        # 构建融合结果
-        fused = []
-        for item in result_map.values():
-            r = item["result"]
-            # 更新分数
-            fused_result = SearchResult(
-                id=r.id,
-                content=r.content,
-                score=item["score"],
-                title=r.title,
-                destiny_type=r.destiny_type,
-                category=r.category,
-                level=r.level,
-                source="hybrid",
-                distance=r.distance
-            )
-            fused.append(fused_result)
+    def _fetch_documents(
+        self,
+        hits: List[Tuple[CandidateKey, float]]
+    ) -> Dict[CandidateKey, dict]:
+        """
+        为候选批量获取文档内容 (阻塞，在线程中调用)
 
-        # 按分数排序
-        fused.sort(key=lambda x: x.score, reverse=True)
+        按集合分组，优先从内存中的 BM25 文档取，缺失的再批量查询 Chroma。
+        """
+        # 按 (destiny_type, category) 分组
+        grouped: Dict[Tuple[str, str], List[str]] = {}
+        for (dt, cat, doc_id), _ in hits:
+            grouped.setdefault((dt, cat), []).append(doc_id)
 
-        return fused
+        documents: Dict[CandidateKey, dict] = {}
+        for (dt, cat), ids in grouped.items():
+            found = self.bm25.get_documents(dt, cat, ids)
+
+            missing = [doc_id for doc_id in ids if doc_id not in found]
+            if missing:
+                try:
+                    found.update(self.chroma.get_documents(dt, cat, missing))
+                except Exception as e:
+                    logger.error(f"Document hydration error for {dt}/{cat}: {e}")
+
+            for doc_id, doc in found.items():
+                documents[(dt, cat, doc_id)] = doc
+
+        return documents
+
+    def _hydrate(
+        self,
+        hits: List[Tuple[CandidateKey, float]],
+        documents: Optional[Dict[CandidateKey, dict]]
+    ) -> List[Candidate]:
+        """
+        由融合结果和文档内容构建候选，返回顺序与输入一致
+
+        找不到内容的候选会被丢弃；documents 为 None (获取内容超时) 时保留全部候选，内容为空。
+        """
+        results = []
+        for key, score in hits:
+            doc = documents.get(key) if documents is not None else {}
+            if doc is None:
+                continue
+
+            dt, cat, doc_id = key
+            results.append(Candidate(
+                destiny_type=dt,
+                category=cat,
+                id=doc_id,
+                score=score,
+                source="hybrid",
+                content=doc.get("content", ""),
+                title=doc.get("title", ""),
+                level=doc.get("level", "method")
+            ))
+
+        return results
 
     def _get_all_categories(self, destiny_type: str) -> List[str]:
         """获取指定命理类型的所有分类"""
@@ -229,28 +480,37 @@ class HybridRetriever:
         self,
         destiny_type: str,
         category: str,
-        documents: List[dict]
-    ):
+        documents: List[dict],
+        wait_for_graph: bool = False
+    ) -> Optional[asyncio.Task]:
         """
         索引文档 (同时建立向量、BM25 和 GraphRAG 图谱)
 
+        流水线:
+        1. 向量化按批并发请求，每批返回后立即写入 Chroma
+        2. 与此同时在线程中完成 BM25 分词并合并到已有索引
+        3. GraphRAG 图谱构建交给后台任务，不阻塞调用方
+
+        向量和 BM25 写入全部完成后统一递增一次索引版本 (图谱合并完成时另行递增)。
+
         Args:
             destiny_type: 命理类型
             category: 子分类
             documents: 文档列表
+            wait_for_graph: 是否等待图谱构建完成 (命令行脚本需要在退出事件循环前等待)
+
+        Returns:
+            图谱构建任务 (wait_for_graph 为 True 时已完成)
         """
         logger.info(f"Indexing {len(documents)} documents for {destiny_type}/{category}")
 
         # 提取内容
         contents = [doc.get("content", "") for doc in documents]
-        ids = [doc.get("id", str(i)) for i in range(len(documents))]
-        titles = [doc.get("title", "") for i in range(len(documents))]
-        levels = [doc.get("level", "method") for i in range(len(documents))]
-
-        # 1. 向量化
-        embeddings = self.embedding.encode(contents)
+        ids = [doc.get("id", str(i)) for i, doc in enumerate(documents)]
+        titles = [doc.get("title", "") for doc in documents]
+        levels = [doc.get("level", "method") for doc in documents]
 
-        # 2. 构建元数据
+        # 构建元数据
         metadatas = [
             {
                 "title": titles[i],
@@ -262,17 +522,6 @@ class HybridRetriever:
             for i, doc in enumerate(documents)
         ]
 
-        # 3. 存入 Chroma 向量库
-        self.chroma.add_documents(
-            destiny_type=destiny_type,
-            category=category,
-            documents=contents,
-            embeddings=embeddings,
-            ids=ids,
-            metadatas=metadatas
-        )
-
-        # 4. 构建 BM25 索引
         bm25_docs = [
             {
                 "id": ids[i],
@@ -282,13 +531,136 @@ class HybridRetriever:
             }
             for i in range(len(documents))
         ]
-        self.bm25.build_index(
-            destiny_type=destiny_type,
-            category=category,
-            documents=bm25_docs
+
+        # 1 + 2. 向量化/写入 Chroma 与 BM25 分词/建索引并发执行
+        try:
+            added_embeddings, _ = await asyncio.gather(
+                self._index_vectors(destiny_type, category, contents, ids, metadatas),
+                self._index_keywords(destiny_type, category, bm25_docs),
+            )
+        finally:
+            # 部分批次失败时已写入的部分同样需要失效缓存
+            bump_index_version()
+
+        # 按新写入的向量增量更新分类路由质心
+        await asyncio.to_thread(
+            self.category_router.update_centroid, destiny_type, category, added_embeddings
+        )
+
+        logger.info(
+            f"Indexed {len(documents)} documents for {destiny_type}/{category}"
+        )
+
+        # 3. GraphRAG 图谱构建 (后台执行)
+        task = asyncio.create_task(
+            self._build_graph(destiny_type, category, documents)
+        )
+        self._graph_tasks.add(task)
+        task.add_done_callback(self._graph_tasks.discard)
+
+        if wait_for_graph:
+            await task
+
+        return task
+
+    async def delete_documents(self, destiny_type: str, category: str, ids: List[str]):
+        """
+        从向量、BM25 和 GraphRAG 图谱中删除文档
+
+        图谱中撤销文档的实体链接和关系来源，失去全部来源的边和孤立实体随之清理。
+        """
+        if not ids:
+            return
+
+        # 删除前取出向量，用于增量更新质心
+        removed_embeddings = await asyncio.to_thread(
+            self.chroma.get_embeddings, destiny_type, category, ids
+        )
+
+        await asyncio.gather(
+            asyncio.to_thread(self.chroma.delete, destiny_type, category, ids=ids),
+            asyncio.to_thread(self.bm25.remove_documents, destiny_type, category, ids),
+            self.graphrag.remove_documents(destiny_type, category, ids),
+        )
+
+        await asyncio.to_thread(
+            self.category_router.update_centroid,
+            destiny_type, category, None, list(removed_embeddings.values())
+        )
+
+        logger.info(f"Deleted {len(ids)} documents from {destiny_type}/{category}")
+
+    async def _index_vectors(
+        self,
+        destiny_type: str,
+        category: str,
+        contents: List[str],
+        ids: List[str],
+        metadatas: List[dict]
+    ) -> List[List[float]]:
+        """
+        向量化并分批写入 Chroma (多批向量化请求并发)
+
+        Returns:
+            实际新写入的向量 (集合中已存在的 ID 不会被覆盖，不计入)
+        """
+        batch_size = self.settings.index_batch_size
+        semaphore = asyncio.Semaphore(self.settings.index_embedding_concurrency)
+
+        async def index_batch(start: int) -> List[List[float]]:
+            end = start + batch_size
+            async with semaphore:
+                embeddings = await self.embedding.encode_async(contents[start:end])
+
+            existing = await asyncio.to_thread(
+                self.chroma.get_embeddings, destiny_type, category, ids[start:end]
+            )
+            await asyncio.to_thread(
+                self.chroma.add_documents,
+                destiny_type=destiny_type,
+                category=category,
+                documents=contents[start:end],
+                embeddings=embeddings,
+                ids=ids[start:end],
+                metadatas=metadatas[start:end],
+                invalidate_cache=False
+            )
+            return [
+                embedding for doc_id, embedding in zip(ids[start:end], embeddings)
+                if doc_id not in existing
+            ]
+
+        batches = await asyncio.gather(*[
+            index_batch(start) for start in range(0, len(contents), batch_size)
+        ])
+        return [embedding for batch in batches for embedding in batch]
+
+    async def _index_keywords(
+        self,
+        destiny_type: str,
+        category: str,
+        bm25_docs: List[dict]
+    ):
+        """在线程中分词并合并到 BM25 索引"""
+        tokenized_corpus = await asyncio.to_thread(
+            lambda: [self.bm25.tokenize(doc["content"]) for doc in bm25_docs]
+        )
+        await asyncio.to_thread(
+            self.bm25.add_documents,
+            destiny_type,
+            category,
+            bm25_docs,
+            tokenized_corpus,
+            invalidate_cache=False
         )
 
-        # 5. 构建 GraphRAG 图谱 (异步，不阻塞索引)
+    async def _build_graph(
+        self,
+        destiny_type: str,
+        category: str,
+        documents: List[dict]
+    ):
+        """构建 GraphRAG 图谱 (失败不影响已完成的向量和 BM25 索引)"""
         try:
             graph_result = await self.graphrag.build_graph_from_documents(
                 destiny_type=destiny_type,
@@ -296,15 +668,34 @@ class HybridRetriever:
                 documents=documents
             )
             logger.info(
-                f"Graph built: {graph_result.get('entities', 0)} entities, "
+                f"Graph built for {destiny_type}/{category}: "
+                f"{graph_result.get('entities', 0)} entities, "
                 f"{graph_result.get('relations', 0)} relations"
             )
         except Exception as e:
             logger.warning(f"GraphRAG build failed, continuing without graph: {e}")
 
-        logger.info(
-            f"Indexed {len(documents)} documents for {destiny_type}/{category}"
-        )
+    async def drain_graph_tasks(self, timeout: Optional[float] = None) -> int:
+        """
+        等待后台图谱构建任务完成
+
+        Args:
+            timeout: 最长等待时间 (秒)，超时后取消剩余任务
+
+        Returns:
+            等待的任务数
+        """
+        tasks = list(self._graph_tasks)
+        if not tasks:
+            return 0
+
+        done, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            logger.warning(f"Cancelled {len(pending)} unfinished graph build tasks")
+
+        return len(tasks)
 
 
 # 单例实例
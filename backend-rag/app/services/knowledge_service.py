@@ -16,6 +16,7 @@ import jieba
 from ..config import get_settings
 from ..services.hybrid_retriever import get_hybrid_retriever
 from ..services.embedding_service import get_embedding_service
+from ..services.entity_matcher import get_entity_matcher, ROUTER_ENTITY_TYPES
 
 
 class DocumentChunk:
@@ -34,6 +35,7 @@ class KnowledgeService:
         self.settings = get_settings()
         self.retriever = get_hybrid_retriever()
         self.embedding = get_embedding_service()
+        self.entity_matcher = get_entity_matcher()
 
         # 文档存储目录
         self.docs_dir = Path("./data/documents")
@@ -103,7 +105,8 @@ class KnowledgeService:
         category: str,
         title: str = None,
         level: str = "method",
-        original_filename: str = None
+        original_filename: str = None,
+        wait_for_graph: bool = False
     ) -> Dict:
         """
         添加文档到知识库
@@ -115,6 +118,7 @@ class KnowledgeService:
             title: 标题
             level: 知识层级
             original_filename: 原始文件名（用于保存）
+            wait_for_graph: 是否等待图谱构建完成 (默认后台构建)
 
         Returns:
             处理结果
@@ -160,7 +164,8 @@ class KnowledgeService:
         await self.retriever.index_documents(
             destiny_type=destiny_type,
             category=category,
-            documents=documents
+            documents=documents,
+            wait_for_graph=wait_for_graph
         )
 
         # 5. 保存文档记录
@@ -171,6 +176,7 @@ class KnowledgeService:
             "destiny_type": destiny_type,
             "category": category,
             "chunks": len(documents),
+            "chunk_ids": [doc["id"] for doc in documents],
             "indexed_at": datetime.now().isoformat()
         }
 
@@ -186,7 +192,7 @@ class KnowledgeService:
             "status": "success"
         }
 
-    async def add_text(self, entry: Dict) -> Dict:
+    async def add_text(self, entry: Dict, wait_for_graph: bool = False) -> Dict:
         """直接添加文本"""
         content = entry.get("content", "")
         destiny_type = entry.get("destiny_type", "ziwei")
@@ -222,7 +228,8 @@ class KnowledgeService:
         await self.retriever.index_documents(
             destiny_type=destiny_type,
             category=category,
-            documents=documents
+            documents=documents,
+            wait_for_graph=wait_for_graph
         )
 
         return {
@@ -380,21 +387,8 @@ class KnowledgeService:
         return list(jieba.cut(content))
 
     def _extract_entities(self, content: str) -> List[str]:
-        """提取实体"""
-        entities = []
-
-        # 紫微斗数实体
-        ziwei_entities = [
-            "紫微", "天机", "太阳", "武曲", "天同", "廉贞",
-            "天府", "太阴", "贪狼", "巨门", "天相", "天梁",
-            "七杀", "破军", "命宫", "官禄宫", "财帛宫"
-        ]
-
-        for entity in ziwei_entities:
-            if entity in content:
-                entities.append(entity)
-
-        return list(set(entities))
+        """提取实体 (与查询路由使用同一词表，入库与查询的实体一致)"""
+        return self.entity_matcher.extract(content, types=ROUTER_ENTITY_TYPES)
 
     def list_documents(self, destiny_type: str = None) -> List[Dict]:
         """列出文档"""
@@ -405,8 +399,8 @@ class KnowledgeService:
 
         return records
 
-    def delete_document(self, document_id: str) -> int:
-        """删除文档"""
+    async def delete_document(self, document_id: str) -> int:
+        """删除文档 (同时从向量、BM25 和图谱索引中移除其分块)"""
         records = self._load_records()
         deleted_count = 0
 
@@ -414,6 +408,19 @@ class KnowledgeService:
             if record.get("id") == document_id:
                 records.remove(record)
                 deleted_count = record.get("chunks", 1)
+
+                chunk_ids = record.get("chunk_ids")
+                if chunk_ids:
+                    await self.retriever.delete_documents(
+                        destiny_type=record.get("destiny_type", ""),
+                        category=record.get("category", ""),
+                        ids=chunk_ids
+                    )
+                else:
+                    logger.warning(
+                        f"Document record {document_id} has no chunk ids, "
+                        f"index entries are kept"
+                    )
                 break
 
         self._save_records(records)
@@ -455,6 +462,7 @@ class KnowledgeService:
                     destiny_type=destiny_type,
                     category=record.get("category", "general"),
                     title=record.get("title"),
+                    wait_for_graph=True,
                 ))
                 total += chunks.get("chunks", 0)
 
@@ -3,7 +3,8 @@
 整合路由、检索、LLM 生成的完整流程
 """
 import time
-from typing import List, Dict, Optional, Any
+import asyncio
+from typing import Awaitable, List, Dict, Optional, Any, Tuple
 from loguru import logger
 
 from openai import AsyncOpenAI
@@ -13,10 +14,18 @@ from ..models.enums import RetrievalStrategy, QueryType
 from ..models.schemas import (
     SearchResult, RAGRequest, RAGResponse, KnowledgeEntry
 )
+from ..models.candidate import Candidate, CandidateKey, to_search_results
 from ..services.router import get_query_router
 from ..services.planner import get_retrieval_planner
 from ..services.unified_retriever import get_unified_retriever
+from ..services.cross_type_retriever import get_cross_type_retriever
 from ..services.embedding_service import get_embedding_service
+from ..services.deadline import Deadline
+from ..services.semantic_cache import get_semantic_cache
+
+
+# LLM 调用失败时的兜底回答 (不写入语义缓存)
+LLM_FALLBACK_RESPONSE = "抱歉，处理您的问题时遇到了技术困难。请稍后再试或重新表述您的问题。"
 
 
 class RAGEngine:
@@ -28,6 +37,8 @@ class RAGEngine:
         self.planner = get_retrieval_planner()
         self.retriever = get_unified_retriever()
         self.embedding = get_embedding_service()
+        self.semantic_cache = get_semantic_cache()
+        self.cross_retriever = get_cross_type_retriever()
 
         # LLM 客户端
         self.llm_client = AsyncOpenAI(
@@ -40,12 +51,34 @@ class RAGEngine:
         处理 RAG 查询
 
         流程:
-        1. 路由判断 → 选择策略
-        2. 执行检索 → 获取知识
-        3. 跨类型补充 (如需要)
-        4. LLM 生成
+        1. 路由判断 → 规划主检索策略和跨类型补充
+        2. 主检索与跨类型补充并发执行，先完成的先格式化上下文
+        3. LLM 生成
         """
         start_time = time.time()
+        # 请求截止时间 (语义缓存的问题向量化也计入预算)
+        deadline = Deadline.from_timeout(request.timeout_ms)
+
+        # 0. 语义缓存 (多轮对话依赖上下文，不走缓存)，问题向量同时供检索复用
+        query_embedding = None
+        index_version = self.semantic_cache.index_cache.index_version
+        cacheable = self.semantic_cache.enabled and not request.chat_history
+        if cacheable:
+            query_embedding = await self._embed_query(request.query, deadline)
+            if query_embedding is not None:
+                hit = self.semantic_cache.lookup(
+                    query_embedding, request.destiny_type, request.category
+                )
+                if hit is not None:
+                    cached_query, similarity, cached_response = hit
+                    logger.debug(
+                        f"Semantic cache hit: '{request.query}' ~ '{cached_query}' "
+                        f"({similarity:.3f})"
+                    )
+                    return cached_response.model_copy(update={
+                        "query_time_ms": int((time.time() - start_time) * 1000),
+                        "cached": True,
+                    })
 
         # 1. 路由判断
         query_type, is_complex, entities = self.router.classify(request.query)
@@ -55,7 +88,7 @@ class RAGEngine:
             f"complex={is_complex}, entities={entities}"
         )
 
-        # 2. 规划检索策略
+        # 2. 预先规划检索: 主检索策略 + 是否需要跨类型补充
         strategy = self.planner.plan(
             query=request.query,
             query_type=query_type,
@@ -63,36 +96,37 @@ class RAGEngine:
             entities=entities,
             current_type=request.destiny_type,
         )
+        use_cross_type = self.router.should_use_cross_type(request.query, entities)
 
-        # 3. 执行检索
-        categories = [request.category] if request.category else None
-
-        results = await self.retriever.search(
-            query=request.query,
-            strategy=strategy,
-            destiny_types=[request.destiny_type],
-            categories=categories,
-            top_k=request.top_k,
-            entities=entities
+        # 3. 并发执行主检索和跨类型补充 (共享查询向量和请求截止时间)
+        shares_embedding = use_cross_type or strategy in (
+            RetrievalStrategy.HYBRID_VECTOR, RetrievalStrategy.CROSS_TYPE
         )
+        if not cacheable and shares_embedding:
+            query_embedding = await self._embed_query(request.query, deadline)
 
-        # 4. 检查是否需要跨类型补充
-        if self.router.should_use_cross_type(request.query, entities):
-            from ..services.cross_type_retriever import get_cross_type_retriever
-            cross_retriever = get_cross_type_retriever()
-
-            cross_results = await cross_retriever.search(
-                query=request.query,
-                current_type=request.destiny_type,
-                target_types=[request.destiny_type, "shared"],
-                top_k=3
+        retrievals = {
+            "primary": self._retrieve_primary(
+                request, strategy, entities, deadline, query_embedding
+            ),
+        }
+        if use_cross_type:
+            retrievals["cross_type"] = self._retrieve_cross_type(
+                request, deadline, query_embedding
             )
 
-            # 合并结果
-            results = self._merge_results(results, cross_results)
+        # 4. 先完成的检索先格式化上下文片段
+        retrieved: Dict[str, List[Candidate]] = {}
+        context_blocks: Dict[CandidateKey, str] = {}
+        for name, candidates in await self._gather_as_completed(retrievals, context_blocks):
+            retrieved[name] = candidates
+
+        results = retrieved["primary"]
+        if "cross_type" in retrieved:
+            results = self._merge_results(results, retrieved["cross_type"])
 
-        # 5. 构建上下文
-        context = self._build_context(results)
+        # 5. 按合并后的顺序拼接上下文
+        context = self._build_context(results, context_blocks)
 
         # 6. 构建对话历史
         history_context = self._build_history_context(request.chat_history)
@@ -107,48 +141,161 @@ class RAGEngine:
 
         query_time_ms = int((time.time() - start_time) * 1000)
 
-        return RAGResponse(
+        rag_response = RAGResponse(
             response=response,
-            sources=results,
+            sources=to_search_results(results),
             strategy=strategy.value,
             entities=entities,
-            query_time_ms=query_time_ms
+            query_time_ms=query_time_ms,
+            partial=deadline.partial,
+            dropped_sources=deadline.dropped_sources
         )
 
+        # 8. 写入语义缓存 (部分结果和兜底回答不缓存)
+        if (
+            cacheable
+            and query_embedding is not None
+            and not deadline.partial
+            and response != LLM_FALLBACK_RESPONSE
+        ):
+            self.semantic_cache.store(
+                query=request.query,
+                embedding=query_embedding,
+                destiny_type=request.destiny_type,
+                category=request.category,
+                response=rag_response,
+                version=index_version
+            )
+
+        return rag_response
+
+    async def _embed_query(self, query: str, deadline: Deadline) -> Optional[List[float]]:
+        """
+        问题向量化，只使用一部分剩余预算，给 BM25、融合和重排序留出时间
+
+        失败时返回 None，跳过语义缓存，检索器各自重试；超时则丢弃向量分支，检索器不再重试。
+        """
+        return await deadline.run(
+            "vector", self._encode_query(query), default=None,
+            ratio=self.settings.query_embedding_budget_ratio
+        )
+
+    async def _encode_query(self, query: str) -> Optional[List[float]]:
+        try:
+            embeddings = await self.embedding.encode_async([query])
+            return embeddings[0] if embeddings else None
+        except Exception as e:
+            logger.warning(f"Query embedding failed: {e}")
+            return None
+
+    async def _retrieve_primary(
+        self,
+        request: RAGRequest,
+        strategy: RetrievalStrategy,
+        entities: List[str],
+        deadline: Deadline,
+        query_embedding: Optional[List[float]]
+    ) -> List[Candidate]:
+        """主检索"""
+        categories = [request.category] if request.category else None
+
+        return await self.retriever.search_candidates(
+            query=request.query,
+            strategy=strategy,
+            destiny_types=[request.destiny_type],
+            categories=categories,
+            top_k=request.top_k,
+            entities=entities,
+            fusion=request.fusion,
+            deadline=deadline,
+            query_embedding=query_embedding
+        )
+
+    async def _retrieve_cross_type(
+        self,
+        request: RAGRequest,
+        deadline: Deadline,
+        query_embedding: Optional[List[float]]
+    ) -> List[Candidate]:
+        """跨类型补充检索"""
+        return await self.cross_retriever.search_candidates(
+            query=request.query,
+            current_type=request.destiny_type,
+            target_types=[request.destiny_type, "shared"],
+            top_k=3,
+            fusion=request.fusion,
+            deadline=deadline,
+            query_embedding=query_embedding
+        )
+
+    async def _gather_as_completed(
+        self,
+        retrievals: Dict[str, Awaitable[List[Candidate]]],
+        context_blocks: Dict[CandidateKey, str]
+    ) -> List[Tuple[str, List[Candidate]]]:
+        """
+        并发执行多路检索，每一路完成后立即格式化其上下文片段
+
+        Returns:
+            [(检索名, 候选列表)]，按完成顺序
+        """
+        async def run(name: str, retrieval: Awaitable[List[Candidate]]):
+            return name, await retrieval
+
+        completed = []
+        for future in asyncio.as_completed([
+            run(name, retrieval) for name, retrieval in retrievals.items()
+        ]):
+            name, candidates = await future
+            for c in candidates:
+                if c.key not in context_blocks:
+                    context_blocks[c.key] = self._format_context_block(c)
+            completed.append((name, candidates))
+
+        return completed
+
     def _merge_results(
         self,
-        primary: List[SearchResult],
-        secondary: List[SearchResult]
-    ) -> List[SearchResult]:
+        primary: List[Candidate],
+        secondary: List[Candidate]
+    ) -> List[Candidate]:
         """合并检索结果"""
-        result_map = {}
+        result_map: Dict[CandidateKey, Candidate] = {}
 
         for r in primary:
-            key = f"{r.destiny_type}:{r.category}:{r.id}"
-            result_map[key] = r
+            result_map[r.key] = r
 
         for r in secondary:
-            key = f"{r.destiny_type}:{r.category}:{r.id}"
-            if key not in result_map:
-                result_map[key] = r
+            if r.key not in result_map:
+                result_map[r.key] = r
 
         results = list(result_map.values())
         results.sort(key=lambda x: x.score, reverse=True)
 
         return results
 
-    def _build_context(self, results: List[SearchResult], max_length: int = 8000) -> str:
-        """构建检索上下文"""
-        context_parts = []
+    def _format_context_block(self, result: Candidate) -> str:
+        """格式化单条检索结果的上下文片段"""
+        # 来源标记
+        source_info = f"【来源: {result.destiny_type}/{result.category}】"
 
-        for r in results:
-            # 来源标记
-            source_info = f"【来源: {r.destiny_type}/{r.category}】"
+        # 内容 (限制长度)
+        content = result.content[:3000] if len(result.content) > 3000 else result.content
 
-            # 内容 (限制长度)
-            content = r.content[:3000] if len(r.content) > 3000 else r.content
+        return f"{source_info}\n{content}"
 
-            context_parts.append(f"{source_info}\n{content}")
+    def _build_context(
+        self,
+        results: List[Candidate],
+        blocks: Optional[Dict[CandidateKey, str]] = None,
+        max_length: int = 8000
+    ) -> str:
+        """构建检索上下文 (优先复用检索完成时已格式化的片段)"""
+        blocks = blocks or {}
+        context_parts = [
+            blocks.get(r.key) or self._format_context_block(r)
+            for r in results
+        ]
 
         context = "\n\n---\n\n".join(context_parts)
 
@@ -209,7 +356,7 @@ class RAGEngine:
 
         except Exception as e:
             logger.error(f"LLM generation error: {e}")
-            return "抱歉，处理您的问题时遇到了技术困难。请稍后再试或重新表述您的问题。"
+            return LLM_FALLBACK_RESPONSE
 
     def _get_system_prompt(self, destiny_type: str) -> str:
         """获取系统提示词"""
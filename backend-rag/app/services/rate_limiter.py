@@ -0,0 +1,32 @@
+"""
+异步限流器
+按每分钟请求数为 LLM 调用预留发送时间，超出速率的调用顺延等待
+"""
+import time
+import asyncio
+
+
+class RateLimiter:
+    """匀速限流 (每次调用间隔至少 60 / rate_per_minute 秒)"""
+
+    def __init__(self, rate_per_minute: float):
+        """
+        Args:
+            rate_per_minute: 每分钟允许的调用数，0 表示不限流
+        """
+        self.interval = 60.0 / rate_per_minute if rate_per_minute > 0 else 0.0
+        self._next_slot = 0.0
+
+    async def acquire(self):
+        """等待下一个可用的发送时间"""
+        if not self.interval:
+            return
+
+        # 预留时间片的计算中没有 await，在事件循环内是原子的，无需加锁
+        now = time.monotonic()
+        slot = max(now, self._next_slot)
+        self._next_slot = slot + self.interval
+
+        wait = slot - now
+        if wait > 0:
+            await asyncio.sleep(wait)
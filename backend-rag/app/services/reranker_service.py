@@ -3,13 +3,28 @@
 使用 Cross-Encoder 对检索结果进行精排
 """
 import os
-from typing import List, Optional
+import json
+import time
+import asyncio
+import threading
+from typing import List, Optional, Tuple
 from loguru import logger
 
-from sentence_transformers import CrossEncoder
-
 from ..config import get_settings
-from ..models.schemas import SearchResult, RerankedResult
+from ..models.candidate import Candidate
+
+
+OPENAI_RERANK_PROMPT = """你是一个专业的命理知识检索系统。
+给定用户查询和参考文档，你需要评估每个文档与查询的相关程度。
+请用0-1之间的分数表示相关性，1表示完全相关，0表示完全不相关。
+只返回JSON数组格式，不要其他文字。
+
+格式示例:
+[
+  {"index": 0, "score": 0.95},
+  {"index": 1, "score": 0.30}
+]
+"""
 
 
 class RerankerService:
@@ -20,154 +35,382 @@ class RerankerService:
         self.model_name = self.settings.reranker_local_model
         self.use_local = self.settings.reranker_model == "local"
         self.use_openai = self.settings.reranker_model == "openai"
+        self.max_length = self.settings.reranker_max_length
+        self.batch_size = self.settings.reranker_batch_size
+        self.early_stop_margin = self.settings.reranker_early_stop_margin
 
-        # 加载本地模型
+        # 最近一次推理的分批统计 [{size, seq_len, tokens}]
+        self.last_batch_stats: List[dict] = []
+
+        # OpenAI 客户端 (延迟创建，复用连接池)
+        self._openai_client = None
+
+        # 每个候选的平均重排序耗时 (ms, 指数滑动平均)，用于估算候选预算
+        self.ms_per_candidate: Optional[float] = None
+
+        # 本地模型延迟加载 (sentence_transformers/torch 导入较慢)
         self.model = None
-        if self.use_local:
-            self._load_local_model()
+        self._model_loaded = False
+        # 加载只进行一次，并发调用等待正在进行的加载 (预热线程或请求)
+        self._load_lock = threading.Lock()
 
     def _load_local_model(self):
-        """加载本地 Cross-Encoder 模型"""
-        try:
-            self.model = CrossEncoder(self.model_name)
-            logger.info(f"Loaded local reranker model: {self.model_name}")
-        except Exception as e:
-            logger.error(f"Failed to load local model: {e}")
-            logger.warning("Falling back to OpenAI reranker")
-            self.use_local = False
-            self.use_openai = True
+        """加载本地 Cross-Encoder 模型 (阻塞，在线程中调用)"""
+        if self._model_loaded or not self.use_local:
+            return
+
+        with self._load_lock:
+            if self._model_loaded or not self.use_local:
+                return
+
+            # 模型就绪后才标记已加载；失败时降级到 OpenAI 重排序
+            try:
+                from sentence_transformers import CrossEncoder
+
+                self.model = CrossEncoder(self.model_name, max_length=self.max_length)
+                self._model_loaded = True
+                logger.info(f"Loaded local reranker model: {self.model_name}")
+            except Exception as e:
+                logger.error(f"Failed to load local model: {e}")
+                logger.warning("Falling back to OpenAI reranker")
+                self.use_local = False
+                self.use_openai = True
 
     async def rerank(
         self,
         query: str,
-        results: List[SearchResult],
-        top_k: int = 5
-    ) -> List[RerankedResult]:
+        results: List[Candidate],
+        top_k: int = 5,
+        early_stop: bool = False,
+        force: bool = False
+    ) -> List[Candidate]:
         """
         对检索结果进行重排序
 
         Args:
             query: 查询文本
-            results: 检索结果列表
+            results: 候选列表 (按一阶段分数降序)
             top_k: 返回数量
+            early_stop: 是否按阶段级联评分，前 top_k 已明显拉开时提前终止
+            force: 候选数不超过 top_k 时也评分 (调用方需要完整的重排序分数)
 
         Returns:
-            重排序后的结果列表
+            重排序后的候选列表 (rerank_score 已填充，score 保留一阶段分数)
         """
         if not results:
             return []
 
-        if len(results) <= top_k:
+        if len(results) <= top_k and not force:
             # 不需要重排序
-            return [
-                RerankedResult(result=r, rerank_score=r.score)
-                for r in results
-            ]
+            return self._keep_order(results)
+
+        if self.use_local and not self._model_loaded:
+            # 在线程中加载或等待预热中的加载，不阻塞事件循环
+            await asyncio.to_thread(self._load_local_model)
 
         if self.use_local and self.model:
-            return await self._rerank_local(query, results, top_k)
+            return await self._rerank_local(query, results, top_k, early_stop)
         elif self.use_openai:
             return await self._rerank_openai(query, results, top_k)
         else:
             # 无重排序器，直接返回
             logger.warning("No reranker available, returning original order")
-            return [
-                RerankedResult(result=r, rerank_score=r.score)
-                for r in results[:top_k]
-            ]
+            return self._keep_order(results[:top_k])
 
     async def _rerank_local(
         self,
         query: str,
-        results: List[SearchResult],
-        top_k: int
-    ) -> List[RerankedResult]:
+        results: List[Candidate],
+        top_k: int,
+        early_stop: bool = False
+    ) -> List[Candidate]:
         """使用本地模型重排序"""
         try:
-            # 准备输入 [query, document]
-            pairs = [
-                [query, result.content]
-                for result in results
-            ]
-
-            # 批量推理
-            scores = self.model.predict(pairs)
+            start = time.perf_counter()
+
+            # 准备输入 [query, document]，按模型最大长度截断
+            # (分词和推理在线程中执行，不阻塞事件循环，超时可取消等待)
+            pairs, lengths = await asyncio.to_thread(self._prepare_pairs, query, results)
+
+            # 分阶段评分: 候选按一阶段分数降序，靠后的阶段越不可能进入前 top_k
+            stage_size = len(pairs) if not early_stop else max(top_k * 2, 8)
+            scores: List[float] = []
+            self.last_batch_stats = []
+
+            for stage_start in range(0, len(pairs), stage_size):
+                stage_end = stage_start + stage_size
+                stage_scores = await asyncio.to_thread(
+                    self._score_pairs,
+                    pairs[stage_start:stage_end],
+                    lengths[stage_start:stage_end]
+                )
+                scores.extend(stage_scores)
+
+                if (
+                    early_stop
+                    and stage_end < len(pairs)
+                    and self._is_settled(scores, stage_scores, top_k)
+                ):
+                    logger.debug(
+                        f"Cascade rerank stopped early: {len(scores)}/{len(pairs)} scored"
+                    )
+                    break
+
+            self._record_latency(time.perf_counter() - start, len(scores))
+
+            logger.debug(
+                f"Reranked {len(scores)} pairs in {len(self.last_batch_stats)} batches, "
+                f"seq_lens={[b['seq_len'] for b in self.last_batch_stats]}, "
+                f"tokens={sum(b['tokens'] for b in self.last_batch_stats)}"
+            )
 
             # 归一化分数到 0-1
-            import torch
-            if isinstance(scores, torch.Tensor):
-                scores = scores.numpy()
-
-            min_score = scores.min()
-            max_score = scores.max()
-            if max_score > min_score:
-                normalized = (scores - min_score) / (max_score - min_score)
-            else:
-                normalized = scores * 0.5
-
-            # 构建结果
-            reranked = []
-            for i, result in enumerate(results):
-                reranked.append(RerankedResult(
-                    result=result,
-                    rerank_score=float(normalized[i])
-                ))
-
-            # 按分数降序排序
-            reranked.sort(key=lambda x: x.rerank_score, reverse=True)
+            normalized = self._normalize(scores)
 
-            return reranked[:top_k]
+            # 构建结果 (未评分的尾部候选直接丢弃)
+            return self._apply_scores(results[:len(scores)], normalized, top_k)
 
         except Exception as e:
             logger.error(f"Local reranking error: {e}")
             # 返回原始结果
-            return [
-                RerankedResult(result=r, rerank_score=r.score)
-                for r in results[:top_k]
-            ]
+            return self._keep_order(results[:top_k])
+
+    def _score_pairs(self, pairs: List[List[str]], lengths: List[int]) -> List[float]:
+        """按长度分桶批量推理，每批只填充到桶内最长序列"""
+        scores = [0.0] * len(pairs)
+
+        for bucket in self._length_buckets(lengths):
+            batch_pairs = [pairs[i] for i in bucket]
+            batch_scores = self.model.predict(
+                batch_pairs,
+                batch_size=len(batch_pairs),
+                show_progress_bar=False
+            )
+            for i, score in zip(bucket, batch_scores):
+                scores[i] = float(score)
+
+            self.last_batch_stats.append({
+                "size": len(bucket),
+                "seq_len": max(lengths[i] for i in bucket),
+                "tokens": sum(lengths[i] for i in bucket),
+            })
+
+        return scores
+
+    def _is_settled(
+        self,
+        scores: List[float],
+        stage_scores: List[float],
+        top_k: int
+    ) -> bool:
+        """前 top_k 是否已与最新阶段的候选明显拉开"""
+        if len(scores) <= top_k or not stage_scores:
+            return False
+
+        kth_score = sorted(scores, reverse=True)[top_k - 1]
+        return kth_score - max(stage_scores) >= self.early_stop_margin
+
+    def _record_latency(self, elapsed_s: float, n_candidates: int):
+        """更新每个候选的平均耗时"""
+        if n_candidates <= 0:
+            return
+
+        sample = elapsed_s * 1000 / n_candidates
+        if self.ms_per_candidate is None:
+            self.ms_per_candidate = sample
+        else:
+            self.ms_per_candidate = 0.8 * self.ms_per_candidate + 0.2 * sample
+
+    def candidate_budget(
+        self,
+        latency_ms: float,
+        min_candidates: int,
+        max_candidates: int
+    ) -> int:
+        """
+        根据延迟目标估算可送入重排序的候选数
+
+        尚无耗时数据时使用上限，之后按实测吞吐收缩到 [min, max]。
+        """
+        if not self.ms_per_candidate:
+            return max_candidates
+
+        budget = int(latency_ms / self.ms_per_candidate)
+        return max(min_candidates, min(budget, max_candidates))
+
+    def _prepare_pairs(
+        self,
+        query: str,
+        results: List[Candidate]
+    ) -> Tuple[List[List[str]], List[int]]:
+        """
+        构建 [query, document] 对，按 token 截断文档
+
+        文档只保留能放进 max_length 的部分 (扣除查询和特殊 token)，
+        避免 PDF 长块在分词后被整体填充。
+
+        Returns:
+            (截断后的输入对, 每对的 token 长度)
+        """
+        contents = [result.content for result in results]
+        tokenizer = getattr(self.model, "tokenizer", None)
+
+        if tokenizer is None:
+            # 没有分词器时按字符粗略截断
+            pairs = [[query, c[:self.max_length]] for c in contents]
+            lengths = [min(len(query) + len(p[1]), self.max_length) for p in pairs]
+            return pairs, lengths
+
+        # [CLS] query [SEP] document [SEP]
+        special_tokens = tokenizer.num_special_tokens_to_add(pair=True)
+        query_tokens = len(tokenizer.tokenize(query))
+        doc_budget = max(self.max_length - query_tokens - special_tokens, 1)
+
+        encoded = tokenizer(
+            contents,
+            add_special_tokens=False,
+            truncation=True,
+            max_length=doc_budget,
+            return_offsets_mapping=tokenizer.is_fast
+        )
+
+        pairs = []
+        lengths = []
+        for i, content in enumerate(contents):
+            token_ids = encoded["input_ids"][i]
+
+            if not token_ids:
+                text = ""
+            elif tokenizer.is_fast:
+                # 用偏移量切原文，保留原始字符 (不引入分词空格)
+                text = content[:encoded["offset_mapping"][i][-1][1]]
+            else:
+                text = tokenizer.decode(token_ids, skip_special_tokens=True)
+
+            pairs.append([query, text])
+            lengths.append(min(query_tokens + len(token_ids) + special_tokens, self.max_length))
+
+        return pairs, lengths
+
+    def _length_buckets(self, lengths: List[int]) -> List[List[int]]:
+        """按 token 长度排序后切分为批次 (返回原始下标)"""
+        order = sorted(range(len(lengths)), key=lambda i: lengths[i])
+        return [
+            order[i:i + self.batch_size]
+            for i in range(0, len(order), self.batch_size)
+        ]
+
+    def _apply_scores(
+        self,
+        results: List[Candidate],
+        scores: List[float],
+        top_k: int
+    ) -> List[Candidate]:
+        """写入重排序分数并按其降序截取 top_k"""
+        for result, score in zip(results, scores):
+            result.rerank_score = score
+
+        # 按分数降序排序
+        reranked = sorted(results, key=lambda x: x.rerank_score, reverse=True)
+        return reranked[:top_k]
+
+    def _keep_order(self, results: List[Candidate]) -> List[Candidate]:
+        """保持原顺序，以一阶段分数作为重排序分数"""
+        for result in results:
+            result.rerank_score = result.score
+        return list(results)
+
+    def _normalize(self, scores: List[float]) -> List[float]:
+        """Min-Max 归一化到 0-1"""
+        if not scores:
+            return []
+
+        min_score = min(scores)
+        max_score = max(scores)
+        if max_score > min_score:
+            return [(s - min_score) / (max_score - min_score) for s in scores]
+        return [0.5 for _ in scores]
 
     async def _rerank_openai(
         self,
         query: str,
-        results: List[SearchResult],
+        results: List[Candidate],
         top_k: int
-    ) -> List[RerankedResult]:
-        """使用 OpenAI 重排序"""
+    ) -> List[Candidate]:
+        """
+        使用 OpenAI 重排序
+
+        候选按 reranker_chunk_size 切分后并行评分，合并后统一归一化，
+        整体耗时接近单次调用的往返延迟。
+        """
         try:
-            from openai import AsyncOpenAI
+            start = time.perf_counter()
 
-            client = AsyncOpenAI(api_key=self.settings.reranker_api_key)
+            client = self._get_openai_client()
+            chunk_size = max(self.settings.reranker_chunk_size, 1)
+            chunks = [
+                results[i:i + chunk_size]
+                for i in range(0, len(results), chunk_size)
+            ]
 
-            # 构建 prompt
-            system_prompt = """你是一个专业的命理知识检索系统。
-给定用户查询和参考文档，你需要评估每个文档与查询的相关程度。
-请用0-1之间的分数表示相关性，1表示完全相关，0表示完全不相关。
-只返回JSON数组格式，不要其他文字。
+            chunk_scores = await asyncio.gather(*[
+                self._score_openai_chunk(client, query, chunk)
+                for chunk in chunks
+            ])
 
-格式示例:
-[
-  {"index": 0, "score": 0.95},
-  {"index": 1, "score": 0.30}
-]
-"""
+            # 合并各分块分数 (失败的分块记为 None)
+            raw_scores: List[Optional[float]] = []
+            for scores in chunk_scores:
+                raw_scores.extend(scores)
 
-            documents_text = "\n\n".join([
-                f"[{i}] {result.content[:500]}"
-                for i, result in enumerate(results)
+            if all(score is None for score in raw_scores):
+                raise ValueError("all scoring chunks failed")
+
+            # 各分块独立打分，统一归一化后才可比较；失败项排在最后
+            normalized = self._normalize([
+                score if score is not None else 0.0
+                for score in raw_scores
             ])
 
+            reranked = self._apply_scores(results, normalized, top_k)
+
+            self._record_latency(time.perf_counter() - start, len(results))
+
+            logger.debug(
+                f"OpenAI reranked {len(results)} documents in {len(chunks)} parallel calls"
+            )
+
+            return reranked
+
+        except Exception as e:
+            logger.error(f"OpenAI reranking error: {e}")
+            return self._keep_order(results[:top_k])
+
+    async def _score_openai_chunk(
+        self,
+        client,
+        query: str,
+        chunk: List[Candidate]
+    ) -> List[Optional[float]]:
+        """对一个分块的文档评分，返回与分块顺序一致的分数"""
+        documents_text = "\n\n".join([
+            f"[{i}] {result.content[:500]}"
+            for i, result in enumerate(chunk)
+        ])
+
+        try:
             response = await client.chat.completions.create(
-                model="gpt-3.5-turbo",  # 使用轻量模型
+                model=self.settings.reranker_openai_model,
                 messages=[
-                    {"role": "system", "content": system_prompt},
+                    {"role": "system", "content": OPENAI_RERANK_PROMPT},
                     {"role": "user", "content": f"查询: {query}\n\n文档:\n{documents_text}"}
                 ],
                 temperature=0,
-                max_tokens=500
+                # 每个文档约 20 token 的 JSON 输出
+                max_tokens=32 * len(chunk) + 64
             )
 
             # 解析结果
-            import json
             content = response.choices[0].message.content
             # 清理可能的 markdown 代码块
             content = content.strip()
@@ -177,28 +420,51 @@ class RerankerService:
                 content = content[4:].strip()
 
             scores_data = json.loads(content)
+            score_map = {
+                int(item["index"]): float(item["score"])
+                for item in scores_data
+            }
 
-            # 构建结果
-            score_map = {item["index"]: item["score"] for item in scores_data}
+            return [score_map.get(i) for i in range(len(chunk))]
 
-            reranked = []
-            for i, result in enumerate(results):
-                reranked.append(RerankedResult(
-                    result=result,
-                    rerank_score=score_map.get(i, result.score)
-                ))
+        except Exception as e:
+            logger.warning(f"OpenAI rerank chunk failed ({len(chunk)} documents): {e}")
+            return [None] * len(chunk)
 
-            # 排序
-            reranked.sort(key=lambda x: x.rerank_score, reverse=True)
+    def _get_openai_client(self):
+        """获取长连接复用的 OpenAI 客户端"""
+        if self._openai_client is None:
+            import httpx
+            from openai import AsyncOpenAI
 
-            return reranked[:top_k]
+            limits = httpx.Limits(
+                max_connections=self.settings.reranker_max_connections,
+                max_keepalive_connections=self.settings.reranker_max_connections,
+            )
+            self._openai_client = AsyncOpenAI(
+                api_key=self.settings.reranker_api_key,
+                http_client=httpx.AsyncClient(limits=limits, timeout=30.0),
+            )
 
-        except Exception as e:
-            logger.error(f"OpenAI reranking error: {e}")
-            return [
-                RerankedResult(result=r, rerank_score=r.score)
-                for r in results[:top_k]
-            ]
+        return self._openai_client
+
+    def warmup(self):
+        """加载本地模型并执行一次空推理 (触发权重加载和算子初始化)"""
+        if not self.use_local:
+            return
+
+        self._load_local_model()
+        if self.model is None:
+            raise RuntimeError(f"Local reranker model {self.model_name} failed to load")
+
+        self.model.predict([["紫微", "紫微星"]], show_progress_bar=False)
+        logger.info("Reranker warmed up")
+
+    async def close(self):
+        """关闭连接池"""
+        if self._openai_client is not None:
+            await self._openai_client.close()
+            self._openai_client = None
 
 
 # 单例实例
@@ -0,0 +1,308 @@
+"""
+检索结果缓存
+以规范化后的请求为键缓存检索结果，并用单调递增的索引版本号失效:
+索引写入或删除时递增版本号，旧版本的缓存条目自动作废。
+
+两级存储:
+1. 进程内 LRU
+2. 可选的 SQLite 共享层 (多 worker 共享结果和版本号)，按条数上限和 TTL 定期清理
+
+版本号保存在内存中，本进程递增时立即生效，其它 worker 的递增按短间隔从共享层刷新。
+"""
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+from loguru import logger
+
+from ..config import get_settings
+from ..models.schemas import SearchResult
+
+
+class ResultCache:
+    """检索结果缓存"""
+
+    # 每写入多少条共享层结果清理一次过期和超量条目
+    PRUNE_INTERVAL = 64
+
+    def __init__(self, max_size: int = None, db_path: str = None):
+        """
+        Args:
+            max_size: 进程内 LRU 容量，0 表示关闭缓存
+            db_path: SQLite 共享层路径，空表示仅使用进程内缓存
+        """
+        settings = get_settings()
+        self.max_size = settings.result_cache_size if max_size is None else max_size
+        self.db_path = settings.result_cache_db_path if db_path is None else db_path
+        self.shared_size = settings.result_cache_shared_size
+        self.ttl_s = settings.result_cache_ttl_s
+        self.version_ttl_s = settings.result_cache_version_ttl_s
+        self._shared_puts = 0
+
+        # {key: (version, results)}
+        self._lru: "OrderedDict[str, Tuple[int, List[SearchResult]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = 0
+        # 上次从共享层读取版本号的时间 (monotonic)
+        self._version_checked = float("-inf")
+
+        self._conn: Optional[sqlite3.Connection] = None
+        if self.enabled and self.db_path:
+            self._open_db()
+
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    def _open_db(self):
+        """打开 SQLite 共享层"""
+        try:
+            self._conn = sqlite3.connect(
+                self.db_path, timeout=5, check_same_thread=False
+            )
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS meta (
+                    name TEXT PRIMARY KEY,
+                    value INTEGER NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS results (
+                    key TEXT PRIMARY KEY,
+                    version INTEGER NOT NULL,
+                    payload TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_results_created ON results (created_at);
+                INSERT OR IGNORE INTO meta (name, value) VALUES ('index_version', 0);
+                """
+            )
+            self._conn.commit()
+            logger.info(f"Result cache shared tier: {self.db_path}")
+        except sqlite3.Error as e:
+            logger.warning(f"Result cache shared tier disabled: {e}")
+            self._conn = None
+
+    @staticmethod
+    def make_key(
+        query: str,
+        strategy: Any,
+        destiny_types: List[str],
+        categories: Optional[List[str]],
+        top_k: int,
+        entities: Optional[List[str]] = None,
+        fusion: Any = None
+    ) -> str:
+        """规范化请求并生成缓存键"""
+        normalized = {
+            "query": " ".join(query.split()).lower(),
+            "strategy": getattr(strategy, "value", strategy),
+            "destiny_types": sorted(set(destiny_types or [])),
+            "categories": sorted(set(categories)) if categories else None,
+            "top_k": top_k,
+            "entities": sorted(set(entities)) if entities else None,
+            "fusion": getattr(fusion, "value", fusion),
+        }
+        raw = json.dumps(normalized, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    @property
+    def index_version(self) -> int:
+        """
+        当前索引版本号 (内存读取)
+
+        启用共享层时每隔 version_ttl_s 从 SQLite 刷新一次，其它 worker 的递增在该间隔内生效。
+        """
+        if (
+            self._conn is not None
+            and time.monotonic() - self._version_checked >= self.version_ttl_s
+        ):
+            self._refresh_version()
+        return self._version
+
+    def _refresh_version(self):
+        """从共享层读取版本号"""
+        try:
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT value FROM meta WHERE name = 'index_version'"
+                ).fetchone()
+                if row:
+                    self._version = row[0]
+                self._version_checked = time.monotonic()
+        except sqlite3.Error as e:
+            logger.warning(f"Failed to read index version: {e}")
+
+    def bump_version(self) -> int:
+        """
+        递增索引版本号，使已有缓存失效
+
+        共享层中旧版本的结果不再命中，由定期清理删除。
+        """
+        with self._lock:
+            self._version += 1
+            self._lru.clear()
+            if self._conn is not None:
+                try:
+                    self._conn.execute(
+                        "UPDATE meta SET value = value + 1 WHERE name = 'index_version'"
+                    )
+                    row = self._conn.execute(
+                        "SELECT value FROM meta WHERE name = 'index_version'"
+                    ).fetchone()
+                    self._conn.commit()
+                    self._version = row[0]
+                    self._version_checked = time.monotonic()
+                except sqlite3.Error as e:
+                    logger.warning(f"Failed to bump shared index version: {e}")
+
+        logger.debug("Index version bumped, result cache invalidated")
+        return self._version
+
+    def get(self, key: str) -> Optional[List[SearchResult]]:
+        """读取缓存，版本不一致视为未命中"""
+        if not self.enabled:
+            return None
+
+        version = self.index_version
+
+        with self._lock:
+            entry = self._lru.get(key)
+            if entry is not None:
+                if entry[0] == version:
+                    self._lru.move_to_end(key)
+                    self.hits += 1
+                    return list(entry[1])
+                del self._lru[key]
+
+        results = self._get_shared(key, version)
+        with self._lock:
+            if results is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._put_local(key, version, results)
+        return list(results)
+
+    def put(self, key: str, results: List[SearchResult], version: Optional[int] = None):
+        """
+        写入缓存
+
+        Args:
+            key: 缓存键
+            results: 检索结果
+            version: 检索开始时的索引版本 (检索期间版本变化则不写入)
+        """
+        if not self.enabled:
+            return
+
+        current = self.index_version
+        if version is not None and version != current:
+            return
+
+        with self._lock:
+            self._put_local(key, current, list(results))
+            if self._conn is not None:
+                try:
+                    payload = json.dumps(
+                        [r.model_dump() for r in results], ensure_ascii=False
+                    )
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO results (key, version, payload, created_at) "
+                        "VALUES (?, ?, ?, ?)",
+                        (key, current, payload, time.time())
+                    )
+                    self._shared_puts += 1
+                    if self._shared_puts % self.PRUNE_INTERVAL == 0:
+                        self._prune_shared(current)
+                    self._conn.commit()
+                except sqlite3.Error as e:
+                    logger.warning(f"Failed to write shared result cache: {e}")
+
+    def _prune_shared(self, version: int):
+        """删除共享层中旧版本、过期和超出条数上限的结果 (调用方持有锁)"""
+        self._conn.execute("DELETE FROM results WHERE version != ?", (version,))
+        if self.ttl_s > 0:
+            self._conn.execute(
+                "DELETE FROM results WHERE created_at < ?", (time.time() - self.ttl_s,)
+            )
+        self._conn.execute(
+            "DELETE FROM results WHERE key IN ("
+            "SELECT key FROM results ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+            (self.shared_size,)
+        )
+
+    def _put_local(self, key: str, version: int, results: List[SearchResult]):
+        """写入进程内 LRU (调用方持有锁)"""
+        self._lru[key] = (version, results)
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_size:
+            self._lru.popitem(last=False)
+
+    def _get_shared(self, key: str, version: int) -> Optional[List[SearchResult]]:
+        """从 SQLite 共享层读取"""
+        if self._conn is None:
+            return None
+
+        min_created = time.time() - self.ttl_s if self.ttl_s > 0 else 0.0
+        try:
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT payload FROM results WHERE key = ? AND version = ? AND created_at >= ?",
+                    (key, version, min_created)
+                ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"Failed to read shared result cache: {e}")
+            return None
+
+        if row is None:
+            return None
+        return [SearchResult(**item) for item in json.loads(row[0])]
+
+    def clear(self):
+        """清空缓存 (不改变版本号)"""
+        with self._lock:
+            self._lru.clear()
+            if self._conn is not None:
+                try:
+                    self._conn.execute("DELETE FROM results")
+                    self._conn.commit()
+                except sqlite3.Error as e:
+                    logger.warning(f"Failed to clear shared result cache: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """缓存统计"""
+        total = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "shared": self._conn is not None,
+            "size": len(self._lru),
+            "max_size": self.max_size,
+            "index_version": self.index_version,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+# 单例实例
+_result_cache: ResultCache | None = None
+
+
+def get_result_cache() -> ResultCache:
+    """获取检索结果缓存单例"""
+    global _result_cache
+    if _result_cache is None:
+        _result_cache = ResultCache()
+    return _result_cache
+
+
+def bump_index_version() -> int:
+    """索引变更时调用: 递增版本号并失效检索缓存"""
+    return get_result_cache().bump_version()
@@ -6,8 +6,9 @@ import re
 from typing import Tuple, List, Dict, Optional
 from loguru import logger
 
-from ..config import get_settings
+from ..config import get_settings, ENTITY_KEYWORDS
 from ..models.enums import QueryType, RetrievalStrategy
+from .entity_matcher import get_entity_matcher, ROUTER_ENTITY_TYPES
 
 
 class QueryRouter:
@@ -66,48 +67,11 @@ class QueryRouter:
 
         # 命理实体关键词
         self.entity_keywords = self._load_entity_keywords()
+        self.entity_matcher = get_entity_matcher()
 
     def _load_entity_keywords(self) -> Dict[str, List[str]]:
         """加载命理实体关键词"""
-        return {
-            # 紫微斗数
-            "ziwei_stars": [
-                "紫微", "天机", "太阳", "武曲", "天同", "廉贞",
-                "天府", "太阴", "贪狼", "巨门", "天相", "天梁",
-                "七杀", "破军", "文昌", "文曲", "左辅", "右弼",
-                "天魁", "天钺", "禄存", "天马", "火星", "铃星"
-            ],
-            "ziwei_palaces": [
-                "命宫", "兄弟宫", "夫妻宫", "子女宫", "财帛宫",
-                "疾厄宫", "迁移宫", "仆役宫", "官禄宫", "田宅宫",
-                "福德宫", "父母宫"
-            ],
-            "ziwei_transformations": [
-                "化禄", "化权", "化科", "化忌"
-            ],
-            # 八字
-            "bazi_elements": [
-                "日主", "用神", "喜神", "忌神", "闲神",
-                "正官", "七杀", "正财", "偏财", "正印", "偏印",
-                "比肩", "劫财", "食神", "伤官"
-            ],
-            "bazi_concepts": [
-                "身强", "身弱", "从格", "化格", "调候", "通关"
-            ],
-            # 共通概念
-            "shared_concepts": [
-                "五行", "金", "木", "水", "火", "土",
-                "天干", "地支", "阴阳", "干支", "六合", "三合",
-                "大运", "流年", "太岁", "岁运"
-            ],
-            # 奇门
-            "qimen_elements": [
-                "九星", "八门", "八神", "值符", "值使",
-                "天蓬", "天任", "天冲", "天辅", "天英", "天芮",
-                "天柱", "天心", "开门", "休门", "生门", "伤门",
-                "杜门", "景门", "死门", "惊门"
-            ],
-        }
+        return ENTITY_KEYWORDS
 
     def classify(self, query: str) -> Tuple[QueryType, bool, List[str]]:
         """
@@ -160,26 +124,8 @@ class QueryRouter:
         return False
 
     def _extract_entities(self, query: str) -> List[str]:
-        """提取命理实体"""
-        entities = []
-
-        # 合并所有实体关键词
-        all_keywords = []
-        for keyword_list in self.entity_keywords.values():
-            all_keywords.extend(keyword_list)
-
-        # 精确匹配
-        for entity in all_keywords:
-            if entity in query:
-                entities.append(entity)
-
-        # 去重并保持顺序
-        unique_entities = []
-        seen = set()
-        for entity in entities:
-            if entity not in seen:
-                unique_entities.append(entity)
-                seen.add(entity)
+        """提取命理实体 (自动机单次扫描，最长匹配，去重并保持顺序)"""
+        unique_entities = self.entity_matcher.extract(query, types=ROUTER_ENTITY_TYPES)
 
         # 判断复杂度 - 多实体
         if len(unique_entities) > self.settings.complex_entity_threshold:
@@ -202,8 +148,9 @@ class QueryRouter:
         types = []
 
         for entity in entities:
-            for category, keywords in self.entity_keywords.items():
-                if entity in keywords:
+            # 取词表中第一个所属分类
+            for category in self.entity_matcher.entity_types(entity):
+                if category in self.entity_keywords:
                     types.append(category)
                     break
 
@@ -0,0 +1,190 @@
+"""
+语义回答缓存
+对问题向量做最近邻查找，相似度超过阈值时直接返回历史 RAGResponse，
+跳过检索和 LLM 生成。按 (destiny_type, category) 分区，支持 TTL 和索引版本失效。
+"""
+import time
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from ..config import get_settings
+from ..models.schemas import RAGResponse
+from .result_cache import get_result_cache
+
+
+# 分区键: (destiny_type, category)
+PartitionKey = Tuple[str, str]
+
+
+class _Partition:
+    """单个分区: 归一化问题向量矩阵 + 对应条目"""
+
+    __slots__ = ("vectors", "entries")
+
+    def __init__(self, dimension: int):
+        self.vectors = np.empty((0, dimension), dtype=np.float32)
+        # [(query, response, created_at, index_version)]
+        self.entries: List[Tuple[str, RAGResponse, float, int]] = []
+
+    def remove(self, positions: List[int]):
+        keep = np.ones(len(self.entries), dtype=bool)
+        keep[positions] = False
+        self.vectors = self.vectors[keep]
+        self.entries = [e for e, k in zip(self.entries, keep) if k]
+
+
+class SemanticCache:
+    """语义回答缓存"""
+
+    def __init__(
+        self,
+        threshold: float = None,
+        ttl_seconds: int = None,
+        max_entries: int = None
+    ):
+        settings = get_settings()
+        self.enabled = settings.semantic_cache_enabled
+        self.threshold = settings.semantic_cache_threshold if threshold is None else threshold
+        self.ttl_seconds = settings.semantic_cache_ttl_s if ttl_seconds is None else ttl_seconds
+        self.max_entries = settings.semantic_cache_max_entries if max_entries is None else max_entries
+
+        self.index_cache = get_result_cache()
+        self._partitions: Dict[PartitionKey, _Partition] = {}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _normalize(embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    @staticmethod
+    def _partition_key(destiny_type: str, category: Optional[str]) -> PartitionKey:
+        return (destiny_type, category or "")
+
+    def lookup(
+        self,
+        embedding: List[float],
+        destiny_type: str,
+        category: Optional[str] = None
+    ) -> Optional[Tuple[str, float, RAGResponse]]:
+        """
+        查找语义相近的历史回答
+
+        Returns:
+            (命中的原问题, 相似度, 回答)，未命中返回 None
+        """
+        if not self.enabled:
+            return None
+
+        vector = self._normalize(embedding)
+        version = self.index_cache.index_version
+        now = time.time()
+
+        with self._lock:
+            partition = self._partitions.get(self._partition_key(destiny_type, category))
+            if partition is None or not partition.entries:
+                self.misses += 1
+                return None
+
+            # 清理过期或索引版本已变化的条目
+            stale = [
+                i for i, (_, _, created_at, entry_version) in enumerate(partition.entries)
+                if entry_version != version or now - created_at > self.ttl_seconds
+            ]
+            if stale:
+                partition.remove(stale)
+                if not partition.entries:
+                    self.misses += 1
+                    return None
+
+            if partition.vectors.shape[1] != vector.shape[0]:
+                self.misses += 1
+                return None
+
+            similarities = partition.vectors @ vector
+            best = int(np.argmax(similarities))
+            similarity = float(similarities[best])
+
+            if similarity < self.threshold:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            query, response, _, _ = partition.entries[best]
+            return query, similarity, response
+
+    def store(
+        self,
+        query: str,
+        embedding: List[float],
+        destiny_type: str,
+        category: Optional[str],
+        response: RAGResponse,
+        version: Optional[int] = None
+    ):
+        """
+        写入缓存
+
+        Args:
+            version: 检索开始时的索引版本 (期间索引发生变化则不写入)
+        """
+        if not self.enabled:
+            return
+
+        current = self.index_cache.index_version
+        if version is not None and version != current:
+            return
+
+        vector = self._normalize(embedding)
+        key = self._partition_key(destiny_type, category)
+
+        with self._lock:
+            partition = self._partitions.get(key)
+            if partition is None or partition.vectors.shape[1] != vector.shape[0]:
+                partition = _Partition(vector.shape[0])
+                self._partitions[key] = partition
+
+            # 超出容量时淘汰最早的条目
+            overflow = len(partition.entries) + 1 - self.max_entries
+            if overflow > 0:
+                partition.remove(list(range(overflow)))
+
+            partition.vectors = np.vstack([partition.vectors, vector[None, :]])
+            partition.entries.append((query, response, time.time(), current))
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._partitions.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """缓存统计"""
+        total = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "threshold": self.threshold,
+            "ttl_seconds": self.ttl_seconds,
+            "entries": sum(len(p.entries) for p in self._partitions.values()),
+            "partitions": len(self._partitions),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+# 单例实例
+_semantic_cache: SemanticCache | None = None
+
+
+def get_semantic_cache() -> SemanticCache:
+    """获取语义回答缓存单例"""
+    global _semantic_cache
+    if _semantic_cache is None:
+        _semantic_cache = SemanticCache()
+    return _semantic_cache
@@ -6,11 +6,14 @@ from typing import List, Optional
 from loguru import logger
 
 from ..config import get_settings
-from ..models.enums import RetrievalStrategy
+from ..models.enums import RetrievalStrategy, FusionMode
 from ..models.schemas import SearchResult
+from ..models.candidate import Candidate, to_search_results
 from ..services.hybrid_retriever import get_hybrid_retriever
 from ..services.graphrag_retriever import get_graphrag_retriever
 from ..services.cross_type_retriever import get_cross_type_retriever
+from ..services.deadline import Deadline
+from ..services.result_cache import get_result_cache
 
 
 class UnifiedRetriever:
@@ -21,6 +24,7 @@ class UnifiedRetriever:
         self.hybrid = get_hybrid_retriever()
         self.graphrag = get_graphrag_retriever()
         self.cross_type = get_cross_type_retriever()
+        self.cache = get_result_cache()
 
     async def search(
         self,
@@ -29,7 +33,9 @@ class UnifiedRetriever:
         destiny_types: List[str],
         categories: Optional[List[str]] = None,
         top_k: int = 10,
-        entities: Optional[List[str]] = None
+        entities: Optional[List[str]] = None,
+        fusion: Optional[FusionMode] = None,
+        deadline: Optional[Deadline] = None
     ) -> List[SearchResult]:
         """
         统一检索接口
@@ -41,77 +47,138 @@ class UnifiedRetriever:
             categories: 子分类列表
             top_k: 返回数量
             entities: 涉及实体
+            fusion: 融合方式 (None 使用配置默认值)
+            deadline: 请求截止时间 (超时分支记录在 deadline.dropped_sources)
 
         Returns:
             检索结果列表
         """
+        cache_key = self.cache.make_key(
+            query, strategy, destiny_types, categories, top_k, entities, fusion
+        )
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            logger.debug("Result cache hit")
+            return cached
+
+        version = self.cache.index_version
+        deadline = deadline or Deadline()
+        candidates = await self.search_candidates(
+            query=query,
+            strategy=strategy,
+            destiny_types=destiny_types,
+            categories=categories,
+            top_k=top_k,
+            entities=entities,
+            fusion=fusion,
+            deadline=deadline
+        )
+        results = to_search_results(candidates)
+
+        # 部分结果 (有分支超时被丢弃) 不写入缓存
+        if not deadline.partial:
+            self.cache.put(cache_key, results, version=version)
+
+        return results
+
+    async def search_candidates(
+        self,
+        query: str,
+        strategy: RetrievalStrategy,
+        destiny_types: List[str],
+        categories: Optional[List[str]] = None,
+        top_k: int = 10,
+        entities: Optional[List[str]] = None,
+        fusion: Optional[FusionMode] = None,
+        deadline: Optional[Deadline] = None,
+        query_embedding: Optional[List[float]] = None
+    ) -> List[Candidate]:
+        """
+        统一检索 (内部候选结构，参数同 search)
+
+        query_embedding 为调用方预先计算的查询向量，混合和跨类型检索直接复用。
+        """
         logger.debug(f"Unified search with strategy: {strategy}")
 
         if strategy == RetrievalStrategy.HYBRID_VECTOR:
-            return await self.hybrid.search(
+            return await self.hybrid.search_candidates(
                 query=query,
                 destiny_types=destiny_types,
                 categories=categories,
-                top_k=top_k
+                top_k=top_k,
+                fusion=fusion,
+                deadline=deadline,
+                query_embedding=query_embedding
             )
 
         elif strategy == RetrievalStrategy.GRAPH_LOCAL:
-            return await self.graphrag.search(
+            return await self.graphrag.search_candidates(
                 query=query,
                 strategy=strategy,
                 destiny_types=destiny_types,
                 categories=categories,
                 top_k=top_k,
-                entities=entities
+                entities=entities,
+                deadline=deadline
             )
 
         elif strategy == RetrievalStrategy.GRAPH_GLOBAL:
-            return await self.graphrag.search(
+            return await self.graphrag.search_candidates(
                 query=query,
                 strategy=strategy,
                 destiny_types=destiny_types,
                 categories=categories,
                 top_k=top_k,
-                entities=entities
+                entities=entities,
+                deadline=deadline
             )
 
         elif strategy == RetrievalStrategy.CROSS_TYPE:
             # 使用当前类型作为主类型
             main_type = destiny_types[0] if destiny_types else "ziwei"
-            return await self.cross_type.search(
+            return await self.cross_type.search_candidates(
                 query=query,
                 current_type=main_type,
                 target_types=destiny_types,
-                top_k=top_k
+                top_k=top_k,
+                fusion=fusion,
+                deadline=deadline,
+                query_embedding=query_embedding
             )
 
         else:
             # 默认使用混合检索
             logger.warning(f"Unknown strategy: {strategy}, falling back to hybrid")
-            return await self.hybrid.search(
+            return await self.hybrid.search_candidates(
                 query=query,
                 destiny_types=destiny_types,
                 categories=categories,
-                top_k=top_k
+                top_k=top_k,
+                fusion=fusion,
+                deadline=deadline,
+                query_embedding=query_embedding
             )
 
     async def index(
         self,
         destiny_type: str,
         category: str,
-        documents: List[dict]
+        documents: List[dict],
+        wait_for_graph: bool = False
     ):
-        """索引文档"""
+        """索引文档 (图谱默认在后台构建)"""
         await self.hybrid.index_documents(
             destiny_type=destiny_type,
             category=category,
-            documents=documents
+            documents=documents,
+            wait_for_graph=wait_for_graph
         )
 
     def get_stats(self) -> dict:
         """获取检索统计"""
         return {
             "hybrid": self.hybrid.chroma.get_stats(),
+            "result_cache": self.cache.get_stats(),
         }
 
 
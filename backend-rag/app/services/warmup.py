@@ -0,0 +1,116 @@
+"""
+服务预热
+启动阶段加载重排序模型、打开 Chroma 集合、BM25 索引和图谱索引，
+预热完成前服务只报告存活 (liveness)，不报告就绪 (readiness)
+"""
+import time
+import asyncio
+from typing import Dict, Any, Optional
+from loguru import logger
+
+from ..config import DESTINY_TYPES
+from ..services.hybrid_retriever import get_hybrid_retriever
+from ..services.graphrag_retriever import COMMUNITY_CATEGORY
+
+
+# 就绪必需的预热阶段 (图谱加载失败时 GraphRAG 降级到向量检索，不影响就绪)
+REQUIRED_STAGES = ("chroma", "bm25", "reranker")
+
+
+class WarmupState:
+    """预热状态"""
+
+    def __init__(self):
+        self.ready = False
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        # {stage: {"ok": bool, "ms": int, "detail": Any}}
+        self.stages: Dict[str, Dict[str, Any]] = {}
+
+    def to_dict(self) -> Dict[str, Any]:
+        duration_ms = None
+        if self.started_at and self.finished_at:
+            duration_ms = int((self.finished_at - self.started_at) * 1000)
+
+        return {
+            "ready": self.ready,
+            "stages": self.stages,
+            "duration_ms": duration_ms,
+        }
+
+
+async def _run_stage(state: WarmupState, name: str, func, *args):
+    """在线程中执行一个预热阶段并记录结果"""
+    start = time.perf_counter()
+    try:
+        detail = await asyncio.to_thread(func, *args)
+        state.stages[name] = {
+            "ok": True,
+            "ms": int((time.perf_counter() - start) * 1000),
+            "detail": detail,
+        }
+    except Exception as e:
+        logger.error(f"Warm-up stage {name} failed: {e}")
+        state.stages[name] = {
+            "ok": False,
+            "ms": int((time.perf_counter() - start) * 1000),
+            "detail": str(e),
+        }
+
+
+async def warm_up_services() -> WarmupState:
+    """
+    预热检索服务
+
+    阶段:
+    1. 打开已存在的 Chroma 集合
+    2. 加载 BM25 索引
+    3. 加载 GraphRAG 图谱内存索引
+    4. 加载重排序模型并执行一次空推理
+
+    必需阶段全部成功才报告就绪。
+    """
+    state = get_warmup_state()
+    state.started_at = time.time()
+
+    # 单例在事件循环线程中创建，避免与请求并发初始化
+    hybrid = get_hybrid_retriever()
+    collections = {
+        dt: config["collections"]
+        for dt, config in DESTINY_TYPES.items()
+    }
+    # 向量集合额外包含 GraphRAG 社区摘要集合
+    vector_collections = {
+        dt: categories + [COMMUNITY_CATEGORY]
+        for dt, categories in collections.items()
+    }
+
+    await _run_stage(state, "chroma", hybrid.chroma.warmup, vector_collections)
+    await _run_stage(state, "bm25", hybrid.bm25.warmup, collections)
+    await _run_stage(state, "graph", hybrid.graphrag.graph_index.load)
+    await _run_stage(state, "reranker", hybrid.reranker.warmup)
+
+    state.finished_at = time.time()
+    failed = [
+        name for name in REQUIRED_STAGES
+        if not state.stages.get(name, {}).get("ok")
+    ]
+    state.ready = not failed
+
+    if failed:
+        logger.error(f"Warm-up failed, service not ready (failed stages: {failed}): {state.to_dict()}")
+    else:
+        logger.info(f"Warm-up finished: {state.to_dict()}")
+    return state
+
+
+# 单例实例
+_warmup_state: WarmupState | None = None
+
+
+def get_warmup_state() -> WarmupState:
+    """获取预热状态单例"""
+    global _warmup_state
+    if _warmup_state is None:
+        _warmup_state = WarmupState()
+    return _warmup_state
@@ -0,0 +1,114 @@
+"""
+候选结构微基准
+对比融合 → 合并 → 重排序三个环节中，每一跳重建 pydantic SearchResult
+与复用 __slots__ Candidate 的耗时和内存分配
+
+使用方法:
+    python scripts/bench_candidates.py                # 默认 2000 个候选
+    python scripts/bench_candidates.py --n 10000      # 指定候选数
+"""
+import sys
+import time
+import random
+import argparse
+import tracemalloc
+from pathlib import Path
+
+# 添加 backend-rag 到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.models.schemas import SearchResult
+from app.models.candidate import Candidate, to_search_results
+
+
+def make_hits(n: int):
+    """生成模拟的 (key, score) 检索命中"""
+    rng = random.Random(42)
+    categories = ["palace", "star", "transformation", "fortune", "pattern"]
+    return [
+        (("ziwei", rng.choice(categories), f"doc_{i}"), rng.random())
+        for i in range(n)
+    ]
+
+
+def run_pydantic(hits, content: str, top_k: int):
+    """旧路径: 每一跳都构建新的 SearchResult 和字符串键"""
+    # 融合
+    fused = {}
+    for (dt, cat, doc_id), score in hits:
+        key = f"{dt}:{cat}:{doc_id}"
+        fused[key] = SearchResult(
+            id=doc_id, content=content, score=score, title="",
+            destiny_type=dt, category=cat, source="hybrid"
+        )
+
+    # 合并 (调整权重)
+    merged = {}
+    for r in fused.values():
+        key = f"{r.destiny_type}:{r.category}:{r.id}"
+        merged[key] = SearchResult(
+            id=r.id, content=r.content, score=r.score * 0.8, title=r.title,
+            destiny_type=r.destiny_type, category=r.category, level=r.level,
+            source="cross_vector", distance=r.distance
+        )
+
+    # 重排序
+    results = sorted(merged.values(), key=lambda x: x.score, reverse=True)
+    return results[:top_k]
+
+
+def run_candidates(hits, content: str, top_k: int):
+    """新路径: 元组键 + Candidate 原地调整，仅在边界转换"""
+    # 融合
+    fused = {}
+    for key, score in hits:
+        dt, cat, doc_id = key
+        fused[key] = Candidate(dt, cat, doc_id, score, source="hybrid", content=content)
+
+    # 合并 (调整权重)
+    merged = {}
+    for c in fused.values():
+        c.score *= 0.8
+        c.source = "cross_vector"
+        merged[c.key] = c
+
+    # 重排序
+    results = sorted(merged.values(), key=lambda x: x.score, reverse=True)
+    return to_search_results(results[:top_k])
+
+
+def measure(func, *args, repeat: int = 5):
+    """返回 (平均耗时 ms, 峰值分配 KB)"""
+    elapsed = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        elapsed.append((time.perf_counter() - start) * 1000)
+
+    tracemalloc.start()
+    func(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return sum(elapsed) / len(elapsed), peak / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description="候选结构微基准")
+    parser.add_argument("--n", type=int, default=2000, help="候选数量")
+    parser.add_argument("--top-k", type=int, default=10, help="返回数量")
+    args = parser.parse_args()
+
+    hits = make_hits(args.n)
+    content = "紫微星为帝星，主尊贵。" * 50
+
+    print(f"候选数: {args.n}, top_k: {args.top_k}")
+    print("=" * 60)
+
+    for name, func in [("SearchResult", run_pydantic), ("Candidate", run_candidates)]:
+        ms, peak_kb = measure(func, hits, content, args.top_k)
+        print(f"{name:<14} 平均耗时: {ms:8.2f} ms   峰值分配: {peak_kb:10.1f} KB")
+
+
+if __name__ == "__main__":
+    main()
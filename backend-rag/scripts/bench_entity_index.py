@@ -0,0 +1,113 @@
+"""
+实体 -> 文档索引构建基准
+对比旧的 "逐实体扫描全部 doc_mapping + list 成员检查" 与
+GraphIndex 一次倒排 doc_mapping 到集合 (含增量合并和 SQLite 图谱存储写入) 的耗时
+
+使用方法:
+    python scripts/bench_entity_index.py                    # 默认 10000 个分块
+    python scripts/bench_entity_index.py --n 20000          # 指定分块数
+    python scripts/bench_entity_index.py --entities 5000    # 指定实体词表大小
+"""
+import sys
+import time
+import random
+import argparse
+import tempfile
+from pathlib import Path
+
+# 添加 backend-rag 到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.services.graph_index import GraphIndex
+from app.services.graph_store import GraphStore
+
+
+def make_doc_mapping(n: int, vocabulary: int, per_doc: int, offset: int = 0, seed: int = 42):
+    """生成模拟的 {doc_id: [entity_name]}"""
+    rng = random.Random(seed)
+    names = [f"实体{i}" for i in range(vocabulary)]
+    return {
+        f"doc_{offset + i}": rng.sample(names, per_doc)
+        for i in range(n)
+    }
+
+
+def entities_of(doc_mapping):
+    """去重后的实体列表 (与图谱构建时的 unique_entities 一致)"""
+    seen = {}
+    for names in doc_mapping.values():
+        for name in names:
+            seen.setdefault(name, {"name": name, "type": "其他"})
+    return list(seen.values())
+
+
+def run_nested(entity_index, entities, doc_mapping):
+    """旧路径: 每个实体扫描全部 doc_mapping，list 成员检查"""
+    for entity in entities:
+        entity_name = entity.get("name", "")
+        for doc_id, entity_names in doc_mapping.items():
+            if entity_name in entity_names:
+                if entity_name not in entity_index:
+                    entity_index[entity_name] = []
+                if doc_id not in entity_index[entity_name]:
+                    entity_index[entity_name].append(doc_id)
+
+
+def run_inverted(graph_index, entities, doc_mapping):
+    """新路径: 一次倒排 doc_mapping 到集合，合并到已有图谱"""
+    graph_index.merge_graph("ziwei", "star", entities, {}, doc_mapping)
+
+
+def timed(func, *args) -> float:
+    start = time.perf_counter()
+    func(*args)
+    return (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="实体索引构建基准")
+    parser.add_argument("--n", type=int, default=10000, help="初始分块数")
+    parser.add_argument("--increment", type=int, default=1000, help="增量上传的分块数")
+    parser.add_argument("--entities", type=int, default=2000, help="实体词表大小")
+    parser.add_argument("--per-doc", type=int, default=8, help="每个分块的实体数")
+    args = parser.parse_args()
+
+    initial = make_doc_mapping(args.n, args.entities, args.per_doc)
+    increment = make_doc_mapping(
+        args.increment, args.entities, args.per_doc, offset=args.n, seed=7
+    )
+
+    print(
+        f"分块数: {args.n} (+{args.increment}), "
+        f"实体词表: {args.entities}, 每块实体: {args.per_doc}"
+    )
+    print("=" * 60)
+
+    # 旧路径
+    entity_index = {}
+    nested_initial = timed(run_nested, entity_index, entities_of(initial), initial)
+    nested_increment = timed(run_nested, entity_index, entities_of(increment), increment)
+
+    # 新路径 (临时图谱存储，避免写入 data/graph)
+    with tempfile.TemporaryDirectory() as graph_dir:
+        store = GraphStore(str(Path(graph_dir) / "graph.db"))
+        graph_index = GraphIndex(store)
+        inverted_initial = timed(run_inverted, graph_index, entities_of(initial), initial)
+        inverted_increment = timed(run_inverted, graph_index, entities_of(increment), increment)
+
+        merged = {}
+        for doc_id, names in store.get_doc_mapping("ziwei", "star").items():
+            for name in names:
+                merged.setdefault(name, set()).add(doc_id)
+
+    # 结果一致性检查
+    assert {k: set(v) for k, v in entity_index.items()} == merged
+
+    print(f"{'':<10} {'初始构建':>12} {'增量合并':>12}")
+    print(f"{'嵌套扫描':<10} {nested_initial:10.1f} ms {nested_increment:10.1f} ms")
+    print(f"{'一次倒排':<10} {inverted_initial:10.1f} ms {inverted_increment:10.1f} ms")
+    print(f"加速比: {nested_initial / max(inverted_initial, 1e-6):.0f}x")
+
+
+if __name__ == "__main__":
+    main()
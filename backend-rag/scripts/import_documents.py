@@ -184,7 +184,8 @@ def import_single_file(
             category=category,
             title=title,
             level=level,
-            original_filename=file_path.name
+            original_filename=file_path.name,
+            wait_for_graph=True
         ))
 
         return {
@@ -682,7 +682,8 @@ def init_knowledge():
             asyncio.run(engine.retriever.index(
                 destiny_type=destiny_type,
                 category=category,
-                documents=documents
+                documents=documents,
+                wait_for_graph=True
             ))
 
             total_entries += len(documents)
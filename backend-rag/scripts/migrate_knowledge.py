@@ -86,7 +86,8 @@ def migrate_to_vector_db(knowledge_data, rebuild=False):
                 asyncio.run(engine.retriever.index(
                     destiny_type=destiny_type,
                     category=category,
-                    documents=documents
+                    documents=documents,
+                    wait_for_graph=True
                 ))
                 total += len(documents)
                 print(f"  ✓ {len(documents)} 条目")